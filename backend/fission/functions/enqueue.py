@@ -20,27 +20,175 @@ Fission Setup:
         --function enqueue
 """
 
+import sys
 import json
+import atexit
+import signal
 import asyncio
+import threading
+import concurrent.futures
+
+from types import FrameType
+from typing import Any, Coroutine, Optional
 
 from aiokafka import AIOKafkaProducer
 from flask import current_app, request
 
 
-async def publish(queue: str, payload: bytes) -> None:
-    """Publishes a payload to a specified Kafka queue.
+BOOTSTRAP_SERVERS = 'mycluster-kafka-bootstrap.kafka.svc:9092'
+# seconds to wait for kafka to acknowledge a message
+SEND_TIMEOUT = 60
+
+
+class ProducerLoop:
+    """
+    ProducerLoop keeps one started Kafka producer per pod, on an event loop running
+    in a background thread. Every invocation reuses its connections and metadata,
+    so enqueueing a message costs a single send instead of a bootstrap.
+    """
+    def __init__(self, bootstrap_servers: str) -> None:
+        """
+        Start the event loop thread and the producer.
+
+        Args:
+            bootstrap_servers (str): The Kafka bootstrap servers
+        """
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="kafka-producer", daemon=True)
+        self.thread.start()
+        try:
+            self.producer = self.run(self.start_producer(bootstrap_servers))
+        except Exception:
+            self.stop_loop()
+            raise
+        # flush and stop the producer when the pod shuts down
+        atexit.register(self.close)
+
+
+    @staticmethod
+    async def start_producer(bootstrap_servers: str) -> AIOKafkaProducer:
+        """
+        Create and start the producer, on the event loop it is used from.
+
+        Args:
+            bootstrap_servers (str): The Kafka bootstrap servers
+
+        Returns:
+            AIOKafkaProducer: The started producer
+        """
+        producer = AIOKafkaProducer(bootstrap_servers=bootstrap_servers)
+        await producer.start()
+        return producer
+
+
+    def run(self, coroutine: Coroutine, timeout: Optional[float] = None) -> Any:
+        """
+        Run a coroutine on the event loop and wait for its result.
+
+        Args:
+            coroutine (Coroutine): The coroutine
+            timeout (Optional[float]): Seconds to wait, no limit by default
+
+        Raises:
+            concurrent.futures.TimeoutError: when the coroutine did not finish in time, it is then cancelled
+
+        Returns:
+            Any: The result of the coroutine
+        """
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            # do not leave the send running on the loop once the invocation gave up on it
+            future.cancel()
+            raise
+
+
+    def publish(self, queue: str, payload: bytes) -> None:
+        """
+        Publish a payload to a Kafka topic and wait until it is acknowledged.
+
+        Args:
+            queue (str): The Kafka topic to publish to.
+            payload (bytes): The message payload to be sent.
+
+        Raises:
+            Exception: when the producer has been closed, e.g. the pod is terminating
+        """
+        if self.loop.is_closed():
+            raise Exception("Error: the Kafka producer is closed, the pod is shutting down!")
+        self.run(self.producer.send_and_wait(queue, payload), SEND_TIMEOUT)
+
+
+    def stop_loop(self) -> None:
+        """
+        Stop the event loop and its thread.
+        """
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+    def close(self) -> None:
+        """
+        Flush the messages still buffered by the producer, stop it and the event loop.
+        """
+        if self.loop.is_closed():
+            return
+        try:
+            self.run(self.producer.stop(), SEND_TIMEOUT)
+        finally:
+            self.stop_loop()
+
+
+# the producer of the pod, started by the first invocation
+producer_loop: Optional[ProducerLoop] = None
+# reentrant, the SIGTERM handler may interrupt the main thread while it holds the lock
+producer_lock = threading.RLock()
+
+
+def handle_sigterm(signum: int, frame: Optional[FrameType]) -> None:
+    """Closes the producer of the pod when it is terminated, then exits,
+    or hands over to the handler installed before this one.
+
+    Args:
+        signum (int): The signal number
+        frame (Optional[FrameType]): The frame interrupted by the signal
+    """
+    global producer_loop
+    with producer_lock:
+        if producer_loop is not None:
+            producer_loop.close()
+            producer_loop = None
+    if callable(previous_sigterm_handler):
+        previous_sigterm_handler(signum, frame)
+    elif previous_sigterm_handler != signal.SIG_IGN:
+        sys.exit(128 + signum)
+
+
+# atexit handlers do not run when the pod is terminated with SIGTERM
+try:
+    previous_sigterm_handler = signal.signal(signal.SIGTERM, handle_sigterm)
+except ValueError:
+    # signal handlers can only be installed from the main thread
+    previous_sigterm_handler = None
+
+
+def publish(queue: str, payload: bytes) -> None:
+    """Publishes a payload to a specified Kafka queue with the producer of the pod.
 
     Args:
         queue (str): The Kafka topic to publish to.
         payload (bytes): The message payload to be sent.
     """
-    
-    producer = AIOKafkaProducer(bootstrap_servers='mycluster-kafka-bootstrap.kafka.svc:9092')
-    await producer.start()
-    try:
-        await producer.send_and_wait(queue, payload)
-    finally:
-        await producer.stop()
+    global producer_loop
+    # a failed start is not kept, the next invocation tries again
+    with producer_lock:
+        if producer_loop is None:
+            producer_loop = ProducerLoop(BOOTSTRAP_SERVERS)
+        # the SIGTERM handler may reset the global once the lock is released
+        loop = producer_loop
+    loop.publish(queue, payload)
 
 def main() -> str:
     """
@@ -53,11 +201,9 @@ def main() -> str:
         str: Status message indicating success.
     """
     try:
-        asyncio.run (
-            publish (
-                request.headers.get('X-Fission-Params-Topic'),
-                json.dumps(request.get_json()).encode('utf-8')
-            )
+        publish (
+            request.headers.get('X-Fission-Params-Topic'),
+            json.dumps(request.get_json()).encode('utf-8')
         )
         current_app.logger.info(f"Enqueued to topic {request.headers.get('X-Fission-Params-Topic')}")
         return "success", 200
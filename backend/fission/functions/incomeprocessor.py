@@ -26,13 +26,184 @@ Fission Setup:
         --pollinginterval=5
 """
 
-from typing import Any
+from typing import Any, Callable, Dict, List, Optional
 from flask import Flask, request, jsonify, current_app
 
 
 
 app = Flask(__name__)
 
+
+# BEGIN GENERATED VALIDATOR from income_schema.json, run database/schema/generate_validators.py to update
+
+def convert(value: Any, to_type: Callable[..., Any], field: str, *args: Any, arrays: bool = True) -> Any:
+    """Converts a field value, or every value of an array, to the type of the mapping.
+
+    Args:
+        value (Any): The field value
+        to_type (Callable[..., Any]): The converter of the field type
+        field (str): The field path, for the error message
+        args (Any): Other arguments of the converter, e.g. the date format
+        arrays (bool): Convert every value of an array, instead of the array as a whole
+
+    Raises:
+        ValueError: when Elasticsearch would reject the value
+
+    Returns:
+        Any: The converted value
+    """
+    if value is None:
+        return None
+    try:
+        if arrays and isinstance(value, list):
+            return [to_type(item, *args) for item in value]
+        return to_type(value, *args)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field}: {value!r} does not fit the mapping") from None
+
+
+def to_keyword(value: Any) -> str:
+    """Converts a text or keyword value, numbers and booleans are turned into strings."""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return str(value).lower()
+    if isinstance(value, (int, float)):
+        return str(value)
+    raise TypeError
+
+
+def to_float(value: Any) -> float:
+    """Converts a float value, numeric strings are parsed and non-finite values rejected."""
+    if isinstance(value, bool):
+        raise TypeError
+    if isinstance(value, str):
+        value = float(value)
+    if not isinstance(value, (int, float)) or value != value or abs(value) == float("inf"):
+        raise ValueError
+    return value
+
+
+def to_integer(value: Any) -> int:
+    """Converts an integer value, floats and numeric strings are truncated."""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    return int(to_float(value))
+
+
+def to_boolean(value: Any) -> bool:
+    """Converts a boolean value, "true" and "false" are parsed."""
+    if isinstance(value, bool):
+        return value
+    if value in ("true", "false"):
+        return value == "true"
+    raise TypeError
+
+
+def to_date(value: Any, date_format: Any) -> Any:
+    """Checks a date value, a string or a number, against the compiled formats of the mapping."""
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise TypeError
+    if not date_format.fullmatch(str(value)):
+        raise ValueError
+    return value
+
+
+def to_geo_point(value: Any) -> Any:
+    """Checks a geo point, [lon, lat], {"lat": lat, "lon": lon} or a string."""
+    if isinstance(value, (list, tuple)) and len(value) == 2:
+        return [to_float(item) for item in value]
+    if isinstance(value, dict) and "lat" in value and "lon" in value:
+        return value
+    if isinstance(value, str):
+        return value
+    raise TypeError
+
+
+def to_geo_shape(value: Any) -> Any:
+    """Checks a geo shape, a geojson object or a wkt string."""
+    if isinstance(value, dict) and "type" in value:
+        return value
+    if isinstance(value, str):
+        return value
+    raise TypeError
+
+
+def to_object(value: Any, field: str) -> Dict[str, Any]:
+    """Checks an object value.
+
+    Args:
+        value (Any): The field value
+        field (str): The field path, for the error message
+
+    Raises:
+        ValueError: when the value is not an object
+
+    Returns:
+        Dict[str, Any]: The object
+    """
+    if not isinstance(value, dict):
+        raise ValueError(f"{field}: {value!r} is not an object")
+    return value
+
+def validate_source(source: Dict[str, Any], dropped: List[str]) -> Optional[str]:
+    """Checks the _source of a document against the mapping of income_schema.json,
+    repairing in place the values Elasticsearch would coerce and dropping the
+    fields a strict mapping would reject.
+
+    Args:
+        source (Dict[str, Any]): The _source of the document
+        dropped (List[str]): The paths of the dropped fields, appended to
+
+    Returns:
+        Optional[str]: Why Elasticsearch would reject the document, None when it can be indexed
+    """
+    try:
+        if 'med_tot_psnl_incom_weekly' in source:
+            source['med_tot_psnl_incom_weekly'] = convert(source['med_tot_psnl_incom_weekly'], to_float, 'med_tot_psnl_incom_weekly')
+        if 'sa4_code_2021' in source:
+            source['sa4_code_2021'] = convert(source['sa4_code_2021'], to_keyword, 'sa4_code_2021')
+    except ValueError as e:
+        return str(e)
+    return None
+# END GENERATED VALIDATOR
+
+
+def process_docs(docs: List[Dict], index_name: str) -> List[Dict]:
+    """Builds the bulk actions of addobservations from the income documents.
+
+    This is also imported by the uploader (database/uploader) to run the
+    same transform locally when backfilling straight into Elasticsearch.
+
+    Args:
+        docs (List[Dict]): The income documents
+        index_name (str): The Elasticsearch index of the actions
+
+    Returns:
+        List[Dict]: The bulk actions of the processed documents
+    """
+    processed = []
+    for doc in docs:
+        source = {
+            "med_tot_psnl_incom_weekly":doc[" med_tot_psnl_incom_weekly"],
+            "sa4_code_2021":doc["sa4_code_2021"],
+        }
+        # reject what Elasticsearch would reject before it goes through kafka
+        dropped = []
+        problem = validate_source(source, dropped)
+        if problem is not None:
+            app.logger.error(f"Rejected document {doc['sa4_code_2021']}: {problem}")
+            continue
+        if dropped:
+            app.logger.warning(f"Dropped fields of document {doc['sa4_code_2021']} missing from the mapping: {', '.join(dropped)}")
+        processed.append({
+            "_index": index_name,
+            "_id": doc["sa4_code_2021"],
+            "_source": source,
+        })
+    return processed
+
+
 @app.route('/', methods=['POST'])
 def main() -> Any:
     """The main function that processes incoming documents.
@@ -48,16 +219,7 @@ def main() -> Any:
         index_name = request_body["index_name"]
         docs = request_body["docs"]
 
-        processed = []
-        for doc in docs:
-            processed.append({
-                "_index": index_name,
-                "_id": doc["sa4_code_2021"],
-                "_source": {
-                    "med_tot_psnl_incom_weekly":doc[" med_tot_psnl_incom_weekly"],
-                    "sa4_code_2021":doc["sa4_code_2021"],
-                }
-            })
+        processed = process_docs(docs, index_name)
 
         # Log the number of processed documents
         current_app.logger.info(f'{len(processed)} of observations have been processed!')
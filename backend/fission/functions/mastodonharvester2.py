@@ -44,15 +44,27 @@ def config(k: str) -> str:
         return f.read()
 
 
+# a batch is flushed at whichever limit it hits first, its serialized size or its age.
+# every batch becomes one kafka message, and the processed batch is a few times larger,
+# so the target stays well under the 1 MB message limit of the broker
+BATCH_BYTES = 256 * 1024
+BATCH_LATENCY = 10.0
+
+
 class BufferedStreamListener(StreamListener):
-    def __init__(self, buffer_size: int):
-        """Initialize the buffered stream listener with a specified buffer size.
+    def __init__(self, max_bytes: int, max_latency: float):
+        """Initialize the buffered stream listener with a batch size in bytes and a max latency.
 
         Args:
-            buffer_size (int): Add streamed data to the buffer, add to queue if buffer is full.
+            max_bytes (int): Add streamed data to the buffer, add to queue once it holds this many bytes.
+            max_latency (float): Add to queue at the latest this many seconds after the first status of the buffer.
         """
+        # statuses are kept serialized, so the size of the batch is known
         self.buffer = []
-        self.buffer_size = buffer_size
+        self.buffer_bytes = 0
+        self.buffer_started = 0.0
+        self.max_bytes = max_bytes
+        self.max_latency = max_latency
 
     def on_update(self, status: Dict[str, Any]) -> None:
         """Handle a new status update
@@ -62,20 +74,37 @@ class BufferedStreamListener(StreamListener):
         """
         if status["language"]=="en":
             status["server"] = config('MTD_SERVER_2')
-            self.buffer.append(status)
-        if len(self.buffer) >= self.buffer_size:
+            doc = json.dumps(status, default=str)
+            if not self.buffer:
+                self.buffer_started = time.monotonic()
+            self.buffer.append(doc)
+            self.buffer_bytes += len(doc) + 1
+        if self.buffer_bytes >= self.max_bytes:
+            self.flush_buffer()
+        else:
+            self.check_latency()
+
+    def handle_heartbeat(self) -> None:
+        """Handle a heartbeat of the stream, so a quiet stream still flushes on time."""
+        self.check_latency()
+
+    def check_latency(self) -> None:
+        """Flush the buffer once its first status has waited for max_latency seconds."""
+        if self.buffer and time.monotonic() - self.buffer_started >= self.max_latency:
             self.flush_buffer()
 
 
     def flush_buffer(self) -> None:
         """Flush the buffer by sending its content to the queur."""
+        payload = '{"index_name":"mastodon-en","docs":[' + ",".join(self.buffer) + ']}'
         requests.post(url='http://router.fission/enqueue/topic-mastodon',
                       headers={'Content-Type': 'application/json'},
-                      data=json.dumps({"index_name":"mastodon-en", "docs":self.buffer}, default=str),
+                      data=payload.encode('utf-8'),
                       timeout=60,
                       )
-        current_app.logger.info(f"Flushing buffer with {len(self.buffer)} observations!")
+        current_app.logger.info(f"Flushing buffer with {len(self.buffer)} observations ({self.buffer_bytes} bytes)!")
         self.buffer.clear()
+        self.buffer_bytes = 0
 
 
 
@@ -105,7 +134,7 @@ def main_stream() -> None:
             access_token = config('MTD_TOKEN_2'),
         )
     try:
-        listener = BufferedStreamListener(buffer_size=50)  # Adjust buffer size as needed
+        listener = BufferedStreamListener(max_bytes=BATCH_BYTES, max_latency=BATCH_LATENCY)
         m.stream_public(listener)
     except MastodonError as e:
         current_app.logger.info(f"Error: {e}. Trying to restart...")
@@ -27,7 +27,7 @@ Fission Setup:
 """
 
 import re
-from typing import Any, Dict
+from typing import Any, Callable, Dict, List, Optional
 
 
 import readability
@@ -36,6 +36,247 @@ from flask import Flask, request, jsonify, current_app
 
 app = Flask(__name__)
 
+# BEGIN GENERATED VALIDATOR from mastodon_schema.json, run database/schema/generate_validators.py to update
+
+def convert(value: Any, to_type: Callable[..., Any], field: str, *args: Any, arrays: bool = True) -> Any:
+    """Converts a field value, or every value of an array, to the type of the mapping.
+
+    Args:
+        value (Any): The field value
+        to_type (Callable[..., Any]): The converter of the field type
+        field (str): The field path, for the error message
+        args (Any): Other arguments of the converter, e.g. the date format
+        arrays (bool): Convert every value of an array, instead of the array as a whole
+
+    Raises:
+        ValueError: when Elasticsearch would reject the value
+
+    Returns:
+        Any: The converted value
+    """
+    if value is None:
+        return None
+    try:
+        if arrays and isinstance(value, list):
+            return [to_type(item, *args) for item in value]
+        return to_type(value, *args)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field}: {value!r} does not fit the mapping") from None
+
+
+def to_keyword(value: Any) -> str:
+    """Converts a text or keyword value, numbers and booleans are turned into strings."""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return str(value).lower()
+    if isinstance(value, (int, float)):
+        return str(value)
+    raise TypeError
+
+
+def to_float(value: Any) -> float:
+    """Converts a float value, numeric strings are parsed and non-finite values rejected."""
+    if isinstance(value, bool):
+        raise TypeError
+    if isinstance(value, str):
+        value = float(value)
+    if not isinstance(value, (int, float)) or value != value or abs(value) == float("inf"):
+        raise ValueError
+    return value
+
+
+def to_integer(value: Any) -> int:
+    """Converts an integer value, floats and numeric strings are truncated."""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    return int(to_float(value))
+
+
+def to_boolean(value: Any) -> bool:
+    """Converts a boolean value, "true" and "false" are parsed."""
+    if isinstance(value, bool):
+        return value
+    if value in ("true", "false"):
+        return value == "true"
+    raise TypeError
+
+
+def to_date(value: Any, date_format: Any) -> Any:
+    """Checks a date value, a string or a number, against the compiled formats of the mapping."""
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise TypeError
+    if not date_format.fullmatch(str(value)):
+        raise ValueError
+    return value
+
+
+def to_geo_point(value: Any) -> Any:
+    """Checks a geo point, [lon, lat], {"lat": lat, "lon": lon} or a string."""
+    if isinstance(value, (list, tuple)) and len(value) == 2:
+        return [to_float(item) for item in value]
+    if isinstance(value, dict) and "lat" in value and "lon" in value:
+        return value
+    if isinstance(value, str):
+        return value
+    raise TypeError
+
+
+def to_geo_shape(value: Any) -> Any:
+    """Checks a geo shape, a geojson object or a wkt string."""
+    if isinstance(value, dict) and "type" in value:
+        return value
+    if isinstance(value, str):
+        return value
+    raise TypeError
+
+
+def to_object(value: Any, field: str) -> Dict[str, Any]:
+    """Checks an object value.
+
+    Args:
+        value (Any): The field value
+        field (str): The field path, for the error message
+
+    Raises:
+        ValueError: when the value is not an object
+
+    Returns:
+        Dict[str, Any]: The object
+    """
+    if not isinstance(value, dict):
+        raise ValueError(f"{field}: {value!r} is not an object")
+    return value
+
+# yyyy-MM-dd HH:mm:ssXXX||epoch_millis
+DATE_FORMAT_1 = re.compile('(\\d{4}\\-(0[1-9]|1[0-2])\\-(0[1-9]|[12]\\d|3[01])\\ ([01]\\d|2[0-3]):[0-5]\\d:[0-5]\\d(Z|[+-]\\d{2}:\\d{2}))|(-?\\d+(\\.\\d+)?)')
+
+def validate_source(source: Dict[str, Any], dropped: List[str]) -> Optional[str]:
+    """Checks the _source of a document against the mapping of mastodon_schema.json,
+    repairing in place the values Elasticsearch would coerce and dropping the
+    fields a strict mapping would reject.
+
+    Args:
+        source (Dict[str, Any]): The _source of the document
+        dropped (List[str]): The paths of the dropped fields, appended to
+
+    Returns:
+        Optional[str]: Why Elasticsearch would reject the document, None when it can be indexed
+    """
+    try:
+        for key in source.keys() - {'account', 'content', 'created_at', 'favourites_count', 'sentiment', 'readability_grades', 'reblogs_count', 'replies_count', 'sensitive', 'server', 'tags', 'sentence_info'}:
+            del source[key]
+            dropped.append(key)
+        if source.get('account') is not None:
+            value1 = to_object(source['account'], 'account')
+            for key in value1.keys() - {'acct', 'display_name', 'followers_count', 'following_count', 'location', 'statuses_count', 'username'}:
+                del value1[key]
+                dropped.append('account.' + key)
+            if 'acct' in value1:
+                value1['acct'] = convert(value1['acct'], to_keyword, 'account.acct')
+            if 'display_name' in value1:
+                value1['display_name'] = convert(value1['display_name'], to_keyword, 'account.display_name')
+            if 'followers_count' in value1:
+                value1['followers_count'] = convert(value1['followers_count'], to_integer, 'account.followers_count')
+            if 'following_count' in value1:
+                value1['following_count'] = convert(value1['following_count'], to_integer, 'account.following_count')
+            if 'location' in value1:
+                value1['location'] = convert(value1['location'], to_keyword, 'account.location')
+            if 'statuses_count' in value1:
+                value1['statuses_count'] = convert(value1['statuses_count'], to_integer, 'account.statuses_count')
+            if 'username' in value1:
+                value1['username'] = convert(value1['username'], to_keyword, 'account.username')
+        if 'content' in source:
+            source['content'] = convert(source['content'], to_keyword, 'content')
+        if 'created_at' in source:
+            source['created_at'] = convert(source['created_at'], to_date, 'created_at', DATE_FORMAT_1)
+        if 'favourites_count' in source:
+            source['favourites_count'] = convert(source['favourites_count'], to_integer, 'favourites_count')
+        if source.get('sentiment') is not None:
+            value1 = to_object(source['sentiment'], 'sentiment')
+            for key in value1.keys() - {'neg', 'neu', 'pos', 'compound'}:
+                del value1[key]
+                dropped.append('sentiment.' + key)
+            if 'neg' in value1:
+                value1['neg'] = convert(value1['neg'], to_float, 'sentiment.neg')
+            if 'neu' in value1:
+                value1['neu'] = convert(value1['neu'], to_float, 'sentiment.neu')
+            if 'pos' in value1:
+                value1['pos'] = convert(value1['pos'], to_float, 'sentiment.pos')
+            if 'compound' in value1:
+                value1['compound'] = convert(value1['compound'], to_float, 'sentiment.compound')
+        if source.get('readability_grades') is not None:
+            value1 = to_object(source['readability_grades'], 'readability_grades')
+            for key in value1.keys() - {'Kincaid', 'ARI', 'Coleman-Liau', 'FleschReadingEase', 'GunningFogIndex', 'LIX', 'SMOGIndex', 'RIX', 'DaleChallIndex'}:
+                del value1[key]
+                dropped.append('readability_grades.' + key)
+            if 'Kincaid' in value1:
+                value1['Kincaid'] = convert(value1['Kincaid'], to_float, 'readability_grades.Kincaid')
+            if 'ARI' in value1:
+                value1['ARI'] = convert(value1['ARI'], to_float, 'readability_grades.ARI')
+            if 'Coleman-Liau' in value1:
+                value1['Coleman-Liau'] = convert(value1['Coleman-Liau'], to_float, 'readability_grades.Coleman-Liau')
+            if 'FleschReadingEase' in value1:
+                value1['FleschReadingEase'] = convert(value1['FleschReadingEase'], to_float, 'readability_grades.FleschReadingEase')
+            if 'GunningFogIndex' in value1:
+                value1['GunningFogIndex'] = convert(value1['GunningFogIndex'], to_float, 'readability_grades.GunningFogIndex')
+            if 'LIX' in value1:
+                value1['LIX'] = convert(value1['LIX'], to_float, 'readability_grades.LIX')
+            if 'SMOGIndex' in value1:
+                value1['SMOGIndex'] = convert(value1['SMOGIndex'], to_float, 'readability_grades.SMOGIndex')
+            if 'RIX' in value1:
+                value1['RIX'] = convert(value1['RIX'], to_float, 'readability_grades.RIX')
+            if 'DaleChallIndex' in value1:
+                value1['DaleChallIndex'] = convert(value1['DaleChallIndex'], to_float, 'readability_grades.DaleChallIndex')
+        if 'reblogs_count' in source:
+            source['reblogs_count'] = convert(source['reblogs_count'], to_integer, 'reblogs_count')
+        if 'replies_count' in source:
+            source['replies_count'] = convert(source['replies_count'], to_integer, 'replies_count')
+        if 'sensitive' in source:
+            source['sensitive'] = convert(source['sensitive'], to_boolean, 'sensitive')
+        if 'server' in source:
+            source['server'] = convert(source['server'], to_keyword, 'server')
+        if 'tags' in source:
+            source['tags'] = convert(source['tags'], to_keyword, 'tags')
+        if source.get('sentence_info') is not None:
+            value1 = to_object(source['sentence_info'], 'sentence_info')
+            for key in value1.keys() - {'characters_per_word', 'syll_per_word', 'words_per_sentence', 'sentences_per_paragraph', 'type_token_ratio', 'characters', 'syllables', 'words', 'wordtypes', 'sentences', 'paragraphs', 'long_words', 'complex_words', 'complex_words_dc'}:
+                del value1[key]
+                dropped.append('sentence_info.' + key)
+            if 'characters_per_word' in value1:
+                value1['characters_per_word'] = convert(value1['characters_per_word'], to_float, 'sentence_info.characters_per_word')
+            if 'syll_per_word' in value1:
+                value1['syll_per_word'] = convert(value1['syll_per_word'], to_float, 'sentence_info.syll_per_word')
+            if 'words_per_sentence' in value1:
+                value1['words_per_sentence'] = convert(value1['words_per_sentence'], to_float, 'sentence_info.words_per_sentence')
+            if 'sentences_per_paragraph' in value1:
+                value1['sentences_per_paragraph'] = convert(value1['sentences_per_paragraph'], to_float, 'sentence_info.sentences_per_paragraph')
+            if 'type_token_ratio' in value1:
+                value1['type_token_ratio'] = convert(value1['type_token_ratio'], to_float, 'sentence_info.type_token_ratio')
+            if 'characters' in value1:
+                value1['characters'] = convert(value1['characters'], to_integer, 'sentence_info.characters')
+            if 'syllables' in value1:
+                value1['syllables'] = convert(value1['syllables'], to_integer, 'sentence_info.syllables')
+            if 'words' in value1:
+                value1['words'] = convert(value1['words'], to_integer, 'sentence_info.words')
+            if 'wordtypes' in value1:
+                value1['wordtypes'] = convert(value1['wordtypes'], to_integer, 'sentence_info.wordtypes')
+            if 'sentences' in value1:
+                value1['sentences'] = convert(value1['sentences'], to_integer, 'sentence_info.sentences')
+            if 'paragraphs' in value1:
+                value1['paragraphs'] = convert(value1['paragraphs'], to_integer, 'sentence_info.paragraphs')
+            if 'long_words' in value1:
+                value1['long_words'] = convert(value1['long_words'], to_integer, 'sentence_info.long_words')
+            if 'complex_words' in value1:
+                value1['complex_words'] = convert(value1['complex_words'], to_integer, 'sentence_info.complex_words')
+            if 'complex_words_dc' in value1:
+                value1['complex_words_dc'] = convert(value1['complex_words_dc'], to_integer, 'sentence_info.complex_words_dc')
+    except ValueError as e:
+        return str(e)
+    return None
+# END GENERATED VALIDATOR
+
+
 @app.route('/', methods=['POST'])
 def main() -> Any:
     """The main function that processes incoming documents, 
@@ -90,23 +331,32 @@ def main() -> Any:
                 measures = readability.getmeasures(doc["content"], lang='en')
                 doc["readability_grades"] = dict(measures["readability grades"].items())
                 doc["sentence_info"] = dict(measures["sentence info"].items())
+                source = {
+                    "content":doc["content"],
+                    "created_at":doc["created_at"],
+                    "replies_count":doc["replies_count"],
+                    "reblogs_count":doc["reblogs_count"],
+                    "favourites_count":doc["favourites_count"],
+                    "sentiment":doc["sentiment"],
+                    "readability_grades":doc["readability_grades"],
+                    "sentence_info":doc["sentence_info"],
+                    "tags":doc["tags"],
+                    "account":doc["account"],
+                    "sensitive":doc["sensitive"],
+                    "server":doc["server"]
+                }
+                # reject what Elasticsearch would reject before it goes through kafka
+                dropped = []
+                problem = validate_source(source, dropped)
+                if problem is not None:
+                    current_app.logger.error(f"Rejected document {doc['id']}: {problem}")
+                    continue
+                if dropped:
+                    current_app.logger.warning(f"Dropped fields of document {doc['id']} missing from the mapping: {', '.join(dropped)}")
                 processed.append({
                     "_index": index_name,
                     "_id": doc["id"],
-                    "_source": {
-                        "content":doc["content"],
-                        "created_at":doc["created_at"],
-                        "replies_count":doc["replies_count"],
-                        "reblogs_count":doc["reblogs_count"],
-                        "favourites_count":doc["favourites_count"],
-                        "sentiment":doc["sentiment"],
-                        "readability_grades":doc["readability_grades"],
-                        "sentence_info":doc["sentence_info"],
-                        "tags":doc["tags"],
-                        "account":doc["account"],
-                        "sensitive":doc["sensitive"],
-                        "server":doc["server"]
-                    }
+                    "_source": source,
                 })
             except Exception as e:
                 current_app.logger.error(f"Error processing document: {e}")
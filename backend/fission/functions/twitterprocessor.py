@@ -27,7 +27,8 @@ Fission Setup:
 """
 
 import re
-from typing import Any, Dict, List
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional
 
 import readability
 from nltk.sentiment import SentimentIntensityAnalyzer
@@ -36,6 +37,314 @@ from flask import Flask, request, jsonify, current_app
 
 app = Flask(__name__)
 
+# Remove HTML tags from the content
+TAG_REMOVER = re.compile('<.*?>')
+
+
+# BEGIN GENERATED VALIDATOR from twitter_schema.json, run database/schema/generate_validators.py to update
+
+def convert(value: Any, to_type: Callable[..., Any], field: str, *args: Any, arrays: bool = True) -> Any:
+    """Converts a field value, or every value of an array, to the type of the mapping.
+
+    Args:
+        value (Any): The field value
+        to_type (Callable[..., Any]): The converter of the field type
+        field (str): The field path, for the error message
+        args (Any): Other arguments of the converter, e.g. the date format
+        arrays (bool): Convert every value of an array, instead of the array as a whole
+
+    Raises:
+        ValueError: when Elasticsearch would reject the value
+
+    Returns:
+        Any: The converted value
+    """
+    if value is None:
+        return None
+    try:
+        if arrays and isinstance(value, list):
+            return [to_type(item, *args) for item in value]
+        return to_type(value, *args)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field}: {value!r} does not fit the mapping") from None
+
+
+def to_keyword(value: Any) -> str:
+    """Converts a text or keyword value, numbers and booleans are turned into strings."""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return str(value).lower()
+    if isinstance(value, (int, float)):
+        return str(value)
+    raise TypeError
+
+
+def to_float(value: Any) -> float:
+    """Converts a float value, numeric strings are parsed and non-finite values rejected."""
+    if isinstance(value, bool):
+        raise TypeError
+    if isinstance(value, str):
+        value = float(value)
+    if not isinstance(value, (int, float)) or value != value or abs(value) == float("inf"):
+        raise ValueError
+    return value
+
+
+def to_integer(value: Any) -> int:
+    """Converts an integer value, floats and numeric strings are truncated."""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    return int(to_float(value))
+
+
+def to_boolean(value: Any) -> bool:
+    """Converts a boolean value, "true" and "false" are parsed."""
+    if isinstance(value, bool):
+        return value
+    if value in ("true", "false"):
+        return value == "true"
+    raise TypeError
+
+
+def to_date(value: Any, date_format: Any) -> Any:
+    """Checks a date value, a string or a number, against the compiled formats of the mapping."""
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise TypeError
+    if not date_format.fullmatch(str(value)):
+        raise ValueError
+    return value
+
+
+def to_geo_point(value: Any) -> Any:
+    """Checks a geo point, [lon, lat], {"lat": lat, "lon": lon} or a string."""
+    if isinstance(value, (list, tuple)) and len(value) == 2:
+        return [to_float(item) for item in value]
+    if isinstance(value, dict) and "lat" in value and "lon" in value:
+        return value
+    if isinstance(value, str):
+        return value
+    raise TypeError
+
+
+def to_geo_shape(value: Any) -> Any:
+    """Checks a geo shape, a geojson object or a wkt string."""
+    if isinstance(value, dict) and "type" in value:
+        return value
+    if isinstance(value, str):
+        return value
+    raise TypeError
+
+
+def to_object(value: Any, field: str) -> Dict[str, Any]:
+    """Checks an object value.
+
+    Args:
+        value (Any): The field value
+        field (str): The field path, for the error message
+
+    Raises:
+        ValueError: when the value is not an object
+
+    Returns:
+        Dict[str, Any]: The object
+    """
+    if not isinstance(value, dict):
+        raise ValueError(f"{field}: {value!r} is not an object")
+    return value
+
+# strict_date_optional_time
+DATE_FORMAT_1 = re.compile('(\\d{4}(-(0[1-9]|1[0-2])(-(0[1-9]|[12]\\d|3[01])(T([01]\\d|2[0-3])(:[0-5]\\d(:[0-5]\\d([.,]\\d{1,9})?)?)?(Z|[+-]\\d{2}(:?\\d{2})?)?)?)?)?)')
+
+def validate_source(source: Dict[str, Any], dropped: List[str]) -> Optional[str]:
+    """Checks the _source of a document against the mapping of twitter_schema.json,
+    repairing in place the values Elasticsearch would coerce and dropping the
+    fields a strict mapping would reject.
+
+    Args:
+        source (Dict[str, Any]): The _source of the document
+        dropped (List[str]): The paths of the dropped fields, appended to
+
+    Returns:
+        Optional[str]: Why Elasticsearch would reject the document, None when it can be indexed
+    """
+    try:
+        for key in source.keys() - {'created_at', 'content', 'topics', 'location', 'sentiment', 'readability_grades', 'sentence_info'}:
+            del source[key]
+            dropped.append(key)
+        if 'created_at' in source:
+            source['created_at'] = convert(source['created_at'], to_date, 'created_at', DATE_FORMAT_1)
+        if 'content' in source:
+            source['content'] = convert(source['content'], to_keyword, 'content')
+        if 'topics' in source:
+            source['topics'] = convert(source['topics'], to_keyword, 'topics')
+        if source.get('location') is not None:
+            value1 = to_object(source['location'], 'location')
+            for key in value1.keys() - {'coordinates', 'bbox'}:
+                del value1[key]
+                dropped.append('location.' + key)
+            if 'coordinates' in value1:
+                value1['coordinates'] = convert(value1['coordinates'], to_geo_point, 'location.coordinates', arrays=False)
+            if 'bbox' in value1:
+                value1['bbox'] = convert(value1['bbox'], to_geo_shape, 'location.bbox', arrays=False)
+        if source.get('sentiment') is not None:
+            value1 = to_object(source['sentiment'], 'sentiment')
+            for key in value1.keys() - {'neg', 'neu', 'pos', 'compound'}:
+                del value1[key]
+                dropped.append('sentiment.' + key)
+            if 'neg' in value1:
+                value1['neg'] = convert(value1['neg'], to_float, 'sentiment.neg')
+            if 'neu' in value1:
+                value1['neu'] = convert(value1['neu'], to_float, 'sentiment.neu')
+            if 'pos' in value1:
+                value1['pos'] = convert(value1['pos'], to_float, 'sentiment.pos')
+            if 'compound' in value1:
+                value1['compound'] = convert(value1['compound'], to_float, 'sentiment.compound')
+        if source.get('readability_grades') is not None:
+            value1 = to_object(source['readability_grades'], 'readability_grades')
+            for key in value1.keys() - {'Kincaid', 'ARI', 'Coleman-Liau', 'FleschReadingEase', 'GunningFogIndex', 'LIX', 'SMOGIndex', 'RIX', 'DaleChallIndex'}:
+                del value1[key]
+                dropped.append('readability_grades.' + key)
+            if 'Kincaid' in value1:
+                value1['Kincaid'] = convert(value1['Kincaid'], to_float, 'readability_grades.Kincaid')
+            if 'ARI' in value1:
+                value1['ARI'] = convert(value1['ARI'], to_float, 'readability_grades.ARI')
+            if 'Coleman-Liau' in value1:
+                value1['Coleman-Liau'] = convert(value1['Coleman-Liau'], to_float, 'readability_grades.Coleman-Liau')
+            if 'FleschReadingEase' in value1:
+                value1['FleschReadingEase'] = convert(value1['FleschReadingEase'], to_float, 'readability_grades.FleschReadingEase')
+            if 'GunningFogIndex' in value1:
+                value1['GunningFogIndex'] = convert(value1['GunningFogIndex'], to_float, 'readability_grades.GunningFogIndex')
+            if 'LIX' in value1:
+                value1['LIX'] = convert(value1['LIX'], to_float, 'readability_grades.LIX')
+            if 'SMOGIndex' in value1:
+                value1['SMOGIndex'] = convert(value1['SMOGIndex'], to_float, 'readability_grades.SMOGIndex')
+            if 'RIX' in value1:
+                value1['RIX'] = convert(value1['RIX'], to_float, 'readability_grades.RIX')
+            if 'DaleChallIndex' in value1:
+                value1['DaleChallIndex'] = convert(value1['DaleChallIndex'], to_float, 'readability_grades.DaleChallIndex')
+        if source.get('sentence_info') is not None:
+            value1 = to_object(source['sentence_info'], 'sentence_info')
+            for key in value1.keys() - {'characters_per_word', 'syll_per_word', 'words_per_sentence', 'sentences_per_paragraph', 'type_token_ratio', 'characters', 'syllables', 'words', 'wordtypes', 'sentences', 'paragraphs', 'long_words', 'complex_words', 'complex_words_dc'}:
+                del value1[key]
+                dropped.append('sentence_info.' + key)
+            if 'characters_per_word' in value1:
+                value1['characters_per_word'] = convert(value1['characters_per_word'], to_float, 'sentence_info.characters_per_word')
+            if 'syll_per_word' in value1:
+                value1['syll_per_word'] = convert(value1['syll_per_word'], to_float, 'sentence_info.syll_per_word')
+            if 'words_per_sentence' in value1:
+                value1['words_per_sentence'] = convert(value1['words_per_sentence'], to_float, 'sentence_info.words_per_sentence')
+            if 'sentences_per_paragraph' in value1:
+                value1['sentences_per_paragraph'] = convert(value1['sentences_per_paragraph'], to_float, 'sentence_info.sentences_per_paragraph')
+            if 'type_token_ratio' in value1:
+                value1['type_token_ratio'] = convert(value1['type_token_ratio'], to_float, 'sentence_info.type_token_ratio')
+            if 'characters' in value1:
+                value1['characters'] = convert(value1['characters'], to_integer, 'sentence_info.characters')
+            if 'syllables' in value1:
+                value1['syllables'] = convert(value1['syllables'], to_integer, 'sentence_info.syllables')
+            if 'words' in value1:
+                value1['words'] = convert(value1['words'], to_integer, 'sentence_info.words')
+            if 'wordtypes' in value1:
+                value1['wordtypes'] = convert(value1['wordtypes'], to_integer, 'sentence_info.wordtypes')
+            if 'sentences' in value1:
+                value1['sentences'] = convert(value1['sentences'], to_integer, 'sentence_info.sentences')
+            if 'paragraphs' in value1:
+                value1['paragraphs'] = convert(value1['paragraphs'], to_integer, 'sentence_info.paragraphs')
+            if 'long_words' in value1:
+                value1['long_words'] = convert(value1['long_words'], to_integer, 'sentence_info.long_words')
+            if 'complex_words' in value1:
+                value1['complex_words'] = convert(value1['complex_words'], to_integer, 'sentence_info.complex_words')
+            if 'complex_words_dc' in value1:
+                value1['complex_words_dc'] = convert(value1['complex_words_dc'], to_integer, 'sentence_info.complex_words_dc')
+    except ValueError as e:
+        return str(e)
+    return None
+# END GENERATED VALIDATOR
+
+
+@lru_cache(maxsize=None)
+def get_sentiment_analyzer() -> SentimentIntensityAnalyzer:
+    """Loads the Sentiment Intensity Analyzer once per process.
+
+    Returns:
+        SentimentIntensityAnalyzer: The shared analyzer
+    """
+    return SentimentIntensityAnalyzer()
+
+
+def process_docs(docs: List[Dict], index_name: str) -> List[Dict]:
+    """Cleans the documents, analyzes sentiment, extracts geo information,
+    evaluates readability metrics and builds the bulk actions of addobservations.
+
+    This is also imported by the uploader (database/uploader) to run the
+    same transform locally when backfilling straight into Elasticsearch.
+
+    Args:
+        docs (List[Dict]): The twitter documents
+        index_name (str): The Elasticsearch index of the actions
+
+    Returns:
+        List[Dict]: The bulk actions of the processed documents
+    """
+    sia = get_sentiment_analyzer()
+
+    processed = []
+    for doc in docs:
+        # Remove HTML tags and strip whitespace from content
+        doc["content"] = re.sub(TAG_REMOVER, '', doc["text"])
+        doc["content"] = doc["content"].strip()
+        if not doc["content"]:
+            continue
+
+
+        # Analyze sentiment of the content
+        doc["sentiment"] = sia.polarity_scores(doc["content"])
+
+        # Gather geo information like coordinates and bbox
+        p1 = float(doc["p1"])
+        p2 = float(doc["p2"])
+        p3 = float(doc["p3"])
+        p4 = float(doc["p4"])
+        doc["location"] = {"coordinates":[(p1+p3)/2, (p2+p4)/2],
+                        "bbox":{"type":"polygon",
+                                "coordinates":[[[p1,p2],[p3,p2],[p3,p4],[p1,p4],[p1,p2]]]}
+                            }
+        
+        # Evaluate readability metrics and append processed document
+        try:
+            measures = readability.getmeasures(doc["content"], lang='en')
+            doc["readability_grades"] = dict(measures["readability grades"].items())
+            doc["sentence_info"] = dict(measures["sentence info"].items())
+            source = {
+                "content":doc["content"],
+                "created_at":doc["time"],
+                "location":doc["location"],
+                "sentiment":doc["sentiment"],
+                "readability_grades":doc["readability_grades"],
+                "sentence_info":doc["sentence_info"],
+            }
+            # topics are tagged by the extractor (main.py --topics)
+            if "topics" in doc:
+                source["topics"] = doc["topics"]
+            # reject what Elasticsearch would reject before it goes through kafka
+            dropped = []
+            problem = validate_source(source, dropped)
+            if problem is not None:
+                app.logger.error(f"Rejected document {doc['id']}: {problem}")
+                continue
+            if dropped:
+                app.logger.warning(f"Dropped fields of document {doc['id']} missing from the mapping: {', '.join(dropped)}")
+            processed.append({
+                "_index": index_name,
+                "_id": doc["id"],
+                "_source": source,
+            })
+        except Exception as e:
+            app.logger.error(f"Error processing document: {e}")
+            continue
+    return processed
+
+
 @app.route('/', methods=['POST'])
 def main() -> Any:
     """The main function that processes incoming documents, 
@@ -47,58 +356,13 @@ def main() -> Any:
         Any: JSON response containing the processed documents.
     """
 
-    # Initialize Sentiment Intensity Analyzer and tag remover regex
-    sia = SentimentIntensityAnalyzer()
-    tag_remover = re.compile('<.*?>')
-
     # Get the JSON data from the incoming request
     request_body = request.get_json(force=True)
     index_name = request_body["index_name"]
     docs = request_body["docs"]
 
-    processed = []
     try:
-        for doc in docs:
-            # Remove HTML tags and strip whitespace from content
-            doc["content"] = re.sub(tag_remover, '', doc["text"])
-            doc["content"] = doc["content"].strip()
-            if not doc["content"]:
-                continue
-
-
-            # Analyze sentiment of the content
-            doc["sentiment"] = sia.polarity_scores(doc["content"])
-
-            # Gather geo information like coordinates and bbox
-            p1 = float(doc["p1"])
-            p2 = float(doc["p2"])
-            p3 = float(doc["p3"])
-            p4 = float(doc["p4"])
-            doc["location"] = {"coordinates":[(p1+p3)/2, (p2+p4)/2],
-                            "bbox":{"type":"polygon",
-                                    "coordinates":[[[p1,p2],[p3,p2],[p3,p4],[p1,p4],[p1,p2]]]}
-                                }
-            
-            # Evaluate readability metrics and append processed document
-            try:
-                measures = readability.getmeasures(doc["content"], lang='en')
-                doc["readability_grades"] = dict(measures["readability grades"].items())
-                doc["sentence_info"] = dict(measures["sentence info"].items())
-                processed.append({
-                    "_index": index_name,
-                    "_id": doc["id"],
-                    "_source": {
-                        "content":doc["content"],
-                        "created_at":doc["time"],
-                        "location":doc["location"],
-                        "sentiment":doc["sentiment"],
-                        "readability_grades":doc["readability_grades"],
-                        "sentence_info":doc["sentence_info"],
-                    }
-                })
-            except Exception as e:
-                current_app.logger.error(f"Error processing document: {e}")
-                continue
+        processed = process_docs(docs, index_name)
 
         # Log the number of processed documents
         current_app.logger.info(f'{len(processed)} of observations have been processed!')
@@ -0,0 +1,377 @@
+"""
+Script Name: generate_validators.py
+Description: Generates the document validators of the processors from the index schemas.
+    A validator checks the _source of a processed document against the mapping of its index,
+    before the document is sent through kafka to addobservations. Values Elasticsearch would
+    coerce are repaired, fields a strict mapping would reject are dropped and reported, dates
+    are checked against the formats of their mapping, and documents that would still fail
+    are rejected. Fission functions are single files, so the validator is
+    written into each processor between the generated markers.
+Usage:
+    python3 generate_validators.py
+    python3 generate_validators.py --check
+"""
+
+import os
+import re
+import json
+import argparse
+
+from typing import Dict, List
+
+
+SCHEMA_DIR = os.path.dirname(os.path.abspath(__file__))
+FUNCTIONS_DIR = os.path.join(SCHEMA_DIR, "..", "..", "backend", "fission", "functions")
+
+# schema file of every processor
+TARGETS = {
+    "twitter_schema.json": "twitterprocessor.py",
+    "mastodon_schema.json": "mastodonprocessor.py",
+    "income_schema.json": "incomeprocessor.py",
+}
+
+BEGIN_MARKER = "# BEGIN GENERATED VALIDATOR"
+END_MARKER = "# END GENERATED VALIDATOR"
+
+# converter of every field type of the mappings, fields of other types are not checked
+CONVERTERS = {
+    "text": "to_keyword",
+    "keyword": "to_keyword",
+    "float": "to_float",
+    "double": "to_float",
+    "half_float": "to_float",
+    "integer": "to_integer",
+    "long": "to_integer",
+    "short": "to_integer",
+    "byte": "to_integer",
+    "boolean": "to_boolean",
+    "date": "to_date",
+    "geo_point": "to_geo_point",
+    "geo_shape": "to_geo_shape",
+}
+
+# a geo point is an array itself, the values of these types are not mapped one by one
+SINGLE_VALUE_TYPES = {"geo_point", "geo_shape"}
+
+# format of a date field without one in its mapping
+DEFAULT_DATE_FORMAT = "strict_date_optional_time||epoch_millis"
+
+# regular expressions of the built-in date formats
+EPOCH_PATTERN = r"-?\d+(\.\d+)?"
+DATE_OPTIONAL_TIME_PATTERN = (r"\d{4}(-(0[1-9]|1[0-2])(-(0[1-9]|[12]\d|3[01])"
+                              r"(T([01]\d|2[0-3])(:[0-5]\d(:[0-5]\d([.,]\d{1,9})?)?)?"
+                              r"(Z|[+-]\d{2}(:?\d{2})?)?)?)?)?")
+NAMED_DATE_FORMATS = {
+    "strict_date_optional_time": DATE_OPTIONAL_TIME_PATTERN,
+    "date_optional_time": DATE_OPTIONAL_TIME_PATTERN,
+    "epoch_millis": EPOCH_PATTERN,
+    "epoch_second": EPOCH_PATTERN,
+}
+
+# regular expressions of the letters of custom (java time) date formats
+DATE_PATTERN_LETTERS = {
+    "yyyy": r"\d{4}",
+    "uuuu": r"\d{4}",
+    "MM": r"(0[1-9]|1[0-2])",
+    "dd": r"(0[1-9]|[12]\d|3[01])",
+    "HH": r"([01]\d|2[0-3])",
+    "mm": r"[0-5]\d",
+    "ss": r"[0-5]\d",
+    "XXX": r"(Z|[+-]\d{2}:\d{2})",
+    "XX": r"(Z|[+-]\d{4})",
+    "X": r"(Z|[+-]\d{2}(\d{2})?)",
+    "xxx": r"[+-]\d{2}:\d{2}",
+    "Z": r"[+-]\d{4}",
+}
+
+HELPERS = '''
+def convert(value: Any, to_type: Callable[..., Any], field: str, *args: Any, arrays: bool = True) -> Any:
+    """Converts a field value, or every value of an array, to the type of the mapping.
+
+    Args:
+        value (Any): The field value
+        to_type (Callable[..., Any]): The converter of the field type
+        field (str): The field path, for the error message
+        args (Any): Other arguments of the converter, e.g. the date format
+        arrays (bool): Convert every value of an array, instead of the array as a whole
+
+    Raises:
+        ValueError: when Elasticsearch would reject the value
+
+    Returns:
+        Any: The converted value
+    """
+    if value is None:
+        return None
+    try:
+        if arrays and isinstance(value, list):
+            return [to_type(item, *args) for item in value]
+        return to_type(value, *args)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field}: {value!r} does not fit the mapping") from None
+
+
+def to_keyword(value: Any) -> str:
+    """Converts a text or keyword value, numbers and booleans are turned into strings."""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return str(value).lower()
+    if isinstance(value, (int, float)):
+        return str(value)
+    raise TypeError
+
+
+def to_float(value: Any) -> float:
+    """Converts a float value, numeric strings are parsed and non-finite values rejected."""
+    if isinstance(value, bool):
+        raise TypeError
+    if isinstance(value, str):
+        value = float(value)
+    if not isinstance(value, (int, float)) or value != value or abs(value) == float("inf"):
+        raise ValueError
+    return value
+
+
+def to_integer(value: Any) -> int:
+    """Converts an integer value, floats and numeric strings are truncated."""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    return int(to_float(value))
+
+
+def to_boolean(value: Any) -> bool:
+    """Converts a boolean value, "true" and "false" are parsed."""
+    if isinstance(value, bool):
+        return value
+    if value in ("true", "false"):
+        return value == "true"
+    raise TypeError
+
+
+def to_date(value: Any, date_format: Any) -> Any:
+    """Checks a date value, a string or a number, against the compiled formats of the mapping."""
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise TypeError
+    if not date_format.fullmatch(str(value)):
+        raise ValueError
+    return value
+
+
+def to_geo_point(value: Any) -> Any:
+    """Checks a geo point, [lon, lat], {"lat": lat, "lon": lon} or a string."""
+    if isinstance(value, (list, tuple)) and len(value) == 2:
+        return [to_float(item) for item in value]
+    if isinstance(value, dict) and "lat" in value and "lon" in value:
+        return value
+    if isinstance(value, str):
+        return value
+    raise TypeError
+
+
+def to_geo_shape(value: Any) -> Any:
+    """Checks a geo shape, a geojson object or a wkt string."""
+    if isinstance(value, dict) and "type" in value:
+        return value
+    if isinstance(value, str):
+        return value
+    raise TypeError
+
+
+def to_object(value: Any, field: str) -> Dict[str, Any]:
+    """Checks an object value.
+
+    Args:
+        value (Any): The field value
+        field (str): The field path, for the error message
+
+    Raises:
+        ValueError: when the value is not an object
+
+    Returns:
+        Dict[str, Any]: The object
+    """
+    if not isinstance(value, dict):
+        raise ValueError(f"{field}: {value!r} is not an object")
+    return value
+'''
+
+
+def get_date_pattern(date_format: str) -> str:
+    """Translates the date format of a mapping into a regular expression.
+
+    Args:
+        date_format (str): The date format, built-in names or java time patterns joined by "||"
+
+    Raises:
+        Exception: when the format uses a name or letter the generator does not know
+
+    Returns:
+        str: The regular expression matching the whole value
+    """
+    alternatives = []
+    for name in date_format.split("||"):
+        if name in NAMED_DATE_FORMATS:
+            alternatives.append(NAMED_DATE_FORMATS[name])
+            continue
+        pattern = ""
+        # quoted literals, runs of the same letter, or single other characters
+        for match in re.finditer(r"'[^']*'|([a-zA-Z])\1*|.", name):
+            token = match.group(0)
+            if token.startswith("'"):
+                pattern += re.escape(token[1:-1])
+            elif token[0].isalpha():
+                if token not in DATE_PATTERN_LETTERS:
+                    raise Exception(f"Error: \"{token}\" of the date format \"{date_format}\" is not supported!")
+                pattern += DATE_PATTERN_LETTERS[token]
+            else:
+                pattern += re.escape(token)
+        alternatives.append(pattern)
+    return "|".join(f"({pattern})" for pattern in alternatives)
+
+
+def generate_object(lines: List[str],
+                    date_formats: Dict[str, str],
+                    properties: Dict[str, Dict],
+                    var: str,
+                    path: str,
+                    strict: bool,
+                    depth: int) -> None:
+    """Generates the checks of the fields of an object.
+
+    Args:
+        lines (List[str]): The generated lines, appended to
+        date_formats (Dict[str, str]): The date formats used so far and their constant names, added to
+        properties (Dict[str, Dict]): The mapping of the fields
+        var (str): The variable holding the object
+        path (str): The path of the object, empty for the _source
+        strict (bool): Drop and report the fields that are not in the mapping
+        depth (int): The nesting depth of the object
+    """
+    indent = "    " * (depth + 1)
+    if strict:
+        names = "{" + ", ".join(repr(name) for name in properties) + "}" if properties else "set()"
+        lines.append(f"{indent}for key in {var}.keys() - {names}:")
+        lines.append(f"{indent}    del {var}[key]")
+        lines.append(f"{indent}    dropped.append({path!r} + key)" if path else f"{indent}    dropped.append(key)")
+    for name, field in properties.items():
+        field_path = f"{path}{name}"
+        if "properties" in field or field.get("type", "object") == "object":
+            child = f"value{depth}"
+            lines.append(f"{indent}if {var}.get({name!r}) is not None:")
+            lines.append(f"{indent}    {child} = to_object({var}[{name!r}], {field_path!r})")
+            child_strict = field.get("dynamic", "strict" if strict else True) == "strict"
+            generate_object(lines, date_formats, field.get("properties", {}), child, f"{field_path}.",
+                            child_strict, depth + 1)
+        elif field["type"] in CONVERTERS:
+            args = ""
+            if field["type"] in SINGLE_VALUE_TYPES:
+                args = ", arrays=False"
+            elif field["type"] == "date":
+                date_format = field.get("format", DEFAULT_DATE_FORMAT)
+                date_formats.setdefault(date_format, f"DATE_FORMAT_{len(date_formats) + 1}")
+                args = f", {date_formats[date_format]}"
+            lines.append(f"{indent}if {name!r} in {var}:")
+            lines.append(f"{indent}    {var}[{name!r}] = convert({var}[{name!r}], {CONVERTERS[field['type']]}, "
+                         f"{field_path!r}{args})")
+
+
+def generate_validator(schema_file: str) -> str:
+    """Generates the validator of a schema, with its markers.
+
+    Args:
+        schema_file (str): The schema file name in the schema directory
+
+    Returns:
+        str: The source code of the validator
+    """
+    with open(os.path.join(SCHEMA_DIR, schema_file), 'r', encoding='utf-8') as json_file:
+        mappings = json.load(json_file)["mappings"]
+
+    body: List[str] = []
+    date_formats: Dict[str, str] = {}
+    generate_object(body, date_formats, mappings["properties"], "source", "", mappings.get("dynamic") == "strict", 1)
+    constants = []
+    for date_format, constant in date_formats.items():
+        constants += [f"# {date_format}", f"{constant} = re.compile({get_date_pattern(date_format)!r})", ""]
+    lines = [
+        f"{BEGIN_MARKER} from {schema_file}, run database/schema/generate_validators.py to update",
+        HELPERS,
+        *constants,
+        "def validate_source(source: Dict[str, Any], dropped: List[str]) -> Optional[str]:",
+        f'    """Checks the _source of a document against the mapping of {schema_file},',
+        "    repairing in place the values Elasticsearch would coerce and dropping the",
+        "    fields a strict mapping would reject.",
+        "",
+        "    Args:",
+        "        source (Dict[str, Any]): The _source of the document",
+        "        dropped (List[str]): The paths of the dropped fields, appended to",
+        "",
+        "    Returns:",
+        "        Optional[str]: Why Elasticsearch would reject the document, None when it can be indexed",
+        '    """',
+        "    try:",
+        *body,
+        "    except ValueError as e:",
+        "        return str(e)",
+        "    return None",
+        END_MARKER,
+    ]
+    return "\n".join(lines)
+
+
+def update_processor(schema_file: str, processor_file: str, check: bool) -> bool:
+    """Writes the validator of a schema into its processor.
+
+    Args:
+        schema_file (str): The schema file name in the schema directory
+        processor_file (str): The processor file name in the functions directory
+        check (bool): Only check that the validator is up to date
+
+    Raises:
+        Exception: when the processor has no markers
+
+    Returns:
+        bool: True when the validator was up to date
+    """
+    path = os.path.join(FUNCTIONS_DIR, processor_file)
+    with open(path, 'r', encoding='utf-8', newline='') as py_file:
+        source = py_file.read()
+    start = source.find(BEGIN_MARKER)
+    end = source.find(END_MARKER)
+    if start < 0 or end < 0:
+        raise Exception(f"Error: {processor_file} has no \"{BEGIN_MARKER}\" and \"{END_MARKER}\" lines!")
+    # keep the line endings of the processor
+    newline = "\r\n" if "\r\n" in source else "\n"
+    validator = generate_validator(schema_file).replace("\n", newline)
+    # the date formats are compiled regular expressions
+    if "re.compile(" in validator and not re.search(r"^import re\s*$", source, re.MULTILINE):
+        raise Exception(f"Error: {processor_file} must import re for the date formats of {schema_file}!")
+    updated = source[:start] + validator + source[end + len(END_MARKER):]
+    if updated == source:
+        return True
+    if not check:
+        with open(path, 'w', encoding='utf-8', newline='') as py_file:
+            py_file.write(updated)
+    return False
+
+
+def main() -> None:
+    """
+    Main code for generating the validators of the processors.
+    """
+    parser = argparse.ArgumentParser(description="generate the document validators of the processors")
+    parser.add_argument("--check", action="store_true",
+                        help="only check that the validators are up to date, fail otherwise")
+    args = parser.parse_args()
+
+    outdated = [processor_file for schema_file, processor_file in TARGETS.items()
+                if not update_processor(schema_file, processor_file, args.check)]
+    for processor_file in outdated:
+        print(f"{processor_file}: {'out of date' if args.check else 'updated'}")
+    if args.check and outdated:
+        raise SystemExit(1)
+    print(f"{len(TARGETS) - len(outdated)} of {len(TARGETS)} validators were up to date.")
+
+if __name__=="__main__":
+    main()
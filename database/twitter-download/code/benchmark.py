@@ -0,0 +1,269 @@
+"""
+Script Name: benchmark.py
+Description: This script measures the throughput of the record parsers of TweetProcess on one core,
+    and the throughput per rank of the extractor (main.py or main_local.py) for different rank counts.
+    Every result is also saved to a json file, so runs can be compared to catch regressions.
+Usage:
+    python3 benchmark.py twitter-50mb
+    python3 benchmark.py twitter-50mb --parsers regex comb --repeat 5
+    python3 benchmark.py synthetic-1gb --batch-size 16777216 268435456 --ranks 1 2 4 8
+    python3 benchmark.py synthetic-1gb --ranks 1 2 4 8 --launcher local --output ../results/benchmark.json
+"""
+
+import os
+import sys
+import json
+import time
+import shlex
+import argparse
+import datetime
+import platform
+import subprocess
+
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+# import configs
+from config import DATA_DIR, RESULTS_DIR
+
+# import TweetProcess class defined in tweet_process.py
+from tweet_process import TweetProcess, get_file_size, PARSERS
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parse the command-line arguments.
+
+    Returns:
+        argparse.Namespace: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="benchmark the record parsers of TweetProcess")
+    parser.add_argument("filename", type=str,
+                        help="twitter file name in the data directory, or a file path")
+    parser.add_argument("--parsers", type=str, nargs="+", choices=PARSERS, default=PARSERS,
+                        help="record parsers to compare")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="number of runs per parser, the fastest one is reported")
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[2**30],
+                        help="numbers of bytes read and processed at a time to compare")
+    # the extractor is only benchmarked for a twitter file name, not a file path
+    parser.add_argument("--ranks", type=int, nargs="+", default=[],
+                        help="numbers of ranks to run the extractor with, none by default")
+    parser.add_argument("--launcher", type=str, choices=["mpi", "local"], default="mpi",
+                        help="run main.py with mpirun, or main_local.py with a process pool")
+    parser.add_argument("--mpirun", type=str, default="mpirun",
+                        help="command launching main.py, e.g. \"srun\" or \"mpirun --oversubscribe\"")
+    parser.add_argument("--extractor-args", type=str, default="",
+                        help="extra arguments of the extractor, e.g. \"--schedule dynamic --mmap\"")
+    parser.add_argument("--output", type=str, default=None,
+                        help="json file of the results, results/benchmark-<time>.json by default")
+    return parser.parse_args()
+
+
+def get_filepath(tw_filename: str) -> str:
+    """
+    Find the twitter file to benchmark.
+
+    Args:
+        tw_filename (str): twitter file name or file path
+
+    Returns:
+        str: twitter file path
+    """
+    if os.path.exists(tw_filename):
+        return tw_filename
+    return os.path.join(DATA_DIR, f"{tw_filename}.json")
+
+
+def benchmark_parser(tw_filepath: str,
+                     parser: str,
+                     repeat: int,
+                     batch_size: int) -> Tuple[Dict[str, Union[str, int, float]], List[Dict]]:
+    """
+    Run TweetProcess over the whole file with one parser on the current core.
+
+    Args:
+        tw_filepath (str): twitter file path
+        parser (str): record parser
+        repeat (int): number of runs, the fastest one is reported
+        batch_size (int): number of bytes read and processed at a time
+
+    Returns:
+        Tuple[Dict[str, Union[str, int, float]], List[Dict]]: parser name, records, seconds and throughput,
+            and the extracted records
+    """
+    tw_file_size = get_file_size(tw_filepath)
+    best = float("inf")
+    records: List[Dict] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        records = TweetProcess(tw_filepath, 0, tw_file_size, batch_size, parser=parser).process()
+        best = min(best, time.perf_counter() - start)
+    return {
+        "parser": parser,
+        "batch_size": batch_size,
+        "records": len(records),
+        "seconds": best,
+        "mb_per_second": tw_file_size / 2**20 / best,
+        "records_per_second": len(records) / best,
+    }, records
+
+
+def compare_records(expected: List[Dict], records: List[Dict]) -> List[str]:
+    """
+    Compare the records extracted by two parsers, field by field for every tweet id.
+
+    Args:
+        expected (List[Dict]): records extracted by the reference parser
+        records (List[Dict]): records extracted by the compared parser
+
+    Returns:
+        List[str]: the differences, empty when the parsers agree
+    """
+    differences = []
+    if len(expected) != len(records):
+        differences.append(f"{len(records)} records instead of {len(expected)}")
+    expected_by_id = {record["id"]: record for record in expected}
+    records_by_id = {record["id"]: record for record in records}
+    differences += [f"{tweet_id}: missing" for tweet_id in sorted(expected_by_id.keys() - records_by_id.keys())]
+    differences += [f"{tweet_id}: not expected" for tweet_id in sorted(records_by_id.keys() - expected_by_id.keys())]
+    for tweet_id in sorted(expected_by_id.keys() & records_by_id.keys()):
+        expected_record = expected_by_id[tweet_id]
+        record = records_by_id[tweet_id]
+        for field in sorted(expected_record.keys() | record.keys()):
+            # the bbox is kept as text by the regular expressions and as numbers by the json parser
+            if str(expected_record.get(field)) != str(record.get(field)):
+                differences.append(f"{tweet_id}: {field} is {record.get(field)!r} "
+                                   f"instead of {expected_record.get(field)!r}")
+    return differences
+
+
+def benchmark_extractor(tw_filename: str,
+                        ranks: int,
+                        batch_size: int,
+                        args: argparse.Namespace) -> Dict[str, Union[str, int, float, List]]:
+    """
+    Run the extractor over the whole file with a number of ranks,
+    then read the throughput of every rank from the manifest it saved.
+
+    Args:
+        tw_filename (str): twitter file name
+        ranks (int): number of ranks (MPI processes or pool workers)
+        batch_size (int): number of bytes each rank reads and processes at a time
+        args (argparse.Namespace): The parsed arguments
+
+    Raises:
+        Exception: when the extractor fails
+
+    Returns:
+        Dict[str, Union[str, int, float, List]]: run settings, wall time, total and per rank throughput
+    """
+    code_dir = os.path.dirname(os.path.abspath(__file__))
+    extractor_args = [tw_filename, "--batch-size", str(batch_size)] + shlex.split(args.extractor_args)
+    if args.launcher == "mpi":
+        command = shlex.split(args.mpirun) + ["-n", str(ranks), sys.executable, "main.py"] + extractor_args
+    else:
+        command = [sys.executable, "main_local.py", "--workers", str(ranks)] + extractor_args
+    start = time.perf_counter()
+    if subprocess.run(command, cwd=code_dir, check=False).returncode != 0:
+        raise Exception(f"Error: the extractor failed: {shlex.join(command)}")
+    wall_seconds = time.perf_counter() - start
+
+    with open(os.path.join(RESULTS_DIR, tw_filename, "twitter", "manifest.json"), 'r', encoding='utf-8') as json_file:
+        manifest = json.load(json_file)
+    rank_list = [{
+        "rank": worker["rank"],
+        "scanned_bytes": worker["scanned_bytes"],
+        "records": worker["records"],
+        "busy_seconds": worker["busy_seconds"],
+        "mb_per_second": worker["scanned_bytes"] / 2**20 / worker["busy_seconds"] if worker["busy_seconds"] else 0.0,
+        "records_per_second": worker["records"] / worker["busy_seconds"] if worker["busy_seconds"] else 0.0,
+        "utilization": worker["utilization"],
+    } for worker in manifest["workers"]]
+    scanned_bytes = sum(rank["scanned_bytes"] for rank in rank_list)
+    return {
+        "launcher": args.launcher,
+        "ranks": ranks,
+        "batch_size": batch_size,
+        "extractor_args": args.extractor_args,
+        "records": manifest["records"],
+        "seconds": wall_seconds,
+        "mb_per_second": scanned_bytes / 2**20 / wall_seconds,
+        "records_per_second": manifest["records"] / wall_seconds,
+        "rank_list": rank_list,
+    }
+
+
+def save_results(path: str, report: Dict) -> None:
+    """
+    Save the benchmark report to json file.
+
+    Args:
+        path (str): json file path
+        report (Dict): the benchmark report
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as json_file:
+        json.dump(report, json_file, indent=4)
+
+
+def main() -> None:
+    """
+    Main code for benchmarking the record parsers and the extractor.
+    """
+    args = parse_args()
+    tw_filepath = get_filepath(args.filename)
+    tw_file_size = get_file_size(tw_filepath)
+    print(f"{tw_filepath}: {tw_file_size / 2**20:.1f} MB")
+
+    parser_results: List[Dict] = []
+    # the records of the first run, every other run should extract the same ones
+    reference: Optional[Tuple[str, List[Dict]]] = None
+    for batch_size in args.batch_size:
+        for parser in args.parsers:
+            result, records = benchmark_parser(tw_filepath, parser, args.repeat, batch_size)
+            parser_results.append(result)
+            print(f"{parser:>6} (batch {batch_size}): {result['mb_per_second']:8.1f} MB/s per core, "
+                  f"{result['records_per_second']:10.0f} records/s, {result['records']} records")
+            if reference is None:
+                reference = (f"{parser} (batch {batch_size})", records)
+                continue
+            differences = compare_records(reference[1], records)
+            result["differences"] = len(differences)
+            if differences:
+                print(f"warning: {len(differences)} differences with the records of {reference[0]}, e.g.")
+                for difference in differences[:10]:
+                    print(f"    {difference}")
+
+    extractor_results: List[Dict] = []
+    for batch_size in args.batch_size if args.ranks else []:
+        for ranks in args.ranks:
+            result = benchmark_extractor(args.filename, ranks, batch_size, args)
+            extractor_results.append(result)
+            print(f"{ranks:>3} ranks (batch {batch_size}): {result['mb_per_second']:8.1f} MB/s, "
+                  f"{result['records_per_second']:10.0f} records/s in {result['seconds']:.1f}s")
+            for rank in result["rank_list"]:
+                print(f"    rank {rank['rank']:>3}: {rank['mb_per_second']:8.1f} MB/s, "
+                      f"{rank['records_per_second']:10.0f} records/s, utilization {100 * rank['utilization']:.1f}%")
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, datetime.datetime.now().strftime("benchmark-%Y-%m-%d_%H-%M-%S.json"))
+    save_results(output, {
+        "file": os.path.basename(tw_filepath),
+        "file_size": tw_file_size,
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "parsers": parser_results,
+        "extractor": extractor_results,
+    })
+    print(f"results saved to {output}")
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,459 @@
+"""
+Script Name: compressed_reader.py
+Description: This script reads compressed twitter files at any uncompressed position.
+    A file is compressed as independent blocks: gzip members listed in a sidecar index
+    (<file>.idx), or zstd frames listed in the seek table of the zstd seekable format.
+    Each worker only decompresses the blocks of its own search range, a window at a time.
+Usage:
+    python3 compressed_reader.py compress ../data/twitter-100gb.json --format zstd
+    gzip -dc ../data/twitter-100gb.json.gz | python3 compressed_reader.py compress - --output ../data/twitter-100gb.json.zst
+    python3 compressed_reader.py index ../data/twitter-100gb.json.gz
+"""
+
+import io
+import os
+import sys
+import gzip
+import json
+import zlib
+import struct
+import argparse
+
+from bisect import bisect_right
+
+from typing import (
+    BinaryIO,
+    List,
+    Optional,
+    Tuple,
+)
+
+# zstandard is an optional dependency, only needed for .zst files
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# suffixes of the supported compressed files
+GZIP_SUFFIX = ".gz"
+ZSTD_SUFFIX = ".zst"
+# sidecar index listing the members of a gzip file
+GZIP_INDEX_SUFFIX = ".idx"
+
+# constants of the zstd seekable format
+ZSTD_SKIPPABLE_MAGIC = 0x184D2A5E
+ZSTD_SEEKABLE_MAGIC = 0x8F92EAB1
+ZSTD_SEEK_TABLE_FOOTER_SIZE = 9
+
+# a block is (compressed offset, compressed size, uncompressed offset, uncompressed size)
+Block = Tuple[int, int, int, int]
+
+# a block is decompressed as a stream, keeping about this many uncompressed bytes in memory
+WINDOW_SIZE = 2**24
+# number of compressed bytes fed to the decompressor at a time
+COMPRESSED_CHUNK_SIZE = 2**20
+# a gzip member larger than this (uncompressed) should be recompressed into blocks
+MAX_BLOCK_SIZE = 2**30
+
+
+def is_compressed(filepath: str) -> bool:
+    """
+    Check whether a twitter file is compressed.
+
+    Args:
+        filepath (str): twitter file path
+
+    Returns:
+        bool: whether the file is a gzip or zstd file
+    """
+    return filepath.endswith(GZIP_SUFFIX) or filepath.endswith(ZSTD_SUFFIX)
+
+
+def build_gzip_index(filepath: str) -> List[Block]:
+    """
+    Find the members of a gzip file with one sequential decompression pass.
+    A file with a single member (as written by gzip) can be read, but not decompressed in parallel.
+
+    Args:
+        filepath (str): gzip file path
+
+    Returns:
+        List[Block]: blocks of the file
+    """
+    blocks = []
+    compressed_offset = 0
+    uncompressed_offset = 0
+    with io.open(filepath, 'rb') as file:
+        decompressor = zlib.decompressobj(wbits=31)
+        member_start = 0
+        member_size = 0
+        while True:
+            data = file.read(2**24)
+            if not data:
+                break
+            while data:
+                member_size += len(decompressor.decompress(data))
+                if not decompressor.eof:
+                    compressed_offset += len(data)
+                    break
+                # the member ends inside this piece of data, the rest belongs to the next member
+                compressed_offset += len(data) - len(decompressor.unused_data)
+                blocks.append((member_start, compressed_offset - member_start, uncompressed_offset, member_size))
+                uncompressed_offset += member_size
+                member_start = compressed_offset
+                member_size = 0
+                data = decompressor.unused_data
+                decompressor = zlib.decompressobj(wbits=31)
+    return blocks
+
+
+def save_gzip_index(filepath: str, blocks: List[Block]) -> None:
+    """
+    Save the sidecar index of a gzip file.
+
+    Args:
+        filepath (str): gzip file path
+        blocks (List[Block]): blocks of the file
+    """
+    with open(f"{filepath}{GZIP_INDEX_SUFFIX}", 'w', encoding='utf-8') as json_file:
+        json.dump({"blocks": blocks}, json_file)
+
+
+def load_gzip_index(filepath: str) -> List[Block]:
+    """
+    Load the sidecar index of a gzip file.
+
+    Args:
+        filepath (str): gzip file path
+
+    Raises:
+        Exception: when the index has not been built
+
+    Returns:
+        List[Block]: blocks of the file
+    """
+    index_path = f"{filepath}{GZIP_INDEX_SUFFIX}"
+    if not os.path.exists(index_path):
+        raise Exception(f"Error: build the block index first: python3 compressed_reader.py index {filepath}")
+    with open(index_path, 'r', encoding='utf-8') as json_file:
+        return [tuple(block) for block in json.load(json_file)["blocks"]]
+
+
+def read_zstd_seek_table(file: BinaryIO) -> List[Block]:
+    """
+    Read the seek table at the end of a file in the zstd seekable format.
+
+    Args:
+        file (BinaryIO): zstd file opened in binary mode
+
+    Raises:
+        Exception: when the file has no seek table
+
+    Returns:
+        List[Block]: blocks (frames) of the file
+    """
+    file.seek(-ZSTD_SEEK_TABLE_FOOTER_SIZE, os.SEEK_END)
+    frame_count, descriptor, magic = struct.unpack("<IBI", file.read(ZSTD_SEEK_TABLE_FOOTER_SIZE))
+    if magic != ZSTD_SEEKABLE_MAGIC:
+        raise Exception("Error: the zstd file is not in the seekable format!")
+    # every entry has a compressed and a decompressed size, and an optional checksum
+    entry_size = 12 if descriptor & 0x80 else 8
+    file.seek(-ZSTD_SEEK_TABLE_FOOTER_SIZE - frame_count * entry_size, os.SEEK_END)
+    table = file.read(frame_count * entry_size)
+    blocks = []
+    compressed_offset = 0
+    uncompressed_offset = 0
+    for i in range(frame_count):
+        compressed_size, uncompressed_size = struct.unpack_from("<II", table, i * entry_size)
+        blocks.append((compressed_offset, compressed_size, uncompressed_offset, uncompressed_size))
+        compressed_offset += compressed_size
+        uncompressed_offset += uncompressed_size
+    return blocks
+
+
+class SeekableCompressedReader:
+    """
+    SeekableCompressedReader is a class used to read a compressed twitter file like a plain binary file.
+    Positions are uncompressed positions, only the blocks being read are decompressed.
+    """
+    def __init__(self, filepath: str) -> None:
+        """
+        Initialize the class and load the block index of the file.
+
+        Args:
+            filepath (str): gzip or zstd file path
+
+        Raises:
+            Exception: when zstandard is not installed for a zstd file
+        """
+        self.filepath = filepath
+        self.file = io.open(filepath, 'rb')
+        if filepath.endswith(ZSTD_SUFFIX):
+            if zstandard is None:
+                raise Exception("Error: zstandard is required to read .zst files!")
+            self.blocks = read_zstd_seek_table(self.file)
+        else:
+            self.blocks = load_gzip_index(filepath)
+        self.block_starts = [block[2] for block in self.blocks]
+        self.size = self.blocks[-1][2] + self.blocks[-1][3] if self.blocks else 0
+        self.pos = 0
+        # the block being decompressed, its decompressor and the next compressed bytes to feed it
+        self.block_index = -1
+        self.decompressor = None
+        self.compressed_pos = 0
+        self.compressed_left = 0
+        # the last decompressed window of the block and its uncompressed position,
+        # consecutive reads mostly hit the same window
+        self.window_start = 0
+        self.window = b""
+
+
+    def start_block(self, index: int) -> None:
+        """
+        Start decompressing a block from its beginning.
+
+        Args:
+            index (int): index of the block
+        """
+        compressed_offset, compressed_size, uncompressed_offset, _ = self.blocks[index]
+        if self.filepath.endswith(ZSTD_SUFFIX):
+            self.decompressor = zstandard.ZstdDecompressor().decompressobj()
+        else:
+            self.decompressor = zlib.decompressobj(wbits=31)
+        self.block_index = index
+        self.compressed_pos = compressed_offset
+        self.compressed_left = compressed_size
+        self.window_start = uncompressed_offset
+        self.window = b""
+
+
+    def decompress_window(self) -> bytes:
+        """
+        Decompress the next window of the current block.
+
+        Returns:
+            bytes: about WINDOW_SIZE uncompressed bytes, empty at the end of the block
+        """
+        parts = []
+        size = 0
+        while size < WINDOW_SIZE and self.compressed_left > 0:
+            self.file.seek(self.compressed_pos)
+            data = self.file.read(min(COMPRESSED_CHUNK_SIZE, self.compressed_left))
+            if not data:
+                break
+            self.compressed_pos += len(data)
+            self.compressed_left -= len(data)
+            part = self.decompressor.decompress(data)
+            if self.compressed_left == 0:
+                part += self.decompressor.flush()
+            parts.append(part)
+            size += len(part)
+        return b"".join(parts)
+
+
+    def load_window(self, index: int, pos: int) -> Tuple[int, bytes]:
+        """
+        Decompress the window of a block holding an uncompressed position.
+        Only moving backwards restarts the block, so a block is never held in memory as a whole.
+
+        Args:
+            index (int): index of the block
+            pos (int): uncompressed position inside the block
+
+        Raises:
+            Exception: when the block ends before the position
+
+        Returns:
+            Tuple[int, bytes]: uncompressed position and data of the window
+        """
+        if index != self.block_index or pos < self.window_start:
+            self.start_block(index)
+        while pos >= self.window_start + len(self.window):
+            self.window_start += len(self.window)
+            self.window = self.decompress_window()
+            if not self.window:
+                raise Exception(f"Error: block {index} of {self.filepath} is shorter than its index says!")
+        return self.window_start, self.window
+
+
+    def seek(self, pos: int, whence: int = os.SEEK_SET) -> int:
+        """
+        Move to an uncompressed position.
+
+        Args:
+            pos (int): uncompressed position, relative to whence
+            whence (int): os.SEEK_SET, os.SEEK_CUR or os.SEEK_END
+
+        Returns:
+            int: the new uncompressed position
+        """
+        if whence == os.SEEK_CUR:
+            pos += self.pos
+        elif whence == os.SEEK_END:
+            pos += self.size
+        self.pos = max(0, pos)
+        return self.pos
+
+
+    def tell(self) -> int:
+        """
+        Get the uncompressed position.
+
+        Returns:
+            int: the uncompressed position
+        """
+        return self.pos
+
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        Read uncompressed data from the current position.
+
+        Args:
+            size (int): number of bytes to read, until the end of file if negative
+
+        Returns:
+            bytes: uncompressed data
+        """
+        if size < 0:
+            size = self.size - self.pos
+        parts = []
+        while size > 0 and self.pos < self.size:
+            index = bisect_right(self.block_starts, self.pos) - 1
+            window_start, data = self.load_window(index, self.pos)
+            offset = self.pos - window_start
+            part = data[offset:offset + size]
+            parts.append(part)
+            self.pos += len(part)
+            size -= len(part)
+        return b"".join(parts)
+
+
+    def readline(self) -> bytes:
+        """
+        Read uncompressed data from the current position until the end of the line.
+
+        Returns:
+            bytes: uncompressed line, including its delimiter
+        """
+        parts = []
+        while self.pos < self.size:
+            index = bisect_right(self.block_starts, self.pos) - 1
+            window_start, data = self.load_window(index, self.pos)
+            offset = self.pos - window_start
+            end = data.find(b"\n", offset) + 1
+            parts.append(data[offset:end or len(data)])
+            self.pos = window_start + (end or len(data))
+            if end:
+                break
+        return b"".join(parts)
+
+
+    def close(self) -> None:
+        """
+        Close the compressed file.
+        """
+        self.file.close()
+
+
+    def __enter__(self) -> "SeekableCompressedReader":
+        return self
+
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def compress_file(filepath: str, compress_format: str, block_size: int, output_path: Optional[str] = None) -> str:
+    """
+    Compress a twitter file as independent blocks that end on record boundaries.
+    A gzip file gets its sidecar index, a zstd file gets a seek table.
+    The file is read sequentially, so it can be a stream, e.g. an existing archive
+    decompressed to the standard input.
+
+    Args:
+        filepath (str): plain twitter file path, "-" for the standard input
+        compress_format (str): "gzip" or "zstd"
+        block_size (int): approximate number of uncompressed bytes of a block
+        output_path (Optional[str]): compressed file path, the file path with the suffix of the format by default
+
+    Raises:
+        Exception: when zstandard is not installed for the zstd format, or the output path does not fit
+
+    Returns:
+        str: compressed file path
+    """
+    if compress_format == "zstd" and zstandard is None:
+        raise Exception("Error: zstandard is required to write .zst files!")
+    suffix = ZSTD_SUFFIX if compress_format == "zstd" else GZIP_SUFFIX
+    if output_path is None and filepath == "-":
+        raise Exception("Error: an output path is required to compress the standard input!")
+    compressed_path = output_path or f"{filepath}{suffix}"
+    # the reader finds the format of a file from its suffix
+    if not compressed_path.endswith(suffix):
+        raise Exception(f"Error: a {compress_format} file path must end with {suffix}!")
+    blocks = []
+    compressed_offset = 0
+    uncompressed_offset = 0
+    file = sys.stdin.buffer if filepath == "-" else io.open(filepath, 'rb')
+    with file, io.open(compressed_path, 'wb') as compressed_file:
+        compressor = zstandard.ZstdCompressor(write_content_size=True) if compress_format == "zstd" else None
+        while True:
+            # complete the last record of the block
+            data = file.read(block_size)
+            if not data:
+                break
+            if not data.endswith(b"\n"):
+                data += file.readline()
+            if compressor is not None:
+                compressed = compressor.compress(data)
+            else:
+                compressed = gzip.compress(data)
+            compressed_file.write(compressed)
+            blocks.append((compressed_offset, len(compressed), uncompressed_offset, len(data)))
+            compressed_offset += len(compressed)
+            uncompressed_offset += len(data)
+        if compressor is not None:
+            # the seek table is a skippable frame, ignored by regular zstd decoders
+            table = b"".join(struct.pack("<II", block[1], block[3]) for block in blocks)
+            table += struct.pack("<IBI", len(blocks), 0, ZSTD_SEEKABLE_MAGIC)
+            compressed_file.write(struct.pack("<II", ZSTD_SKIPPABLE_MAGIC, len(table)) + table)
+    if compressor is None:
+        save_gzip_index(compressed_path, blocks)
+    return compressed_path
+
+
+def main() -> None:
+    """
+    Main code for compressing a twitter file or indexing a gzip file
+    """
+    parser = argparse.ArgumentParser(description="compress or index twitter files")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    compress_parser = subparsers.add_parser("compress", help="compress a twitter file as independent blocks")
+    compress_parser.add_argument("filepath", type=str, help="plain twitter file path, - for the standard input")
+    compress_parser.add_argument("--format", type=str, choices=["gzip", "zstd"], default="zstd")
+    compress_parser.add_argument("--block-size", type=int, default=2**26,
+                                 help="approximate number of uncompressed bytes of a block")
+    compress_parser.add_argument("--output", type=str, default=None,
+                                 help="compressed file path, <filepath>.zst or <filepath>.gz by default")
+    index_parser = subparsers.add_parser("index", help="build the block index of an existing gzip file")
+    index_parser.add_argument("filepath", type=str, help="gzip twitter file path")
+    args = parser.parse_args()
+
+    if args.command == "compress":
+        print(compress_file(args.filepath, args.format, args.block_size, args.output))
+    else:
+        blocks = build_gzip_index(args.filepath)
+        save_gzip_index(args.filepath, blocks)
+        print(f"{len(blocks)} blocks indexed")
+        # every worker decompresses a member from its start up to its own range
+        largest = max((block[3] for block in blocks), default=0)
+        if len(blocks) == 1 or largest > MAX_BLOCK_SIZE:
+            print(f"WARNING: the largest member holds {largest / 2**20:.0f} MB uncompressed, the workers "
+                  "cannot share it and each of them decompresses it up to its range. Recompress the file "
+                  f"as blocks: gzip -dc {args.filepath} | python3 compressed_reader.py compress - "
+                  f"--output {args.filepath[:-len(GZIP_SUFFIX)]}{ZSTD_SUFFIX}", file=sys.stderr)
+
+if __name__=="__main__":
+    main()
@@ -12,3 +12,9 @@ DATA_DIR = os.path.join(PROJECT_DIR, "data")
 RESULTS_DIR = os.path.join(PROJECT_DIR, "results")
 
 
+
+# credentials of Elasticsearch, used by the elasticsearch stream sink
+ES_USERNAME = "elastic"
+ES_PASSWORD = "elastic"
+# CA certificate of Elasticsearch, the certificate is not verified without it (port-forwarded cluster)
+ES_CA_CERTS = None
@@ -0,0 +1,296 @@
+"""
+Script Name: dedupe.py
+Description: This script drops the tweets whose id has already been extracted, across the shards of every worker.
+    The ids written to each shard are kept as int64 in a compact sidecar (a sorted numpy array once loaded),
+    ids are hash-partitioned between the workers, and the first record of an id
+    (lowest segment, then lowest position in the shard) is kept.
+"""
+
+import os
+import json
+
+from array import array
+
+from typing import (
+    Dict,
+    List,
+    Tuple,
+    Union,
+)
+
+# numpy is only needed by the dedupe stage (main.py --dedupe)
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# pyarrow is only needed to rewrite parquet or arrow shards
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+# a record is keyed by its segment (high 32 bits) and its position in the shard (low 32 bits)
+ORDINAL_BITS = 32
+
+
+class IdRecorder:
+    """
+    IdRecorder is a class used to record the id of every tweet written to a shard, as a compact int64 array.
+    The ids are saved next to the checkpoint of the segment when the shard is closed.
+    """
+    def __init__(self, writer, ids_path: str) -> None:
+        """
+        Initialize the class.
+
+        Args:
+            writer: shard writer of the segment
+            ids_path (str): path of the id sidecar of the segment
+
+        Raises:
+            Exception: when numpy is not installed
+        """
+        if np is None:
+            raise Exception("Error: numpy is required by --dedupe!")
+        self.writer = writer
+        self.ids_path = ids_path
+        self.ids = array("q")
+
+
+    def write(self, record: Dict) -> None:
+        """
+        Record the id of one extracted tweet and write it to the shard.
+
+        Args:
+            record (Dict): extracted tweet
+        """
+        self.ids.append(int(record["id"]))
+        self.writer.write(record)
+
+
+    def close(self) -> Dict[str, Union[str, int]]:
+        """
+        Close the shard, then save the ids of its tweets.
+
+        Returns:
+            Dict[str, Union[str, int]]: shard file name, number of records and size in bytes
+        """
+        shard = self.writer.close()
+        with open(f"{self.ids_path}.tmp", 'wb') as ids_file:
+            self.ids.tofile(ids_file)
+        os.replace(f"{self.ids_path}.tmp", self.ids_path)
+        return shard
+
+
+def count_records(shard_path: str, shard_format: str) -> int:
+    """
+    Count the tweets of a shard, from the metadata of parquet and arrow shards.
+
+    Args:
+        shard_path (str): shard file path
+        shard_format (str): format of the shard
+
+    Returns:
+        int: number of records in the shard
+    """
+    if shard_format == "jsonl":
+        with open(shard_path, 'rb') as shard_file:
+            return sum(1 for _ in shard_file)
+    if shard_format == "parquet":
+        return pyarrow.parquet.ParquetFile(shard_path).metadata.num_rows
+    with pyarrow.ipc.open_file(pyarrow.memory_map(shard_path)) as reader:
+        return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+
+
+def load_ids(ids_path: str, shard_path: str, shard_format: str) -> "np.ndarray":
+    """
+    Load the ids of the tweets of a shard, in shard order.
+    A shard written without --dedupe has no sidecar, its ids are read from the shard itself.
+    So is a shard whose sidecar does not hold one id per record, e.g. when a rewrite by drop_records
+    was interrupted after replacing the shard, the shard is then the reference.
+
+    Args:
+        ids_path (str): path of the id sidecar of the segment
+        shard_path (str): shard file path
+        shard_format (str): format of the shard
+
+    Returns:
+        np.ndarray: int64 ids
+    """
+    if os.path.exists(ids_path):
+        ids = np.fromfile(ids_path, dtype=np.int64)
+        if len(ids) == count_records(shard_path, shard_format):
+            return ids
+    if shard_format == "jsonl":
+        with open(shard_path, 'r', encoding='utf-8') as shard_file:
+            return np.array([int(json.loads(line)["id"]) for line in shard_file], dtype=np.int64)
+    return read_table(shard_path, shard_format).column("id").to_numpy().astype(np.int64)
+
+
+def key_records(segment_indices: List[int], id_list: List["np.ndarray"]) -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    Concatenate the ids of some segments, and key every record by its segment and its position in the shard.
+
+    Args:
+        segment_indices (List[int]): indices of the segments
+        id_list (List[np.ndarray]): int64 ids of every segment, in shard order
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: int64 ids and keys of the records
+    """
+    if not id_list:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    keys = [(index << ORDINAL_BITS) + np.arange(len(ids), dtype=np.int64)
+            for index, ids in zip(segment_indices, id_list)]
+    return np.concatenate(id_list), np.concatenate(keys)
+
+
+def split_duplicates(duplicates: "np.ndarray") -> Dict[int, "np.ndarray"]:
+    """
+    Group the keys of the duplicate records by segment.
+
+    Args:
+        duplicates (np.ndarray): keys of the duplicate records
+
+    Returns:
+        Dict[int, np.ndarray]: positions in the shard of the duplicates of every segment
+    """
+    segments = duplicates >> ORDINAL_BITS
+    ordinals = duplicates & ((1 << ORDINAL_BITS) - 1)
+    return {index: ordinals[segments == index] for index in np.unique(segments).tolist()}
+
+
+def find_duplicates(ids: "np.ndarray", keys: "np.ndarray") -> "np.ndarray":
+    """
+    Find the records whose id is held by a record with a lower key.
+
+    Args:
+        ids (np.ndarray): int64 ids of the records
+        keys (np.ndarray): int64 keys (segment and ordinal) of the records
+
+    Returns:
+        np.ndarray: keys of the duplicate records
+    """
+    # sort by id, then by key, so the record kept is the first of its id
+    order = np.lexsort((keys, ids))
+    ids = ids[order]
+    keys = keys[order]
+    return keys[1:][ids[1:] == ids[:-1]]
+
+
+def exchange_duplicates(comm, ids: "np.ndarray", keys: "np.ndarray") -> "np.ndarray":
+    """
+    Find the duplicate records across every worker, collective over all workers.
+    Every id is sent to the worker owning its hash, which finds the duplicates of its ids.
+    The duplicate keys are then sent back to the worker owning their segment (segment % size).
+
+    Args:
+        comm (MPI.Comm): MPI communicator of the workers
+        ids (np.ndarray): int64 ids of the records of this worker
+        keys (np.ndarray): int64 keys (segment and ordinal) of the records of this worker
+
+    Returns:
+        np.ndarray: keys of the duplicate records of this worker
+    """
+    size = comm.Get_size()
+    owners = (ids.view(np.uint64) * np.uint64(0x9E3779B97F4A7C15) >> np.uint64(32)) % np.uint64(size)
+    ids, keys = alltoallv(comm, owners, ids, keys)
+    duplicates = find_duplicates(ids, keys)
+    owners = (duplicates >> ORDINAL_BITS) % size
+    duplicates, = alltoallv(comm, owners, duplicates)
+    return duplicates
+
+
+def alltoallv(comm, owners: "np.ndarray", *columns: "np.ndarray") -> list:
+    """
+    Send every row of the int64 columns to the worker owning it, collective over all workers.
+
+    Args:
+        comm (MPI.Comm): MPI communicator of the workers
+        owners (np.ndarray): rank owning each row
+        columns (np.ndarray): int64 columns, one value per row
+
+    Returns:
+        list: the columns of the rows received from every worker
+    """
+    size = comm.Get_size()
+    order = np.argsort(owners, kind="stable")
+    send_counts = np.bincount(owners.astype(np.int64), minlength=size).astype(np.int64)
+    recv_counts = np.empty(size, dtype=np.int64)
+    comm.Alltoall(send_counts, recv_counts)
+    send_displs = np.concatenate(([0], np.cumsum(send_counts)[:-1]))
+    recv_displs = np.concatenate(([0], np.cumsum(recv_counts)[:-1]))
+    received = []
+    for column in columns:
+        recv_buffer = np.empty(int(recv_counts.sum()), dtype=np.int64)
+        comm.Alltoallv([np.ascontiguousarray(column[order]), (send_counts, send_displs)],
+                       [recv_buffer, (recv_counts, recv_displs)])
+        received.append(recv_buffer)
+    return received
+
+
+def read_table(shard_path: str, shard_format: str) -> "pyarrow.Table":
+    """
+    Read a parquet or arrow shard.
+
+    Args:
+        shard_path (str): shard file path
+        shard_format (str): "parquet" or "arrow"
+
+    Returns:
+        pyarrow.Table: the tweets of the shard
+    """
+    if shard_format == "parquet":
+        return pyarrow.parquet.read_table(shard_path)
+    with pyarrow.ipc.open_file(shard_path) as reader:
+        return reader.read_all()
+
+
+def drop_records(shard_path: str,
+                 shard_format: str,
+                 ids_path: str,
+                 ids: "np.ndarray",
+                 ordinals: "np.ndarray") -> int:
+    """
+    Rewrite a shard and its id sidecar without the records at some positions.
+    The sidecar is replaced after the shard, load_ids detects a stale sidecar if the rewrite is interrupted.
+
+    Args:
+        shard_path (str): shard file path
+        shard_format (str): format of the shard
+        ids_path (str): path of the id sidecar of the segment
+        ids (np.ndarray): int64 ids of the shard from load_ids, which the positions refer to
+        ordinals (np.ndarray): positions of the records to drop
+
+    Raises:
+        Exception: when the shard does not hold one record per id
+
+    Returns:
+        int: size of the rewritten shard in bytes
+    """
+    records = count_records(shard_path, shard_format)
+    if records != len(ids):
+        raise Exception(f"Error: {shard_path} has {records} records but {len(ids)} ids were deduplicated, "
+                        "run the dedupe again!")
+    keep = np.ones(len(ids), dtype=bool)
+    keep[ordinals] = False
+    if shard_format == "jsonl":
+        with open(shard_path, 'r', encoding='utf-8') as shard_file, \
+                open(f"{shard_path}.tmp", 'w', encoding='utf-8') as tmp_file:
+            for line, kept in zip(shard_file, keep):
+                if kept:
+                    tmp_file.write(line)
+    else:
+        table = read_table(shard_path, shard_format).filter(pyarrow.array(keep))
+        if shard_format == "parquet":
+            pyarrow.parquet.write_table(table, f"{shard_path}.tmp", compression="zstd")
+        else:
+            with pyarrow.ipc.new_file(f"{shard_path}.tmp", table.schema) as writer:
+                writer.write_table(table)
+    os.replace(f"{shard_path}.tmp", shard_path)
+    ids[keep].tofile(f"{ids_path}.tmp")
+    os.replace(f"{ids_path}.tmp", ids_path)
+    return os.path.getsize(shard_path)
@@ -0,0 +1,617 @@
+"""
+Script Name: driver.py
+Description: This script holds the command-line arguments and the helpers shared by
+    the MPI (main.py) and the multiprocessing (main_local.py) twitter extractors.
+"""
+
+import os
+import glob
+import json
+import time
+import argparse
+import datetime
+import logging
+import resource
+
+# import typing for readability and maintenance
+from typing import (
+    Iterable,
+    Tuple,
+    List,
+    Dict,
+    Optional,
+    Union
+    )
+
+# import configs
+from config import (
+    RESULTS_DIR,
+    DATA_DIR
+    )
+
+# import TweetProcess class defined in tweet_process.py
+from tweet_process import (
+    TweetProcess,
+    find_record_start,
+    split_segments,
+    open_twitter_file,
+    get_file_size,
+    PARSERS
+    )
+from shard_writer import open_shard_writer, SHARD_FORMATS
+from generate_data import SYNTHETIC_PREFIX
+from stream_sink import StreamSink, TeeWriter, open_stream_sink, SINKS
+from dedupe import IdRecorder, load_ids, key_records, find_duplicates, exchange_duplicates, split_duplicates, drop_records
+from tweet_filter import TweetFilter, FIELDS, TOPICS_FIELD
+from topic_tagger import TOPICS
+
+
+logger = logging.getLogger(__name__)
+
+# time a worker spends in each stage, as measured by TweetProcess
+STAGES = ["read_seconds", "scan_seconds", "assembly_seconds"]
+
+# twitter files are looked up with these suffixes, compressed files need a block index
+TWITTER_FILE_SUFFIXES = [".json", ".json.zst", ".json.gz"]
+
+
+def parse_time(value: str) -> str:
+    """
+    Check an ISO 8601 time of the command line, and normalize it to the prefix of the tweet times.
+    The tweet times are in UTC, so are times given with an offset.
+
+    Args:
+        value (str): date or time, e.g. 2021-06-01 or 2021-06-01T12:00:00+10:00
+
+    Raises:
+        argparse.ArgumentTypeError: when the value is not an ISO 8601 date or time
+
+    Returns:
+        str: "YYYY-MM-DD" for a date, "YYYY-MM-DDTHH:MM:SS" for a time
+    """
+    try:
+        # fromisoformat only accepts the Z of UTC from python 3.11
+        time_value = datetime.datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith("Z") else value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value!r} is not an ISO 8601 date or time, e.g. 2021-06-01")
+    if len(value) == len("YYYY-MM-DD"):
+        return time_value.strftime("%Y-%m-%d")
+    if time_value.tzinfo is not None:
+        time_value = time_value.astimezone(datetime.timezone.utc)
+    return time_value.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Build the command-line arguments shared by the twitter extractors.
+
+    Returns:
+        argparse.ArgumentParser: The argument parser
+    """
+    # parsing command-line argument "filename" with argparse
+    parser = argparse.ArgumentParser(description="the twitter filename")
+    parser.add_argument("filename", type=str, help="")
+    parser.add_argument("--batch-size", type=int, default=2**30,
+                        help="number of bytes each worker reads and processes at a time")
+    parser.add_argument("--mmap", action="store_true",
+                        help="scan a memory-mapped view of the file instead of reading copies (plain files only)")
+    parser.add_argument("--parser", type=str, choices=PARSERS, default="regex",
+                        help="record parser, json uses orjson when it is installed")
+    # static gives each worker one equal range, dynamic hands out small segments on demand
+    parser.add_argument("--schedule", type=str, choices=["static", "dynamic"], default="static",
+                        help="how the file is shared between workers")
+    parser.add_argument("--segment-size", type=int, default=2**28,
+                        help="number of bytes of a segment in the dynamic schedule")
+    parser.add_argument("--format", type=str, choices=list(SHARD_FORMATS), default="jsonl",
+                        help="shard format, parquet and arrow write typed columns and need pyarrow")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip the segments completed by a previous run with the same options")
+    # every worker can also stream its tweets to the ingestion pipeline while scanning
+    parser.add_argument("--sink", type=str, choices=list(SINKS), default=None,
+                        help="also send the tweets to the enqueue function or to Elasticsearch")
+    parser.add_argument("--sink-url", type=str, default=None,
+                        help="url of the sink, http://localhost:9090 or https://127.0.0.1:9200 by default")
+    parser.add_argument("--sink-index", type=str, default="twitter",
+                        help="Elasticsearch index name of the tweets")
+    parser.add_argument("--sink-topic", type=str, default="topic-twitter",
+                        help="kafka topic of the enqueue sink")
+    parser.add_argument("--sink-batch-size", type=int, default=500,
+                        help="number of tweets sent at a time")
+    parser.add_argument("--sink-in-flight", type=int, default=4,
+                        help="number of batches a worker keeps waiting to be sent before it stops scanning")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="drop repeated tweet ids across all shards once every segment is done, "
+                             "needs numpy and the id field (tweets already sent to a sink are not dropped)")
+    # filter and projection applied by every worker while scanning
+    parser.add_argument("--lang", type=str, nargs="+", default=None,
+                        help="languages to keep, all languages by default")
+    parser.add_argument("--no-geo", dest="require_geo", action="store_false",
+                        help="also keep tweets without a bbox, not supported by the comb parser")
+    parser.add_argument("--since", type=parse_time, default=None,
+                        help="keep tweets created at or after this UTC ISO 8601 time, e.g. 2021-06-01")
+    parser.add_argument("--until", type=parse_time, default=None,
+                        help="keep tweets created before this UTC ISO 8601 time")
+    parser.add_argument("--bbox", type=float, nargs=4, default=None,
+                        metavar=("MIN_LON", "MIN_LAT", "MAX_LON", "MAX_LAT"),
+                        help="keep tweets whose bbox center is inside this bbox")
+    parser.add_argument("--fields", type=str, nargs="+", choices=FIELDS + [TOPICS_FIELD], default=None,
+                        help="fields written for each tweet, all fields by default")
+    # topics are keywords tagged in the text of every tweet kept, as whole words and ignoring case
+    parser.add_argument("--topics", type=str, nargs="*", default=None,
+                        help=f"tag these topics in a topics field, {' '.join(TOPICS)} if no topic is given")
+    parser.add_argument("--topics-only", action="store_true",
+                        help="keep only the tweets mentioning a topic")
+    return parser
+
+
+def get_tweet_filter(args: argparse.Namespace) -> TweetFilter:
+    """
+    Build the tweet filter from the command-line arguments.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments
+
+    Raises:
+        Exception: when the fields leave out the lang of tweets of every language,
+            or tweets without a bbox are asked from the comb parser
+
+    Returns:
+        TweetFilter: filter and projection applied by every worker
+    """
+    # the uploader filters on lang, unless the manifest says the extractor already did
+    if args.fields and "lang" not in args.fields and not args.lang:
+        raise Exception("Error: --fields needs the lang field unless --lang is given!")
+    # the comb pattern only matches records with a bbox
+    if not args.require_geo and args.parser == "comb":
+        raise Exception("Error: --no-geo is not supported by the comb parser!")
+    return TweetFilter(args.lang, args.require_geo, args.since, args.until, args.bbox, args.fields,
+                       args.topics, args.topics_only)
+
+
+def get_twitter_file_info(tw_filename: str) -> Tuple[str, str, int]:
+    """
+    Read the input filename and get ready for later process.
+
+    Args:
+        tw_filename (str): twitter file name
+
+    Raises:
+        Exception: The input filename should in ["twitter-100gb", "twitter-50mb", "twitter-1mb"],
+            or be a synthetic file made by generate_data.py
+
+    Returns:
+        Tuple[str, str, int]: A tuple contains filename, filepath and size of file
+    """
+    # check if filename is valid
+    if tw_filename not in ["twitter-100gb", "twitter-50mb", "twitter-1mb"] \
+            and not tw_filename.startswith(SYNTHETIC_PREFIX):
+        raise Exception("Error: the input filename is not valid!")
+
+    # then obtain the filepath, file_size, a plain file is preferred over a compressed one
+    tw_filepath = os.path.join(DATA_DIR, f"{tw_filename}.json")
+    for suffix in TWITTER_FILE_SUFFIXES:
+        if os.path.exists(os.path.join(DATA_DIR, f"{tw_filename}{suffix}")):
+            tw_filepath = os.path.join(DATA_DIR, f"{tw_filename}{suffix}")
+            break
+    tw_file_size = get_file_size(tw_filepath)
+    return tw_filename, tw_filepath, tw_file_size
+
+
+def get_search_pos_range(tw_filepath: str,
+                         tw_file_size: int,
+                         process_size: int,
+                         process_rank: int) -> Tuple[int, int]:
+    """
+    For each worker, find the search range of file. 
+    Different workers should process different segments.
+    Both ends of the range are moved forward to the next record boundary,
+    so neighbouring workers never split a record between them.
+
+    Args:
+        tw_filepath (str): file path of twitter file
+        tw_file_size (int): file size of twitter file
+        process_size (int): MPI number of workers
+        process_rank (int): MPI current worker rank
+
+    Returns:
+        Tuple[int, int]: A search range tuple
+    """
+    file_size_per_process= tw_file_size // process_size
+    min_search_pos = file_size_per_process * process_rank
+    max_search_pos = file_size_per_process * (process_rank + 1)
+    # last worker needs to read until end of file
+    if process_rank == (process_size - 1):
+        max_search_pos = tw_file_size
+    with open_twitter_file(tw_filepath) as file:
+        min_search_pos = find_record_start(file, min_search_pos)
+        max_search_pos = find_record_start(file, max_search_pos)
+    return min_search_pos, max_search_pos
+
+
+def get_segments(tw_filepath: str,
+                 tw_file_size: int,
+                 args: argparse.Namespace,
+                 process_size: int) -> List[Tuple[int, int]]:
+    """
+    Cut the file into the segments of the schedule: one per worker in the static schedule,
+    many small ones handed out on demand in the dynamic schedule.
+
+    Args:
+        tw_filepath (str): file path of twitter file
+        tw_file_size (int): file size of twitter file
+        args (argparse.Namespace): The parsed arguments
+        process_size (int): number of workers
+
+    Returns:
+        List[Tuple[int, int]]: record-aligned search ranges of the segments
+    """
+    if args.schedule == "dynamic":
+        return split_segments(tw_filepath, tw_file_size, args.segment_size)
+    return [get_search_pos_range(tw_filepath, tw_file_size, process_size, rank)
+            for rank in range(process_size)]
+
+
+def process_segments(tw_filepath: str,
+                     segments: Iterable[Tuple[int, Tuple[int, int]]],
+                     shard_dir: str,
+                     tweet_filter: TweetFilter,
+                     args: argparse.Namespace,
+                     sink: Optional[StreamSink] = None) -> Dict[str, Union[int, float]]:
+    """
+    Process the segments given to a worker one after another.
+    Every segment streams its results to its own shard, and to the sink if any, then is checkpointed.
+
+    Args:
+        tw_filepath (str): file path of twitter file
+        segments (Iterable[Tuple[int, Tuple[int, int]]]): indices and search ranges of the segments
+        shard_dir (str): shard directory path
+        tweet_filter (TweetFilter): filter and projection applied while scanning
+        args (argparse.Namespace): The parsed arguments
+        sink (Optional[StreamSink]): sink kept open by the caller across calls, e.g. by a pool worker,
+            otherwise the sink of args is opened and closed here
+
+    Returns:
+        Dict[str, Union[int, float]]: number of segments, scanned bytes, records, busy time,
+            stage times and peak resident memory of the worker
+    """
+    busy_seconds = 0.0
+    segment_count = 0
+    scanned_bytes = 0
+    records = 0
+    stage_seconds = dict.fromkeys(STAGES, 0.0)
+    if args.dedupe and "id" not in tweet_filter.fields:
+        raise Exception("Error: --dedupe needs the id field!")
+    own_sink = sink is None
+    if own_sink:
+        sink = open_stream_sink(args.sink, args.sink_url, args.sink_index, args.sink_topic,
+                                args.sink_batch_size, args.sink_in_flight)
+    for segment_index, (min_search_pos, max_search_pos) in segments:
+        segment_start_time = time.perf_counter()
+        shard_path = os.path.join(shard_dir, f"part-{segment_index:05d}.{SHARD_FORMATS[args.format]}")
+        writer = open_shard_writer(shard_path, args.format, tweet_filter.fields)
+        if sink is not None:
+            writer = TeeWriter(writer, sink)
+        if args.dedupe:
+            writer = IdRecorder(writer, get_ids_path(shard_dir, segment_index))
+        tp = TweetProcess(tw_filepath, min_search_pos, max_search_pos, args.batch_size, args.mmap,
+                          writer, args.parser, tweet_filter)
+        tp.process()
+        shard = writer.close()
+        shard.update({
+            "segment": segment_index,
+            "min_search_pos": min_search_pos,
+            "max_search_pos": max_search_pos,
+        })
+        save_checkpoint(shard_dir, shard)
+        busy_seconds += time.perf_counter() - segment_start_time
+        segment_count += 1
+        scanned_bytes += max_search_pos - min_search_pos
+        records += shard["records"]
+        for stage in STAGES:
+            stage_seconds[stage] += tp.stats[stage]
+    if own_sink and sink is not None:
+        close_stream_sink(sink, args.sink)
+    return {
+        "segments": segment_count,
+        "scanned_bytes": scanned_bytes,
+        "records": records,
+        "busy_seconds": busy_seconds,
+        **stage_seconds,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10,
+    }
+
+
+def close_stream_sink(sink: StreamSink, sink_name: str) -> None:
+    """
+    Close the sink of a worker and log what it sent.
+
+    Args:
+        sink (StreamSink): sink of the worker
+        sink_name (str): one of SINKS
+    """
+    sent = sink.close()
+    logger.info("%s tweets sent to the %s sink in %s batches", sent["records"], sink_name, sent["batches"])
+
+
+def get_shard_dir(tw_filename: str) -> str:
+    """
+    Get the directory holding the output shards of every worker, create it if needed.
+
+    Args:
+        tw_filename (str): twitter file name
+
+    Returns:
+        str: shard directory path
+    """
+    shard_dir = os.path.join(RESULTS_DIR, tw_filename, "twitter")
+    os.makedirs(shard_dir, exist_ok=True)
+    return shard_dir
+
+
+def get_checkpoint_dir(shard_dir: str) -> str:
+    """
+    Get the directory holding the checkpoint of the run, create it if needed.
+
+    Args:
+        shard_dir (str): shard directory path
+
+    Returns:
+        str: checkpoint directory path
+    """
+    checkpoint_dir = os.path.join(shard_dir, "checkpoint")
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    return checkpoint_dir
+
+
+def save_json(path: str, obj: Dict) -> None:
+    """
+    Save an object to json file atomically, a crash never leaves a partial file behind.
+
+    Args:
+        path (str): json file path
+        obj (Dict): object to save
+    """
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as json_file:
+        json.dump(obj, json_file, indent=4)
+    os.replace(f"{path}.tmp", path)
+
+
+def get_ids_path(shard_dir: str, segment_index: int) -> str:
+    """
+    Get the path of the id sidecar of a segment, kept with its checkpoint.
+
+    Args:
+        shard_dir (str): shard directory path
+        segment_index (int): index of the segment
+
+    Returns:
+        str: id sidecar path
+    """
+    return os.path.join(get_checkpoint_dir(shard_dir), f"segment-{segment_index:05d}.ids")
+
+
+def save_checkpoint(shard_dir: str, shard: Dict) -> None:
+    """
+    Record a completed segment and its shard in the checkpoint.
+
+    Args:
+        shard_dir (str): shard directory path
+        shard (Dict): shard description of the completed segment
+    """
+    checkpoint_dir = get_checkpoint_dir(shard_dir)
+    save_json(os.path.join(checkpoint_dir, f"segment-{shard['segment']:05d}.json"), shard)
+
+
+def load_checkpoint(shard_dir: str) -> List[Dict]:
+    """
+    Load the shard descriptions of every completed segment.
+
+    Args:
+        shard_dir (str): shard directory path
+
+    Returns:
+        List[Dict]: shard descriptions, in segment order
+    """
+    shard_list = []
+    for path in sorted(glob.glob(os.path.join(get_checkpoint_dir(shard_dir), "segment-*.json"))):
+        with open(path, 'r', encoding='utf-8') as json_file:
+            shard_list.append(json.load(json_file))
+    return shard_list
+
+
+def prepare_checkpoint(shard_dir: str,
+                       segments: List[Tuple[int, int]],
+                       tweet_filter: TweetFilter,
+                       shard_format: str,
+                       resume: bool) -> List[int]:
+    """
+    Start the checkpoint of a new run, or pick up the one of a previous run.
+    A new run removes the shards and checkpoint left by previous runs.
+
+    Args:
+        shard_dir (str): shard directory path
+        segments (List[Tuple[int, int]]): search ranges of the segments
+        tweet_filter (TweetFilter): filter applied by the workers
+        shard_format (str): format of the shards
+        resume (bool): whether to skip the segments completed by a previous run
+
+    Raises:
+        Exception: when the previous run used different segments, filter or format
+
+    Returns:
+        List[int]: indices of the segments still to process
+    """
+    checkpoint_dir = get_checkpoint_dir(shard_dir)
+    run_path = os.path.join(checkpoint_dir, "run.json")
+    run = {
+        "segments": [list(segment) for segment in segments],
+        "filter": tweet_filter.describe(),
+        "format": shard_format,
+    }
+    completed = set()
+    if resume and os.path.exists(run_path):
+        with open(run_path, 'r', encoding='utf-8') as json_file:
+            if json.load(json_file) != run:
+                raise Exception("Error: the checkpoint was made with different segments, filter or format!")
+        # a segment is only skipped if its shard is still there as it was written
+        completed = {shard["segment"] for shard in load_checkpoint(shard_dir)
+                     if os.path.exists(os.path.join(shard_dir, shard["path"]))
+                     and os.path.getsize(os.path.join(shard_dir, shard["path"])) == shard["bytes"]}
+    else:
+        for pattern in ["part-*", "manifest.json", "summary.json", os.path.join("checkpoint", "*")]:
+            for path in glob.glob(os.path.join(shard_dir, pattern)):
+                os.remove(path)
+        save_json(run_path, run)
+    return [index for index in range(len(segments)) if index not in completed]
+
+
+def report_utilization(worker_list: List[Dict]) -> None:
+    """
+    Add the utilization of every worker to its report and log it.
+    The utilization is the time a worker spent processing over the wall time of the slowest worker.
+
+    Args:
+        worker_list (List[Dict]): reports gathered from different workers
+    """
+    wall_seconds = max((worker["wall_seconds"] for worker in worker_list), default=0.0)
+    for worker in worker_list:
+        worker["utilization"] = worker["busy_seconds"] / wall_seconds if wall_seconds else 1.0
+        logger.info("worker=%s processed %s segments (%s bytes) in %.1fs busy, utilization=%.1f%%",
+                    worker["rank"], worker["segments"], worker["scanned_bytes"],
+                    worker["busy_seconds"], 100 * worker["utilization"])
+        logger.info("worker=%s spent %.1fs reading, %.1fs scanning, %.1fs assembling records, peak rss=%.0fMB",
+                    worker["rank"], worker["read_seconds"], worker["scan_seconds"],
+                    worker["assembly_seconds"], worker["peak_rss_mb"])
+
+
+def save_summary(shard_dir: str, worker_list: List[Dict]) -> None:
+    """
+    Reduce the reports of every worker into a summary saved to json file.
+    The stage shares tell whether the run is bound by reading (I/O) or by scanning (regex).
+
+    Args:
+        shard_dir (str): shard directory path
+        worker_list (List[Dict]): reports gathered from different workers
+    """
+    wall_seconds = max((worker["wall_seconds"] for worker in worker_list), default=0.0)
+    scanned_bytes = sum(worker["scanned_bytes"] for worker in worker_list)
+    stage_seconds = {stage: sum(worker[stage] for worker in worker_list) for stage in STAGES}
+    total_seconds = sum(stage_seconds.values())
+    summary = {
+        "workers": len(worker_list),
+        "wall_seconds": wall_seconds,
+        "scanned_bytes": scanned_bytes,
+        "records": sum(worker["records"] for worker in worker_list),
+        "mb_per_second": scanned_bytes / 2**20 / wall_seconds if wall_seconds else 0.0,
+        **stage_seconds,
+        "stage_shares": {stage: seconds / total_seconds if total_seconds else 0.0
+                         for stage, seconds in stage_seconds.items()},
+        "peak_rss_mb": max((worker["peak_rss_mb"] for worker in worker_list), default=0.0),
+        "worker_list": [{
+            "rank": worker["rank"],
+            "scanned_bytes": worker["scanned_bytes"],
+            "records": worker["records"],
+            "busy_seconds": worker["busy_seconds"],
+            **{stage: worker[stage] for stage in STAGES},
+            "mb_per_second": worker["scanned_bytes"] / 2**20 / worker["busy_seconds"] if worker["busy_seconds"] else 0.0,
+            "peak_rss_mb": worker["peak_rss_mb"],
+        } for worker in worker_list],
+    }
+    save_json(os.path.join(shard_dir, "summary.json"), summary)
+
+
+def dedupe_segments(shard_dir: str,
+                    segment_indices: Iterable[int],
+                    shard_format: str,
+                    comm=None) -> Dict[str, int]:
+    """
+    Drop the tweets whose id is already in an earlier record, and update the checkpoint of the rewritten shards.
+    With MPI every worker passes the segments it owns for the dedupe (index % size == rank),
+    and the ids are exchanged between the workers. Without MPI all segments are passed at once.
+
+    Args:
+        shard_dir (str): shard directory path
+        segment_indices (Iterable[int]): indices of the segments owned by this worker
+        shard_format (str): format of the shards
+        comm (MPI.Comm): MPI communicator of the workers, None for a single process
+
+    Returns:
+        Dict[str, int]: number of records checked and duplicates dropped in the segments of this worker
+    """
+    shards = {shard["segment"]: shard for shard in load_checkpoint(shard_dir)}
+    segment_indices = [index for index in segment_indices if index in shards]
+    id_list = [load_ids(get_ids_path(shard_dir, index), os.path.join(shard_dir, shards[index]["path"]), shard_format)
+               for index in segment_indices]
+    ids, keys = key_records(segment_indices, id_list)
+    if comm is None:
+        duplicates = find_duplicates(ids, keys)
+    else:
+        duplicates = exchange_duplicates(comm, ids, keys)
+
+    # rewrite the shards holding duplicates, their checkpoint keeps --resume consistent
+    shard_ids = dict(zip(segment_indices, id_list))
+    for index, ordinals in split_duplicates(duplicates).items():
+        shard = shards[index]
+        shard["bytes"] = drop_records(os.path.join(shard_dir, shard["path"]), shard_format,
+                                      get_ids_path(shard_dir, index), shard_ids[index], ordinals)
+        shard["records"] = len(shard_ids[index]) - len(ordinals)
+        shard["duplicates"] = shard.get("duplicates", 0) + len(ordinals)
+        save_checkpoint(shard_dir, shard)
+    return {
+        "records": len(ids),
+        "duplicates": len(duplicates),
+    }
+
+
+def report_dedupe(shard_list: List[Dict]) -> Dict[str, Union[int, float]]:
+    """
+    Sum the duplicates dropped from every shard and log the duplicate rate.
+    The checkpoint of a shard counts the duplicates of every run, so a resumed run reports the whole dedupe.
+
+    Args:
+        shard_list (List[Dict]): shard descriptions of every segment, from the checkpoint
+
+    Returns:
+        Dict[str, Union[int, float]]: records checked, duplicates dropped and duplicate rate
+    """
+    duplicates = sum(shard.get("duplicates", 0) for shard in shard_list)
+    records = sum(shard["records"] for shard in shard_list) + duplicates
+    dedupe = {
+        "records": records,
+        "duplicates": duplicates,
+        "duplicate_rate": duplicates / records if records else 0.0,
+    }
+    logger.info("dedupe dropped %s of %s records (duplicate rate=%.3f%%)",
+                duplicates, records, 100 * dedupe["duplicate_rate"])
+    return dedupe
+
+
+def save_manifest(shard_dir: str,
+                  shard_list: List[Dict],
+                  worker_list: List[Dict],
+                  tweet_filter: TweetFilter,
+                  shard_format: str,
+                  dedupe: Optional[Dict] = None) -> None:
+    """
+    Save the manifest describing the output shards to json file.
+
+    Args:
+        shard_dir (str): shard directory path
+        shard_list (List[Dict]): shard descriptions of every segment
+        worker_list (List[Dict]): reports gathered from different workers
+        tweet_filter (TweetFilter): filter applied by the workers
+        shard_format (str): format of the shards
+        dedupe (Optional[Dict]): dedupe report, None if the run did not dedupe
+    """
+    manifest = {
+        "records": sum(shard["records"] for shard in shard_list),
+        "bytes": sum(shard["bytes"] for shard in shard_list),
+        "filter": tweet_filter.describe(),
+        "format": shard_format,
+        "shards": shard_list,
+        "workers": worker_list,
+    }
+    if dedupe is not None:
+        manifest["dedupe"] = dedupe
+    save_json(os.path.join(shard_dir, "manifest.json"), manifest)
@@ -0,0 +1,196 @@
+"""
+Script Name: generate_data.py
+Description: This script writes a synthetic twitter file in the same layout as the real one,
+    so the extractor can be benchmarked without the 100GB file.
+    Every row is a CouchDB row on its own line, the file opens with the total_rows line and ends with "]}".
+Usage:
+    python3 generate_data.py synthetic-1gb --size 1073741824
+    python3 generate_data.py synthetic-1gb --size 1073741824 --geo-density 0.02 --langs en=0.6 es=0.1 ja=0.1 und=0.2
+"""
+
+import os
+import json
+import random
+import argparse
+import datetime
+
+from typing import (
+    Dict,
+    List,
+    Tuple,
+)
+
+# import configs
+from config import DATA_DIR
+
+
+# generated files are named synthetic-*, so they can be passed to main.py like the real files
+SYNTHETIC_PREFIX = "synthetic-"
+
+# words of the tweet texts, with quotes, escapes and non-ascii characters like the real tweets
+WORDS = [
+    "the", "a", "to", "is", "in", "and", "of", "for", "on", "my", "you", "this", "just", "today",
+    "Melbourne", "Sydney", "Brisbane", "Perth", "Adelaide", "Telstra", "Optus", "Vodafone",
+    "EV", "Tesla", "BYD", "5G", "AI", "outage", "network", "love", "new", "coffee", "footy",
+    "\"quoted\"", "line\nbreak", "back\\slash", "café", "☃", "😀", "#auspol", "@someone",
+]
+
+# bboxes of places around Australia, (min lon, min lat, max lon, max lat)
+PLACES = [
+    ("Melbourne, Victoria", [144.593741856, -38.433859306, 145.512528832, -37.5112737225]),
+    ("Sydney, New South Wales", [150.520928608, -34.1183470085, 151.343020992, -33.578140996]),
+    ("Brisbane, Queensland", [152.668522848, -27.767440994, 153.31787024, -26.996844991]),
+    ("Perth, Western Australia", [115.617614368, -32.675715325, 116.239023008, -31.6244855145]),
+    ("Adelaide, South Australia", [138.44212992, -35.348970061, 138.780189824, -34.652564053]),
+]
+
+START_TIME = datetime.datetime(2021, 6, 21, tzinfo=datetime.timezone.utc)
+END_TIME = datetime.datetime(2022, 12, 31, tzinfo=datetime.timezone.utc)
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parse the command-line arguments.
+
+    Returns:
+        argparse.Namespace: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="generate a synthetic twitter file")
+    parser.add_argument("filename", type=str,
+                        help=f"file name in the data directory (starting with {SYNTHETIC_PREFIX}), or a file path")
+    parser.add_argument("--size", type=int, default=2**30,
+                        help="approximate number of bytes of the file")
+    parser.add_argument("--geo-density", type=float, default=0.02,
+                        help="fraction of tweets with a place bbox")
+    parser.add_argument("--langs", type=str, nargs="+", default=["en=0.7", "es=0.05", "ja=0.05", "und=0.2"],
+                        help="language mix as lang=weight pairs")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed of the random generator, the same seed gives the same file")
+    return parser.parse_args()
+
+
+def get_output_path(tw_filename: str) -> str:
+    """
+    Find where to write the synthetic file.
+
+    Args:
+        tw_filename (str): file name in the data directory, or a file path
+
+    Raises:
+        Exception: when a file name in the data directory does not start with SYNTHETIC_PREFIX
+
+    Returns:
+        str: output file path
+    """
+    if os.path.dirname(tw_filename) or tw_filename.endswith(".json"):
+        return tw_filename
+    # never overwrite the real twitter files of the data directory
+    if not tw_filename.startswith(SYNTHETIC_PREFIX):
+        raise Exception(f"Error: synthetic file names should start with {SYNTHETIC_PREFIX}!")
+    return os.path.join(DATA_DIR, f"{tw_filename}.json")
+
+
+def parse_langs(langs: List[str]) -> Tuple[List[str], List[float]]:
+    """
+    Parse the language mix.
+
+    Args:
+        langs (List[str]): lang=weight pairs
+
+    Returns:
+        Tuple[List[str], List[float]]: languages and their weights
+    """
+    pairs = [lang.split("=") for lang in langs]
+    return [pair[0] for pair in pairs], [float(pair[1]) if len(pair) > 1 else 1.0 for pair in pairs]
+
+
+def generate_row(rng: random.Random, tweet_id: int, lang: str, geo: bool) -> Dict:
+    """
+    Generate one CouchDB row of a tweet.
+
+    Args:
+        rng (random.Random): random generator
+        tweet_id (int): 19 digit tweet id
+        lang (str): language of the tweet
+        geo (bool): whether the tweet has a place bbox
+
+    Returns:
+        Dict: the row
+    """
+    tid = str(tweet_id)
+    created_at = START_TIME + (END_TIME - START_TIME) * rng.random()
+    text = " ".join(rng.choices(WORDS, k=rng.randint(3, 40)))
+    data = {
+        "author_id": str(rng.randrange(10**17, 10**18)),
+        "conversation_id": tid,
+        "created_at": created_at.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+        "entities": {
+            "mentions": [{"start": 0, "end": 9, "username": f"user{rng.randrange(10**6)}",
+                          "id": str(rng.randrange(10**17, 10**18))} for _ in range(rng.randint(0, 3))],
+        },
+        "lang": lang,
+        "public_metrics": {"retweet_count": rng.randint(0, 50), "reply_count": rng.randint(0, 10),
+                           "like_count": rng.randint(0, 200), "quote_count": 0},
+        "text": text,
+        "sentiment": round(rng.uniform(-1, 1), 4),
+    }
+    doc = {"_id": tid, "_rev": f"1-{rng.getrandbits(128):032x}", "data": data}
+    if geo:
+        name, bbox = rng.choice(PLACES)
+        data["geo"] = {"place_id": f"{rng.getrandbits(64):016x}"}
+        doc["includes"] = {"places": [{"full_name": name, "geo": {"type": "Feature", "bbox": bbox, "properties": {}},
+                                       "id": data["geo"]["place_id"], "name": name.split(",")[0], "place_type": "city"}]}
+    return {
+        "id": tid,
+        "key": [str(created_at.year), str(created_at.month), str(created_at.day), tid],
+        "value": {"text": text},
+        "doc": doc,
+    }
+
+
+def generate_file(filepath: str, size: int, geo_density: float, langs: List[str], seed: int) -> int:
+    """
+    Write a synthetic twitter file of about size bytes.
+
+    Args:
+        filepath (str): output file path
+        size (int): approximate number of bytes of the file
+        geo_density (float): fraction of tweets with a place bbox
+        langs (List[str]): language mix as lang=weight pairs
+        seed (int): seed of the random generator
+
+    Returns:
+        int: number of rows written
+    """
+    rng = random.Random(seed)
+    lang_list, lang_weights = parse_langs(langs)
+    rows = 0
+    with open(filepath, 'wb') as file:
+        # the number of rows is only known at the end, it is written in a fixed width field
+        header = '{"total_rows":%20d,"offset":0,"rows":[\n'
+        file.write((header % 0).encode('utf-8'))
+        line = b""
+        while file.tell() + len(line) < size or not rows:
+            if line:
+                file.write(line + b",\n")
+            row = generate_row(rng, 1400000000000000000 + rows, rng.choices(lang_list, lang_weights)[0],
+                               rng.random() < geo_density)
+            line = json.dumps(row, separators=(',', ':')).encode('utf-8')
+            rows += 1
+        file.write(line + b"\n]}\n")
+        file.seek(0)
+        file.write((header % rows).encode('utf-8'))
+    return rows
+
+
+def main() -> None:
+    """
+    Main code for generating a synthetic twitter file.
+    """
+    args = parse_args()
+    filepath = get_output_path(args.filename)
+    rows = generate_file(filepath, args.size, args.geo_density, args.langs, args.seed)
+    print(f"{filepath}: {rows} rows, {os.path.getsize(filepath) / 2**20:.1f} MB")
+
+if __name__=="__main__":
+    main()
@@ -5,11 +5,20 @@ Authors:
     Ze Pang (955698) 
 Usage:
     python3 main.py twitter-100gb
+    python3 main.py twitter-100gb --batch-size 268435456
+    python3 main.py twitter-100gb --mmap
+    python3 main.py twitter-100gb --parser json
+    python3 main.py twitter-100gb --lang en --since 2021-06-01 --fields id text time p1 p2 p3 p4
+    python3 main.py twitter-100gb --schedule dynamic --segment-size 134217728
+    python3 main.py twitter-100gb --schedule dynamic --resume
+    python3 main.py twitter-100gb --format parquet
+    python3 main.py twitter-100gb --schedule dynamic --dedupe
+    python3 main.py twitter-100gb --lang en --topics --topics-only
+    python3 main.py twitter-100gb --lang en --sink enqueue --sink-topic topic-twitter
 """
 
 import os
-import json
-import argparse
+import time
 import datetime
 import logging
 
@@ -22,19 +31,32 @@ from typing import (
     Tuple,
     List,
     Dict,
+    Iterator,
     Union
     )
 
 # import configs
-from config import (
-    RESULTS_DIR,
-    DATA_DIR,
-    LOGS_DIR
+from config import LOGS_DIR
+
+# import TweetProcess helpers defined in tweet_process.py
+from tweet_process import bin2str
+# import helpers shared with the multiprocessing extractor
+from driver import (
+    build_parser,
+    get_tweet_filter,
+    get_twitter_file_info,
+    get_segments,
+    process_segments,
+    get_shard_dir,
+    prepare_checkpoint,
+    load_checkpoint,
+    report_utilization,
+    save_manifest,
+    save_summary,
+    dedupe_segments,
+    report_dedupe
     )
 
-# import TweetProcess class defined in tweet_process.py
-from tweet_process import TweetProcess, bin2str
-
 
 from mpi4py import MPI
 
@@ -47,54 +69,70 @@ logging.basicConfig(filename=os.path.join(LOGS_DIR, log_filename),
 logger = logging.getLogger(__name__)
 
 
-def get_twitter_file_info() -> Tuple[str, str, int]:
+class SegmentCounter:
     """
-    Read the input filename and get ready for later process.
-
-    Raises:
-        Exception: The input filename should in ["twitter-100gb", "twitter-50mb", "twitter-1mb"]
-
-    Returns:
-        Tuple[str, str, int]: A tuple contains filename, filepath and size of file
+    SegmentCounter is a class used to hand out segment indices to the workers on demand.
+    The counter lives in an MPI window on rank 0, every worker increments it atomically.
     """
-    # parsing command-line argument "filename" with argparse
-    parser = argparse.ArgumentParser(description="the twitter filename")
-    parser.add_argument("filename", type=str, help="")
-    args = parser.parse_args()
-    tw_filename = args.filename
-
-    # check if filename is valid
-    if tw_filename not in ["twitter-100gb", "twitter-50mb", "twitter-1mb"]:
-        raise Exception("Error: the input filename is not valid!")
-
-    # then obtain the filepath, file_size
-    tw_filepath = os.path.join(DATA_DIR, f"{tw_filename}.json")
-    tw_file_size = os.stat(tw_filepath).st_size
-    return tw_filename, tw_filepath, tw_file_size
-
-
-def get_search_pos_range(tw_file_size: int,
-                         process_size: int,
-                         process_rank: int) -> Tuple[int, int]:
+    def __init__(self, comm: MPI.Comm) -> None:
+        """
+        Initialize the class, collective over all workers.
+
+        Args:
+            comm (MPI.Comm): MPI communicator of the workers
+        """
+        self.itemsize = MPI.INT64_T.Get_size()
+        # the window memory is allocated by MPI, Win.Create fails on a single worker with some MPI builds
+        self.win = MPI.Win.Allocate(self.itemsize if comm.Get_rank() == 0 else 0, self.itemsize, comm=comm)
+        if comm.Get_rank() == 0:
+            self.win.Lock(0, MPI.LOCK_EXCLUSIVE)
+            self.win.Put([bytearray(self.itemsize), MPI.INT64_T], 0)
+            self.win.Unlock(0)
+        # no worker claims a segment before the counter is zeroed
+        comm.Barrier()
+        self.increment = (1).to_bytes(self.itemsize, "little", signed=True)
+
+
+    def next(self) -> int:
+        """
+        Claim the next segment.
+
+        Returns:
+            int: index of the claimed segment
+        """
+        result = bytearray(self.itemsize)
+        self.win.Lock(0, MPI.LOCK_SHARED)
+        self.win.Fetch_and_op([self.increment, MPI.INT64_T], [result, MPI.INT64_T], 0, 0, MPI.SUM)
+        self.win.Unlock(0)
+        return int.from_bytes(result, "little", signed=True)
+
+
+    def free(self) -> None:
+        """
+        Free the MPI window, collective over all workers.
+        """
+        self.win.Free()
+
+
+def iter_dynamic_segments(segments: List[Tuple[int, int]],
+                          pending: List[int],
+                          counter: SegmentCounter) -> Iterator[Tuple[int, Tuple[int, int]]]:
     """
-    For each worker, find the search range of file. 
-    Different workers should process different segments.
+    Keep claiming segments for the current worker until all pending ones have been handed out.
 
     Args:
-        tw_file_size (int): file size of twitter file
-        process_size (int): MPI number of workers
-        process_rank (int): MPI current worker rank
+        segments (List[Tuple[int, int]]): search ranges of all segments
+        pending (List[int]): indices of the segments still to process
+        counter (SegmentCounter): shared segment counter
 
-    Returns:
-        Tuple[int, int]: A search range tuple
+    Yields:
+        Iterator[Tuple[int, Tuple[int, int]]]: indices and search ranges claimed by the current worker
     """
-    file_size_per_process= tw_file_size // process_size
-    min_search_pos = file_size_per_process * process_rank
-    max_search_pos = file_size_per_process * (process_rank + 1)
-    # last worker needs to read until end of file
-    if process_rank == (process_size - 1):
-        max_search_pos = tw_file_size
-    return min_search_pos, max_search_pos
+    while True:
+        index = counter.next()
+        if index >= len(pending):
+            return
+        yield pending[index], segments[pending[index]]
 
 
 def merge_dicts(list_of_dict: List[DefaultDict]) -> Dict[str, Union[int, float]]:
@@ -114,22 +152,6 @@ def merge_dicts(list_of_dict: List[DefaultDict]) -> Dict[str, Union[int, float]]
     return {bin2str(key_w_max_val):merged_dict[key_w_max_val]}
 
 
-def save_dict(tw_filename: str, result_filename: str, final_list: List) -> None:
-    """
-    Save dictionary to json file.
-
-    Args:
-        tw_filename (str): twitter file name 
-        result_filename (str): file name of json file
-        result_dict (Dict): dictionary object
-    """
-    with open(os.path.join(RESULTS_DIR, tw_filename, result_filename),
-              'w', encoding='utf-8') as json_file:
-        for item in final_list:
-            json.dump(item, json_file)
-            json_file.write("\n")
-
-
 def main() -> None:
     """
     Main code for reading and processing twitter file with MPI4PY
@@ -140,31 +162,57 @@ def main() -> None:
     process_rank = comm.Get_rank()
 
     # get twitter file info
-    tw_filename, tw_filepath, tw_file_size = get_twitter_file_info()
+    args = build_parser().parse_args()
+    tw_filename, tw_filepath, tw_file_size = get_twitter_file_info(args.filename)
     logger.info("the worker=%s has read %s.json (file_size=%s) successfully!", process_rank, tw_filename, tw_file_size)
 
-    # assign jobs to each worker
-    min_search_pos, max_search_pos = get_search_pos_range(tw_file_size, process_size, process_rank)
-    logger.info("the search range for worker=%s is (%s, %s)", process_rank, min_search_pos, max_search_pos)
-
-    # start processing
-    tp = TweetProcess(tw_filepath, min_search_pos, max_search_pos)
-    results = tp.process()
-    logger.info("the subtask for worker=%s has finished!", process_rank)
+    # cut the file into segments and find those not completed by a previous run
+    shard_dir = get_shard_dir(tw_filename)
+    tweet_filter = get_tweet_filter(args)
+    segments, pending = None, None
+    if process_rank == 0:
+        segments = get_segments(tw_filepath, tw_file_size, args, process_size)
+        pending = prepare_checkpoint(shard_dir, segments, tweet_filter, args.format, args.resume)
+        logger.info("the file is cut into %s segments, %s to process", len(segments), len(pending))
+    segments, pending = comm.bcast((segments, pending), root=0)
 
-    # gather result dictionaries from different workers
-    results_list = comm.gather(results, root=0)
+    # assign jobs to each worker
+    counter = None
+    if args.schedule == "dynamic":
+        counter = SegmentCounter(comm)
+        search_ranges = iter_dynamic_segments(segments, pending, counter)
+    else:
+        logger.info("the search range for worker=%s is %s", process_rank, segments[process_rank])
+        search_ranges = [(process_rank, segments[process_rank])] if process_rank in pending else []
+
+    # start processing, every segment streams its results to its own shard
+    start_time = time.perf_counter()
+    worker = process_segments(tw_filepath, search_ranges, shard_dir, tweet_filter, args)
+    worker["rank"] = process_rank
+    worker["wall_seconds"] = time.perf_counter() - start_time
+    logger.info("the subtask for worker=%s has finished %s segments!", process_rank, worker["segments"])
+    if counter is not None:
+        counter.free()
+
+    # drop repeated tweet ids once every shard has been written
+    if args.dedupe:
+        comm.Barrier()
+        dedupe_segments(shard_dir, range(process_rank, len(segments), process_size), args.format, comm)
+
+    # gather reports (not the results) from different workers
+    worker_list = comm.gather(worker, root=0)
     if process_rank == 0:
-        logger.info("results gathered to master!")
-        final_list = []
-        for lst in results_list:
-            final_list += lst
-        save_dict(tw_filename, "twitter.jsonl", final_list)
+        logger.info("worker reports gathered to master!")
+        shard_list = load_checkpoint(shard_dir)
+        report_utilization(worker_list)
+        dedupe = report_dedupe(shard_list) if args.dedupe else None
+        save_manifest(shard_dir, shard_list, worker_list, tweet_filter, args.format, dedupe)
+        save_summary(shard_dir, worker_list)
 
-        logger.info("results have been saved successfully!")
+        logger.info("manifest of %s shards has been saved successfully!", len(shard_list))
 
     # Finalize MPI
     MPI.Finalize()
 
 if __name__=="__main__":
-    main()
+    main()
\ No newline at end of file
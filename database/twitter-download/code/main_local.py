@@ -0,0 +1,177 @@
+"""
+Script Name: main_local.py
+Description: This script processes a twitter file with all the cores of a single machine,
+    using a process pool instead of MPI4PY. The output is the same as main.py.
+Usage:
+    python3 main_local.py twitter-100gb
+    python3 main_local.py twitter-100gb --workers 16 --schedule dynamic
+    python3 main_local.py twitter-100gb --workers 16 --schedule dynamic --resume
+"""
+
+import os
+import time
+import argparse
+import datetime
+import logging
+import multiprocessing.util
+
+from concurrent.futures import ProcessPoolExecutor
+
+# import typing for readability and maintenance
+from typing import (
+    Tuple,
+    List,
+    Dict,
+    Optional
+    )
+
+# import configs
+from config import LOGS_DIR
+
+from tweet_filter import TweetFilter
+from stream_sink import StreamSink, open_stream_sink
+# import helpers shared with the MPI extractor
+from driver import (
+    build_parser,
+    get_tweet_filter,
+    get_twitter_file_info,
+    get_segments,
+    process_segments,
+    close_stream_sink,
+    get_shard_dir,
+    prepare_checkpoint,
+    load_checkpoint,
+    report_utilization,
+    save_manifest,
+    save_summary,
+    dedupe_segments,
+    report_dedupe,
+    STAGES
+    )
+
+
+# use logger for debugging and tracking the process
+log_filename = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S.log")
+logging.basicConfig(filename=os.path.join(LOGS_DIR, log_filename), 
+                    level=logging.INFO, 
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+# sink of the pool worker, shared by all of its segments like the sink of an MPI worker
+worker_sink: Optional[StreamSink] = None
+
+
+def init_worker(args: argparse.Namespace) -> None:
+    """
+    Open the sink of a pool worker once, so that its segments share the batches in flight and the connection.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments
+    """
+    global worker_sink
+    worker_sink = open_stream_sink(args.sink, args.sink_url, args.sink_index, args.sink_topic,
+                                   args.sink_batch_size, args.sink_in_flight)
+    if worker_sink is not None:
+        # pool workers do not run atexit handlers, multiprocessing finalizers run when they exit
+        multiprocessing.util.Finalize(None, close_stream_sink, args=(worker_sink, args.sink), exitpriority=10)
+
+
+def process_segment(tw_filepath: str,
+                    segment_index: int,
+                    search_range: Tuple[int, int],
+                    shard_dir: str,
+                    tweet_filter: TweetFilter,
+                    args: argparse.Namespace) -> Dict:
+    """
+    Process one segment in a pool worker, streaming its results to its own shard.
+
+    Args:
+        tw_filepath (str): file path of twitter file
+        segment_index (int): index of the segment in the file
+        search_range (Tuple[int, int]): record-aligned search range of the segment
+        shard_dir (str): shard directory path
+        tweet_filter (TweetFilter): filter and projection applied while scanning
+        args (argparse.Namespace): The parsed arguments
+
+    Returns:
+        Dict: report of the segment
+    """
+    segment = process_segments(tw_filepath, [(segment_index, search_range)], shard_dir, tweet_filter, args,
+                               worker_sink)
+    segment["pid"] = os.getpid()
+    return segment
+
+
+def merge_segment_reports(segment_list: List[Dict], wall_seconds: float) -> List[Dict]:
+    """
+    Merge the reports of the segments into one report per pool worker.
+
+    Args:
+        segment_list (List[Dict]): reports of the segments
+        wall_seconds (float): wall time of the process pool
+
+    Returns:
+        List[Dict]: reports of the pool workers, ranked by their first segment
+    """
+    workers = {}
+    for segment in segment_list:
+        worker = workers.setdefault(segment["pid"], {
+            "rank": len(workers),
+            "segments": 0,
+            "scanned_bytes": 0,
+            "records": 0,
+            "busy_seconds": 0.0,
+            **dict.fromkeys(STAGES, 0.0),
+            "peak_rss_mb": 0.0,
+            "wall_seconds": wall_seconds,
+        })
+        for key in ["segments", "scanned_bytes", "records", "busy_seconds"] + STAGES:
+            worker[key] += segment[key]
+        worker["peak_rss_mb"] = max(worker["peak_rss_mb"], segment["peak_rss_mb"])
+    return list(workers.values())
+
+
+def main() -> None:
+    """
+    Main code for reading and processing twitter file with a process pool
+    """
+    parser = build_parser()
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="number of worker processes, all cores by default")
+    args = parser.parse_args()
+
+    # get twitter file info
+    tw_filename, tw_filepath, tw_file_size = get_twitter_file_info(args.filename)
+    logger.info("%s.json (file_size=%s) is processed by %s workers", tw_filename, tw_file_size, args.workers)
+
+    # cut the file into segments and find those not completed by a previous run
+    shard_dir = get_shard_dir(tw_filename)
+    tweet_filter = get_tweet_filter(args)
+    segments = get_segments(tw_filepath, tw_file_size, args, args.workers)
+    pending = prepare_checkpoint(shard_dir, segments, tweet_filter, args.format, args.resume)
+    logger.info("the file is cut into %s segments, %s to process", len(segments), len(pending))
+
+    # the pool hands the segments out to the workers as they become idle
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(args,)) as executor:
+        futures = [executor.submit(process_segment, tw_filepath, segment_index, segments[segment_index],
+                                   shard_dir, tweet_filter, args)
+                   for segment_index in pending]
+        segment_list = [future.result() for future in futures]
+    wall_seconds = time.perf_counter() - start_time
+
+    # drop repeated tweet ids once every shard has been written
+    if args.dedupe:
+        dedupe_segments(shard_dir, range(len(segments)), args.format)
+
+    shard_list = load_checkpoint(shard_dir)
+    dedupe = report_dedupe(shard_list) if args.dedupe else None
+    worker_list = merge_segment_reports(segment_list, wall_seconds)
+    report_utilization(worker_list)
+    save_manifest(shard_dir, shard_list, worker_list, tweet_filter, args.format, dedupe)
+    save_summary(shard_dir, worker_list)
+    logger.info("manifest of %s shards has been saved successfully!", len(shard_list))
+
+if __name__=="__main__":
+    main()
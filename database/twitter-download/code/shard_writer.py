@@ -0,0 +1,198 @@
+"""
+Script Name: shard_writer.py
+Description: This script writes the extracted tweets of each worker to its own shard.
+"""
+
+import os
+import json
+
+from typing import (
+    Dict,
+    List,
+    Union,
+)
+
+# pyarrow is an optional dependency, only needed for the columnar shard formats
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+# shard formats and the file extension of their shards
+SHARD_FORMATS = {
+    "jsonl": "jsonl",
+    "parquet": "parquet",
+    "arrow": "arrow",
+}
+
+
+class JsonlShardWriter:
+    """
+    JsonlShardWriter is a class used to stream extracted tweets into a jsonl shard.
+    The shard is written to a temporary file and only appears under its path once closed,
+    so a shard left by a crashed worker is never mistaken for a complete one.
+    """
+    def __init__(self, path: str) -> None:
+        """
+        Initialize the class and open the shard file.
+
+        Args:
+            path (str): shard file path
+        """
+        self.path = path
+        self.records = 0
+        self.file = open(f"{path}.tmp", 'w', encoding='utf-8')
+
+
+    def write(self, record: Dict) -> None:
+        """
+        Write one extracted tweet as a line of the shard.
+
+        Args:
+            record (Dict): extracted tweet
+        """
+        json.dump(record, self.file)
+        self.file.write("\n")
+        self.records += 1
+
+
+    def close(self) -> Dict[str, Union[str, int]]:
+        """
+        Close the shard file and describe it for the manifest.
+
+        Returns:
+            Dict[str, Union[str, int]]: shard file name, number of records and size in bytes
+        """
+        self.file.close()
+        os.replace(f"{self.path}.tmp", self.path)
+        return {
+            "path": os.path.basename(self.path),
+            "records": self.records,
+            "bytes": os.path.getsize(self.path),
+        }
+
+
+class ColumnarShardWriter:
+    """
+    ColumnarShardWriter is a class used to stream extracted tweets into a typed columnar shard,
+    either a Parquet file or an Arrow IPC file. Tweets are buffered by column and written
+    as one record batch (Parquet row group) every batch_size tweets.
+    The id is stored as int64, the time as a UTC timestamp, the bbox corners p1..p4 as float32
+    and the topics as a list of strings.
+    """
+    def __init__(self, path: str, fields: List[str], shard_format: str = "parquet", batch_size: int = 2**16) -> None:
+        """
+        Initialize the class and open the shard file.
+
+        Args:
+            path (str): shard file path
+            fields (List[str]): fields of the extracted tweets
+            shard_format (str): "parquet" or "arrow"
+            batch_size (int): number of tweets of a record batch
+
+        Raises:
+            Exception: when pyarrow is not installed
+        """
+        if pyarrow is None:
+            raise Exception(f"Error: pyarrow is required to write {shard_format} shards!")
+        self.path = path
+        self.records = 0
+        self.fields = fields
+        self.batch_size = batch_size
+        self.columns = {field: [] for field in fields}
+        self.schema = get_arrow_schema(fields)
+        if shard_format == "parquet":
+            self.writer = pyarrow.parquet.ParquetWriter(f"{path}.tmp", self.schema, compression="zstd")
+        else:
+            self.writer = pyarrow.ipc.new_file(f"{path}.tmp", self.schema)
+
+
+    def write(self, record: Dict) -> None:
+        """
+        Buffer one extracted tweet, and write the buffered tweets once a batch is full.
+
+        Args:
+            record (Dict): extracted tweet
+        """
+        for field in self.fields:
+            self.columns[field].append(record.get(field))
+        self.records += 1
+        if len(self.columns[self.fields[0]]) >= self.batch_size:
+            self.write_batch()
+
+
+    def write_batch(self) -> None:
+        """
+        Convert the buffered tweets to their column types and write them as one record batch.
+        """
+        arrays = []
+        for field in self.schema:
+            if pyarrow.types.is_list(field.type):
+                arrays.append(pyarrow.array(self.columns[field.name], field.type))
+            else:
+                # the parsers extract every field as a string, arrow casts them in bulk
+                arrays.append(pyarrow.array(self.columns[field.name], pyarrow.string()).cast(field.type))
+            self.columns[field.name].clear()
+        self.writer.write_batch(pyarrow.record_batch(arrays, schema=self.schema))
+
+
+    def close(self) -> Dict[str, Union[str, int]]:
+        """
+        Close the shard file and describe it for the manifest.
+
+        Returns:
+            Dict[str, Union[str, int]]: shard file name, number of records and size in bytes
+        """
+        if self.columns[self.fields[0]]:
+            self.write_batch()
+        self.writer.close()
+        os.replace(f"{self.path}.tmp", self.path)
+        return {
+            "path": os.path.basename(self.path),
+            "records": self.records,
+            "bytes": os.path.getsize(self.path),
+        }
+
+
+def get_arrow_schema(fields: List[str]) -> "pyarrow.Schema":
+    """
+    Get the arrow schema of the extracted tweets.
+
+    Args:
+        fields (List[str]): fields of the extracted tweets
+
+    Returns:
+        pyarrow.Schema: typed columns of the extracted tweets
+    """
+    types = {
+        "id": pyarrow.int64(),
+        "text": pyarrow.string(),
+        "time": pyarrow.timestamp("ms", tz="UTC"),
+        "lang": pyarrow.string(),
+        "p1": pyarrow.float32(),
+        "p2": pyarrow.float32(),
+        "p3": pyarrow.float32(),
+        "p4": pyarrow.float32(),
+        "topics": pyarrow.list_(pyarrow.string()),
+    }
+    return pyarrow.schema([(field, types[field]) for field in fields])
+
+
+def open_shard_writer(path: str, shard_format: str, fields: List[str]) -> Union[JsonlShardWriter, ColumnarShardWriter]:
+    """
+    Open the writer of a shard in the given format.
+
+    Args:
+        path (str): shard file path
+        shard_format (str): one of SHARD_FORMATS
+        fields (List[str]): fields of the extracted tweets
+
+    Returns:
+        Union[JsonlShardWriter, ColumnarShardWriter]: writer of the shard
+    """
+    if shard_format == "jsonl":
+        return JsonlShardWriter(path)
+    return ColumnarShardWriter(path, fields, shard_format)
@@ -0,0 +1,320 @@
+"""
+Script Name: stream_sink.py
+Description: This script streams the extracted tweets of a worker to the ingestion pipeline while it is scanning.
+    Tweets are grouped into batches and sent by a background thread, at most max_in_flight batches are
+    waiting at a time, so scanning (CPU) overlaps with sending (network) and memory stays bounded.
+"""
+
+import abc
+import json
+import queue
+import threading
+
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Union,
+)
+
+import requests
+
+# elasticsearch8 is only needed by the elasticsearch sink
+try:
+    from elasticsearch8 import Elasticsearch, helpers
+except ImportError:
+    Elasticsearch = None
+
+# import configs
+from config import ES_USERNAME, ES_PASSWORD, ES_CA_CERTS
+
+# sinks supported by the extractor, and their default url
+SINKS = {
+    "enqueue": "http://localhost:9090",
+    "elasticsearch": "https://127.0.0.1:9200",
+}
+
+
+class StreamSink(abc.ABC):
+    """
+    StreamSink is the base class of the sinks, used to send batches of extracted tweets from a background thread.
+    Subclasses implement send(), and disconnect() when they hold a connection.
+    """
+    def __init__(self, batch_size: int = 500, max_in_flight: int = 4) -> None:
+        """
+        Initialize the class and start the background sender.
+
+        Args:
+            batch_size (int): number of tweets of a batch
+            max_in_flight (int): number of batches waiting to be sent before write() blocks
+        """
+        self.batch_size = batch_size
+        self.batch = []
+        self.records = 0
+        self.batches = 0
+        self.error = None
+        self.queue = queue.Queue(maxsize=max_in_flight)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+
+    @abc.abstractmethod
+    def send(self, batch: List[Dict]) -> None:
+        """
+        Send one batch of extracted tweets, called from the background thread.
+
+        Args:
+            batch (List[Dict]): extracted tweets
+        """
+
+
+    def disconnect(self) -> None:
+        """
+        Close the connection of the sink, once the background sender has stopped.
+        """
+
+
+    def run(self) -> None:
+        """
+        Keep sending the queued batches until the sink is closed.
+        Once a batch has failed, the following ones are dropped and the error is raised to the worker.
+        """
+        while True:
+            batch = self.queue.get()
+            try:
+                if batch is None:
+                    return
+                if self.error is None:
+                    self.send(batch)
+                    self.records += len(batch)
+                    self.batches += 1
+            except Exception as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+
+    def check(self) -> None:
+        """
+        Raise the error of the background sender in the worker.
+
+        Raises:
+            Exception: when a batch could not be sent
+        """
+        if self.error is not None:
+            raise Exception(f"Error: the stream sink failed: {self.error}")
+
+
+    def write(self, record: Dict) -> None:
+        """
+        Add one extracted tweet to the current batch, and queue the batch once it is full.
+        Blocks while max_in_flight batches are waiting.
+
+        Args:
+            record (Dict): extracted tweet
+        """
+        self.batch.append(record)
+        if len(self.batch) >= self.batch_size:
+            self.check()
+            self.queue.put(self.batch)
+            self.batch = []
+
+
+    def flush(self) -> None:
+        """
+        Queue the current batch and wait until every queued batch has been sent.
+        """
+        if self.batch:
+            self.queue.put(self.batch)
+            self.batch = []
+        self.queue.join()
+        self.check()
+
+
+    def close(self) -> Dict[str, int]:
+        """
+        Send what is left, then stop the background sender.
+
+        Returns:
+            Dict[str, int]: number of tweets and batches sent
+        """
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+        self.disconnect()
+        return {
+            "records": self.records,
+            "batches": self.batches,
+        }
+
+
+class EnqueueSink(StreamSink):
+    """
+    EnqueueSink is a class used to send extracted tweets to a kafka topic through the enqueue function,
+    in the same message format as the uploader.
+    """
+    def __init__(self, url: str, index_name: str, topic: str, batch_size: int = 500, max_in_flight: int = 4) -> None:
+        """
+        Initialize the class.
+
+        Args:
+            url (str): url of the fission router
+            index_name (str): Elasticsearch index name passed on to the processor
+            topic (str): kafka topic, e.g. topic-twitter
+            batch_size (int): number of tweets of a batch
+            max_in_flight (int): number of batches waiting to be sent before write() blocks
+        """
+        self.url = f"{url}/enqueue/{topic}"
+        self.index_name = index_name
+        self.session = requests.Session()
+        super().__init__(batch_size, max_in_flight)
+
+
+    def send(self, batch: List[Dict]) -> None:
+        """
+        Post one batch of extracted tweets to the enqueue function.
+
+        Args:
+            batch (List[Dict]): extracted tweets
+        """
+        response = self.session.post(url=self.url,
+                                     headers={'Content-Type': 'application/json'},
+                                     data=json.dumps({"index_name": self.index_name, "docs": batch}),
+                                     timeout=60)
+        response.raise_for_status()
+
+
+    def disconnect(self) -> None:
+        """
+        Close the connections to the fission router.
+        """
+        self.session.close()
+
+
+class ElasticsearchSink(StreamSink):
+    """
+    ElasticsearchSink is a class used to index the extracted tweets as they are with the bulk API.
+    The tweets are not processed, so the index should not use the strict twitter schema.
+    """
+    def __init__(self, url: str, index_name: str, batch_size: int = 500, max_in_flight: int = 4) -> None:
+        """
+        Initialize the class.
+        Without ES_CA_CERTS the certificate of Elasticsearch is not verified, as for the port-forwarded cluster.
+
+        Args:
+            url (str): url of Elasticsearch
+            index_name (str): Elasticsearch index name
+            batch_size (int): number of tweets of a batch
+            max_in_flight (int): number of batches waiting to be sent before write() blocks
+
+        Raises:
+            Exception: when elasticsearch8 is not installed
+        """
+        if Elasticsearch is None:
+            raise Exception("Error: elasticsearch8 is required by --sink elasticsearch!")
+        self.index_name = index_name
+        self.es_client = Elasticsearch(
+            url,
+            basic_auth=(ES_USERNAME, ES_PASSWORD),
+            ca_certs=ES_CA_CERTS,
+            verify_certs=ES_CA_CERTS is not None,
+            ssl_show_warn=ES_CA_CERTS is not None
+        )
+        super().__init__(batch_size, max_in_flight)
+
+
+    def send(self, batch: List[Dict]) -> None:
+        """
+        Index one batch of extracted tweets, the tweet id is the document id.
+        Every tweet is tried, then the rejected ones are reported.
+
+        Args:
+            batch (List[Dict]): extracted tweets
+
+        Raises:
+            Exception: when Elasticsearch rejects some of the tweets
+        """
+        actions = ({"_index": self.index_name, "_id": record.get("id"), "_source": record} for record in batch)
+        failed = []
+        for ok, item in helpers.streaming_bulk(self.es_client, actions, chunk_size=len(batch),
+                                               max_retries=3, raise_on_error=False):
+            if not ok:
+                result = item["index"]
+                failed.append(f"{result.get('_id')} ({result.get('status')}: {result.get('error')})")
+        if failed:
+            raise Exception(f"Error: Elasticsearch rejected {len(failed)} of {len(batch)} tweets: "
+                            + ", ".join(failed))
+
+
+    def disconnect(self) -> None:
+        """
+        Close the connections to Elasticsearch.
+        """
+        self.es_client.close()
+
+
+class TeeWriter:
+    """
+    TeeWriter is a class used to write the extracted tweets of a segment to its shard and to a sink.
+    The segment is only closed once its tweets have been sent, so a checkpointed segment has been delivered.
+    """
+    def __init__(self, writer, sink: StreamSink) -> None:
+        """
+        Initialize the class.
+
+        Args:
+            writer: shard writer of the segment
+            sink (StreamSink): sink of the worker
+        """
+        self.writer = writer
+        self.sink = sink
+
+
+    def write(self, record: Dict) -> None:
+        """
+        Write one extracted tweet to the shard and the sink.
+
+        Args:
+            record (Dict): extracted tweet
+        """
+        self.writer.write(record)
+        self.sink.write(record)
+
+
+    def close(self) -> Dict[str, Union[str, int]]:
+        """
+        Wait until the tweets of the segment have been sent, then close the shard.
+
+        Returns:
+            Dict[str, Union[str, int]]: shard file name, number of records and size in bytes
+        """
+        self.sink.flush()
+        return self.writer.close()
+
+
+def open_stream_sink(sink: Optional[str],
+                     url: Optional[str],
+                     index_name: str,
+                     topic: str,
+                     batch_size: int,
+                     max_in_flight: int) -> Optional[StreamSink]:
+    """
+    Open the sink of a worker.
+
+    Args:
+        sink (Optional[str]): one of SINKS, no sink if None
+        url (Optional[str]): url of the sink, the default one of SINKS if None
+        index_name (str): Elasticsearch index name
+        topic (str): kafka topic of the enqueue sink
+        batch_size (int): number of tweets of a batch
+        max_in_flight (int): number of batches waiting to be sent before write() blocks
+
+    Returns:
+        Optional[StreamSink]: the sink, None if no sink
+    """
+    if sink is None:
+        return None
+    url = url or SINKS[sink]
+    if sink == "enqueue":
+        return EnqueueSink(url, index_name, topic, batch_size, max_in_flight)
+    return ElasticsearchSink(url, index_name, batch_size, max_in_flight)
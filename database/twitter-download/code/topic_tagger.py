@@ -0,0 +1,136 @@
+"""
+Script Name: topic_tagger.py
+Description: This script tags the topics (keywords) found in a tweet text with an Aho-Corasick automaton,
+    so every keyword is searched in one pass over the text whatever the number of keywords.
+    Matching is case-insensitive and only whole words count, "AI" is found in "AI's" but not in "said".
+"""
+
+from collections import deque
+
+from typing import (
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+# pyahocorasick is an optional, faster (C) backend of the automaton
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+# keywords analysed by the frontend (frontend/AsyncFissionClient.py)
+TOPICS = ["Telstra", "Optus", "Vodafone", "EV", "Tesla", "BYD", "5G", "AI"]
+
+
+def is_word_char(char: str) -> bool:
+    """
+    Check whether a character is part of a word.
+
+    Args:
+        char (str): a character
+
+    Returns:
+        bool: whether the character is a letter, a digit or an underscore
+    """
+    return char.isalnum() or char == "_"
+
+
+class TopicTagger:
+    """
+    TopicTagger is a class used to find which topics a tweet text mentions.
+    """
+    def __init__(self, topics: Optional[List[str]] = None) -> None:
+        """
+        Initialize the class and build the automaton of the topics.
+
+        Args:
+            topics (Optional[List[str]]): keywords to search, TOPICS if None
+        """
+        self.topics = topics if topics else TOPICS
+        self.keywords = [topic.lower() for topic in self.topics]
+        if ahocorasick is not None:
+            self.automaton = ahocorasick.Automaton()
+            for index, keyword in enumerate(self.keywords):
+                self.automaton.add_word(keyword, (index, len(keyword)))
+            self.automaton.make_automaton()
+        else:
+            self.automaton = None
+            self.build()
+
+
+    def build(self) -> None:
+        """
+        Build the pure Python automaton: a trie of the keywords (goto), the failure links,
+        and the keywords ending at every state (output).
+        """
+        self.goto: List[Dict[str, int]] = [{}]
+        self.output: List[List[Tuple[int, int]]] = [[]]
+        for index, keyword in enumerate(self.keywords):
+            state = 0
+            for char in keyword:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.output.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].append((index, len(keyword)))
+        # the failure link of a state is the longest proper suffix of its path that is also in the trie
+        self.fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, int]]:
+        """
+        Find every keyword occurrence in a lowercase text.
+
+        Args:
+            text (str): lowercase tweet text
+
+        Yields:
+            Iterator[Tuple[int, int, int]]: keyword index, start and end of every occurrence
+        """
+        if self.automaton is not None:
+            for end, (index, length) in self.automaton.iter(text):
+                yield index, end + 1 - length, end + 1
+            return
+        state = 0
+        for pos, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for index, length in self.output[state]:
+                yield index, pos + 1 - length, pos + 1
+
+
+    def tag(self, text: str) -> List[str]:
+        """
+        Find the topics mentioned in a tweet text, as whole words.
+
+        Args:
+            text (str): tweet text
+
+        Returns:
+            List[str]: topics mentioned, in the order of the topic list
+        """
+        text = text.lower()
+        found = set()
+        for index, start, end in self.iter_matches(text):
+            if start > 0 and is_word_char(text[start - 1]):
+                continue
+            if end < len(text) and is_word_char(text[end]):
+                continue
+            found.add(index)
+        return [self.topics[index] for index in sorted(found)]
@@ -0,0 +1,153 @@
+"""
+Script Name: tweet_filter.py
+Description: This script selects and projects the extracted tweets while a worker is scanning.
+"""
+
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Union,
+)
+
+from topic_tagger import TopicTagger
+
+
+# fields of an extracted tweet, p1..p4 are the bbox corners (min lon, min lat, max lon, max lat)
+FIELDS = ["id", "text", "time", "lang", "p1", "p2", "p3", "p4"]
+# field added to every tweet when topics are tagged
+TOPICS_FIELD = "topics"
+
+
+class TweetFilter:
+    """
+    TweetFilter is a class used to decide which extracted tweets are kept, and which fields of them.
+    """
+    def __init__(
+            self,
+            langs: Optional[List[str]] = None,
+            require_geo: bool = True,
+            since: Optional[str] = None,
+            until: Optional[str] = None,
+            bbox: Optional[List[float]] = None,
+            fields: Optional[List[str]] = None,
+            topics: Optional[List[str]] = None,
+            topics_only: bool = False
+            ) -> None:
+        """
+        Initialize the class
+
+        Args:
+            langs (Optional[List[str]]): languages to keep, all languages if None
+            require_geo (bool): keep only tweets with a bbox
+            since (Optional[str]): keep tweets created at or after this UTC ISO 8601 prefix, e.g. "2021-06-01"
+            until (Optional[str]): keep tweets created before this UTC ISO 8601 prefix
+            bbox (Optional[List[float]]): keep tweets whose bbox center is in [min lon, min lat, max lon, max lat]
+            fields (Optional[List[str]]): fields written for each tweet, all FIELDS (and topics) if None
+            topics (Optional[List[str]]): keywords tagged in the text of each tweet, no tagging if None
+            topics_only (bool): keep only tweets mentioning a topic, the default topics are tagged if topics is None
+        """
+        self.langs = set(langs) if langs else None
+        # raw languages are compared with the bytes found by the parser before decoding
+        self.raw_langs = {lang.encode('utf-8') for lang in self.langs} if self.langs else None
+        # a bbox filter needs the bbox of the tweet
+        self.require_geo = require_geo or bbox is not None
+        self.since = since
+        self.until = until
+        self.bbox = bbox
+        self.tagger = TopicTagger(topics) if topics is not None or topics_only else None
+        self.topics_only = topics_only
+        self.fields = fields if fields else (FIELDS + [TOPICS_FIELD] if self.tagger else FIELDS)
+        # with all fields selected the tweets are written as they are
+        self.project_all = not fields
+
+
+    def match_lang(self, lang: bytes) -> bool:
+        """
+        Check the raw language of a record, so that rejected records are never decoded.
+
+        Args:
+            lang (bytes): raw language found by the parser
+
+        Returns:
+            bool: whether the language is kept
+        """
+        return self.raw_langs is None or lang in self.raw_langs
+
+
+    def match(self, record: Dict) -> bool:
+        """
+        Check an extracted tweet against every condition of the filter.
+
+        Args:
+            record (Dict): extracted tweet with all FIELDS, p1..p4 are missing without a bbox
+
+        Returns:
+            bool: whether the tweet is kept
+        """
+        if self.langs is not None and record["lang"] not in self.langs:
+            return False
+        if self.require_geo and "p1" not in record:
+            return False
+        # ISO 8601 times in UTC compare in the same order as strings
+        if self.since is not None and record["time"] < self.since:
+            return False
+        if self.until is not None and record["time"] >= self.until:
+            return False
+        if self.bbox is not None:
+            lon = (float(record["p1"]) + float(record["p3"])) / 2
+            lat = (float(record["p2"]) + float(record["p4"])) / 2
+            if not (self.bbox[0] <= lon <= self.bbox[2] and self.bbox[1] <= lat <= self.bbox[3]):
+                return False
+        return True
+
+
+    def tag(self, record: Dict) -> bool:
+        """
+        Attach the topics mentioned in the text to an extracted tweet, if topics are tagged.
+        Called after match(), so only the tweets kept are tagged.
+
+        Args:
+            record (Dict): extracted tweet
+
+        Returns:
+            bool: whether the tweet is kept, tweets without topic are dropped with topics_only
+        """
+        if self.tagger is None:
+            return True
+        record[TOPICS_FIELD] = self.tagger.tag(record["text"])
+        return bool(record[TOPICS_FIELD]) or not self.topics_only
+
+
+    def project(self, record: Dict) -> Dict:
+        """
+        Keep only the selected fields of an extracted tweet.
+
+        Args:
+            record (Dict): extracted tweet
+
+        Returns:
+            Dict: extracted tweet with the selected fields
+        """
+        if self.project_all:
+            return record
+        return {field: record[field] for field in self.fields if field in record}
+
+
+    def describe(self) -> Dict[str, Union[List, bool, str, None]]:
+        """
+        Describe the filter for the manifest, so that later stages know what was applied.
+
+        Returns:
+            Dict[str, Union[List, bool, str, None]]: conditions and fields of the filter
+        """
+        return {
+            "langs": sorted(self.langs) if self.langs else None,
+            "require_geo": self.require_geo,
+            "since": self.since,
+            "until": self.until,
+            "bbox": self.bbox,
+            "fields": self.fields,
+            "topics": self.tagger.topics if self.tagger else None,
+            "topics_only": self.topics_only,
+        }
@@ -6,13 +6,33 @@ Authors:
 """
 
 import io
+import os
 import re
+import json
+import mmap
+import time
+import logging
+
+from collections import deque
 
 from typing import (
+    BinaryIO,
     List,
     Dict,
+    Optional,
+    Tuple,
 )
 
+from shard_writer import JsonlShardWriter
+from tweet_filter import TweetFilter
+from compressed_reader import SeekableCompressedReader, is_compressed
+
+# orjson is an optional, faster backend of the json parser
+try:
+    import orjson as json_backend
+except ImportError:
+    json_backend = json
+
 
 
 # define regular expression patterns
@@ -24,6 +44,26 @@ LANG_PATTERN = rb'"lang":"(.*?)"'
 GEO_PATTERN = rb'"bbox":\[(.*?),(.*?),(.*?),(.*?)\]'
 # SENT_PATTERN = rb'"sentiment":(-?\d+\.?\d*)'
 COMB_PATTERN = re.compile(b"|".join([ID_PATTERN,TEXT_PATTERN, TIME_PATTERN,LANG_PATTERN, GEO_PATTERN]))
+# record-level patterns are searched within the line of one record (row),
+# so a record missing a field is skipped instead of shifting the later records
+ROW_PATTERN = re.compile(rb'^{"id":.*$', re.MULTILINE)
+ID_REGEX = re.compile(ID_PATTERN)
+TEXT_REGEX = re.compile(TEXT_PATTERN)
+TIME_REGEX = re.compile(TIME_PATTERN)
+LANG_REGEX = re.compile(LANG_PATTERN)
+GEO_REGEX = re.compile(GEO_PATTERN)
+
+# parsers supported by TweetProcess, "comb" is the original positional findall alternation
+PARSERS = ["regex", "json", "comb"]
+
+# every record (row) of the twitter file is stored on its own line
+RECORD_DELIMITER = b"\n"
+
+# seconds between two progress lines of a worker
+PROGRESS_INTERVAL = 30
+
+
+logger = logging.getLogger(__name__)
 
 
 def bin2str(data: bytes) -> str:
@@ -39,6 +79,96 @@ def bin2str(data: bytes) -> str:
     return data.decode('utf-8')
 
 
+def decode_text(data: bytes) -> str:
+    """
+    Convert a JSON-escaped string value from bytes to string.
+
+    Args:
+        data (bytes): Input bytes data, as written between the quotes of a JSON string
+
+    Returns:
+        str: Outputs as a string with the escape sequences decoded
+    """
+    if b"\\" in data:
+        return json.loads(b'"' + data + b'"')
+    return data.decode('utf-8')
+
+
+def open_twitter_file(filepath: str) -> BinaryIO:
+    """
+    Open a plain or compressed twitter file in binary mode.
+    Positions in a compressed file are uncompressed positions.
+
+    Args:
+        filepath (str): twitter file path
+
+    Returns:
+        BinaryIO: twitter file opened in binary mode
+    """
+    if is_compressed(filepath):
+        return SeekableCompressedReader(filepath)
+    return io.open(filepath, 'rb')
+
+
+def get_file_size(filepath: str) -> int:
+    """
+    Get the uncompressed size of a plain or compressed twitter file.
+
+    Args:
+        filepath (str): twitter file path
+
+    Returns:
+        int: uncompressed file size
+    """
+    if is_compressed(filepath):
+        with SeekableCompressedReader(filepath) as file:
+            return file.size
+    return os.stat(filepath).st_size
+
+
+def find_record_start(file: BinaryIO, pos: int) -> int:
+    """
+    Find the first record boundary at or after a byte position.
+    A position that is already at the start of a record is returned unchanged.
+
+    Args:
+        file (BinaryIO): twitter file opened in binary mode
+        pos (int): byte position in the file
+
+    Returns:
+        int: byte position where the next complete record starts
+    """
+    if pos <= 0:
+        return 0
+    # step back one byte so that a position right after a delimiter is kept
+    file.seek(pos - 1)
+    file.readline()
+    return file.tell()
+
+
+def split_segments(filepath: str, file_size: int, segment_size: int) -> List[Tuple[int, int]]:
+    """
+    Cut the twitter file into segments of about segment_size bytes.
+    Every segment starts and ends on a record boundary.
+
+    Args:
+        filepath (str): twitter file path
+        file_size (int): file size of twitter file
+        segment_size (int): approximate number of bytes of a segment
+
+    Returns:
+        List[Tuple[int, int]]: search ranges of the segments, in file order
+    """
+    segments = []
+    with open_twitter_file(filepath) as file:
+        start = 0
+        while start < file_size:
+            end = find_record_start(file, min(start + segment_size, file_size))
+            segments.append((start, end))
+            start = end
+    return segments
+
+
 class TweetProcess:
     """
     TweetProcess is a class used to read and process the twitter file.
@@ -47,56 +177,210 @@ class TweetProcess:
             self,
             filepath: str,
             min_search_pos: int,
-            max_search_pos: int
+            max_search_pos: int,
+            batch_size: int = 2**30,
+            use_mmap: bool = False,
+            writer: Optional[JsonlShardWriter] = None,
+            parser: str = "regex",
+            tweet_filter: Optional[TweetFilter] = None
             ) -> None:
         """
         Initialize the class
 
         Args:
             filepath (str): twitter file path
-            min_search_pos (int): minimum search position for a worker
-            max_search_pos (int): maximum search position for a worker
+            min_search_pos (int): minimum search position for a worker, on a record boundary
+            max_search_pos (int): maximum search position for a worker, on a record boundary
+            batch_size (int): number of bytes each worker reads and processes at a time
+            use_mmap (bool): scan a memory-mapped view of the file instead of reading copies
+            writer (Optional[JsonlShardWriter]): stream results to a shard instead of keeping them
+            parser (str): record parser, one of PARSERS
+            tweet_filter (Optional[TweetFilter]): tweets and fields to keep, geotagged tweets if None
         """
-        # every time each workder reads and processes 2**30 bytes of file
-        self.batch_size = 2**30
+        # by default every time each workder reads and processes 2**30 bytes of file
+        self.batch_size = batch_size
         self.filepath = filepath
         self.min_search_pos = min_search_pos
         self.max_search_pos = max_search_pos
+        self.use_mmap = use_mmap
+        self.writer = writer
+        self.parser = parser
+        self.tweet_filter = tweet_filter if tweet_filter is not None else TweetFilter()
         # initialize result dictionaries
         self.dict_list = []
+        # bytes scanned, records emitted and the time spent reading, scanning and assembling records
+        self.stats = {
+            "scanned_bytes": 0,
+            "records": 0,
+            "read_seconds": 0.0,
+            "scan_seconds": 0.0,
+            "assembly_seconds": 0.0,
+        }
+        self.start_time = time.perf_counter()
+        self.progress_time = self.start_time
+
+
+    def emit(self, record: Dict) -> None:
+        """
+        Hand over one extracted tweet, either to the shard writer or to the result dictionaries.
+        The tweet is dropped if the filter rejects it, otherwise it is tagged with its topics
+        (if any are tagged) and only its selected fields are kept.
+
+        Args:
+            record (Dict): extracted tweet
+        """
+        start = time.perf_counter()
+        if self.tweet_filter.match(record) and self.tweet_filter.tag(record):
+            record = self.tweet_filter.project(record)
+            if self.writer is not None:
+                self.writer.write(record)
+            else:
+                self.dict_list.append(record)
+            self.stats["records"] += 1
+        self.stats["assembly_seconds"] += time.perf_counter() - start
+
+
+    def log_progress(self) -> None:
+        """
+        Log how far the worker is in its search range, at most once every PROGRESS_INTERVAL seconds.
+        """
+        now = time.perf_counter()
+        if now - self.progress_time < PROGRESS_INTERVAL:
+            return
+        self.progress_time = now
+        total = self.max_search_pos - self.min_search_pos
+        logger.info("pid=%s scanned %s of %s bytes (%.1f%%) from %s, %s records, %.1f MB/s",
+                    os.getpid(), self.stats["scanned_bytes"], total,
+                    100 * self.stats["scanned_bytes"] / total if total else 100.0, self.min_search_pos,
+                    self.stats["records"], self.stats["scanned_bytes"] / 2**20 / (now - self.start_time))
 
 
 
     def process_chunk(self, chunk: bytes) -> None:
         """
-        After reading file with binary mode, then process with chunks. 
+        After reading file with binary mode, then process with chunks.
+        The chunk is handed to the record parser chosen for this worker.
+
+        Args:
+            chunk (bytes): Input bytes chunk (or memoryview) of twitter file
+        """
+        start = time.perf_counter()
+        assembly_seconds = self.stats["assembly_seconds"]
+        if self.parser == "json":
+            self.process_chunk_json(chunk)
+        elif self.parser == "comb":
+            self.process_chunk_comb(chunk)
+        else:
+            self.process_chunk_regex(chunk)
+        # the time spent in emit() is record assembly, the rest is scanning
+        self.stats["scan_seconds"] += time.perf_counter() - start - (self.stats["assembly_seconds"] - assembly_seconds)
+        self.stats["scanned_bytes"] += len(chunk)
+        self.log_progress()
+
+
+    def process_chunk_regex(self, chunk: bytes) -> None:
+        """
+        Apply the record-level regular expressions to each record of the chunk.
+        The bbox and lang are searched first, since most records are rejected by them,
+        then the id, text and time are searched within the same record.
+
+        Args:
+            chunk (bytes): Input bytes chunk (or memoryview) of twitter file
+        """
+        for row in ROW_PATTERN.finditer(chunk):
+            start, end = row.span()
+            geo = GEO_REGEX.search(chunk, start, end)
+            if geo is None and self.tweet_filter.require_geo:
+                continue
+            lang = LANG_REGEX.search(chunk, start, end)
+            if lang is None or not self.tweet_filter.match_lang(lang.group(1)):
+                continue
+            tweet_id = ID_REGEX.search(chunk, start, end)
+            text = TEXT_REGEX.search(chunk, start, end)
+            created_at_match = TIME_REGEX.search(chunk, start, end)
+            if tweet_id is None or text is None or created_at_match is None:
+                continue
+            try:
+                record = {
+                    "id":tweet_id.group(1).decode('utf-8'),
+                    "text":decode_text(text.group(1)),
+                    "time":created_at_match.group(1).decode('utf-8'),
+                    "lang":lang.group(1).decode('utf-8'),
+                }
+                if geo is not None:
+                    record["p1"] = geo.group(1).decode('utf-8')
+                    record["p2"] = geo.group(2).decode('utf-8')
+                    record["p3"] = geo.group(3).decode('utf-8')
+                    record["p4"] = geo.group(4).decode('utf-8')
+            except ValueError:
+                continue
+            self.emit(record)
+
+
+    def process_chunk_json(self, chunk: bytes) -> None:
+        """
+        Parse every record line of the chunk with the json backend (orjson when installed).
+        Records with a missing field are skipped, so are records without a bbox unless
+        the filter accepts them.
+
+        Args:
+            chunk (bytes): Input bytes chunk (or memoryview) of twitter file
+        """
+        for match in ROW_PATTERN.finditer(chunk):
+            try:
+                row = json_backend.loads(match.group().rstrip(b",\r"))
+                data = row["doc"]["data"]
+                record = {
+                    "id":row["id"],
+                    "text":row["value"]["text"],
+                    "time":data["created_at"],
+                    "lang":data["lang"],
+                }
+            except (ValueError, KeyError, TypeError):
+                continue
+            try:
+                bbox = row["doc"]["includes"]["places"][0]["geo"]["bbox"]
+                record["p1"] = str(bbox[0])
+                record["p2"] = str(bbox[1])
+                record["p3"] = str(bbox[2])
+                record["p4"] = str(bbox[3])
+            except (KeyError, IndexError, TypeError):
+                if self.tweet_filter.require_geo:
+                    continue
+            self.emit(record)
+
+
+    def process_chunk_comb(self, chunk: bytes) -> None:
+        """
         Apply regular expression to find time and sentiment information.
         Then add these information to result dictionaries.
+        Matches are consumed one by one, only the last 4 of them are kept in memory.
 
         Args:
-            chunk (bytes): Input bytes chunk of twitter file
+            chunk (bytes): Input bytes chunk (or memoryview) of twitter file
 
         Raises:
             Exception: when matched tuple is not valid
         """
-        # update 4 dictionaries using the searched data
-        searched_data_list = COMB_PATTERN.findall(chunk)
-        
-        for i in range(len(searched_data_list)):
-            if searched_data_list[i][4]:
+        # the 4 fields before a bbox must belong to the same record
+        previous = deque(maxlen=4)
+        for match in COMB_PATTERN.finditer(chunk):
+            searched_data = match.groups(b"")
+            if searched_data[4] and len(previous) == 4:
                 try:
-                    self.dict_list.append({
-                        "id":searched_data_list[i-4][0].decode('utf-8'),
-                        "text":searched_data_list[i-3][1].decode('utf-8'),
-                        "time":searched_data_list[i-2][2].decode('utf-8'),
-                        "lang":searched_data_list[i-1][3].decode('utf-8'),
-                        "p1":searched_data_list[i][4].decode('utf-8'),
-                        "p2":searched_data_list[i][5].decode('utf-8'),
-                        "p3":searched_data_list[i][6].decode('utf-8'),
-                        "p4":searched_data_list[i][7].decode('utf-8'),
+                    self.emit({
+                        "id":previous[0][0].decode('utf-8'),
+                        "text":decode_text(previous[1][1]),
+                        "time":previous[2][2].decode('utf-8'),
+                        "lang":previous[3][3].decode('utf-8'),
+                        "p1":searched_data[4].decode('utf-8'),
+                        "p2":searched_data[5].decode('utf-8'),
+                        "p3":searched_data[6].decode('utf-8'),
+                        "p4":searched_data[7].decode('utf-8'),
                     })
                 except:
-                    continue
+                    pass
+            previous.append(searched_data)
         return
     
     
@@ -104,16 +388,74 @@ class TweetProcess:
     def process(self) -> List[Dict]:
         """
         Read the twitter file as binary mode, find the minimum search position for each worker.
-        Then batched the data and process it with process_chunk() function
+        Then batched the data and process it with process_chunk() function.
+        Each batch is cut at its last record boundary, and the trailing partial record
+        is carried over to the next batch so that no record is split.
 
         Returns:
-            List[Dict]: The result dictionaries.
+            List[Dict]: The result dictionaries, empty when results are streamed to a shard.
         """
+        if self.use_mmap:
+            return self.process_mmap()
         # read file in binary mode, different workers read different segments of file
-        with io.open(self.filepath, 'rb') as file:
+        with open_twitter_file(self.filepath) as file:
             file.seek(self.min_search_pos)
+            carry = b""
             # iteratively read and process each segment by chunks
             while file.tell() < self.max_search_pos:
-                chunk = file.read(min(self.batch_size, self.max_search_pos - file.tell()))
-                self.process_chunk(chunk)
+                start = time.perf_counter()
+                data = file.read(min(self.batch_size, self.max_search_pos - file.tell()))
+                self.stats["read_seconds"] += time.perf_counter() - start
+                # a search range past the end of file stops at the end of file
+                if not data:
+                    break
+                chunk = carry + data
+                cut = chunk.rfind(RECORD_DELIMITER) + 1
+                with memoryview(chunk) as view:
+                    self.process_chunk(view[:cut])
+                carry = chunk[cut:]
+            # the last record of the search range may not end with a delimiter
+            if carry:
+                self.process_chunk(carry)
+        return self.dict_list
+
+
+    def process_mmap(self) -> List[Dict]:
+        """
+        Memory-map the twitter file and scan the search range of the worker in place.
+        Each batch is a memoryview slice of the mapping ending at a record boundary,
+        so nothing is copied, and its pages are released once they have been scanned.
+        This keeps the resident memory of a worker bounded whatever the batch size.
+        Pages are read while they are scanned, so the read time is counted as scan time.
+
+        Raises:
+            Exception: when the twitter file is compressed
+
+        Returns:
+            List[Dict]: The result dictionaries, empty when results are streamed to a shard.
+        """
+        if is_compressed(self.filepath):
+            raise Exception("Error: a compressed twitter file cannot be memory-mapped!")
+        with io.open(self.filepath, 'rb') as file, \
+                mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mmap, "MADV_SEQUENTIAL"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            start = self.min_search_pos
+            while start < self.max_search_pos:
+                end = min(start + self.batch_size, self.max_search_pos)
+                if end < self.max_search_pos:
+                    # end the batch at its last record boundary, or extend it
+                    # to the end of a record longer than the batch size
+                    cut = mm.rfind(RECORD_DELIMITER, start, end) + 1
+                    if cut > start:
+                        end = cut
+                    else:
+                        end = mm.find(RECORD_DELIMITER, end, self.max_search_pos) + 1 or self.max_search_pos
+                with memoryview(mm) as view:
+                    self.process_chunk(view[start:end])
+                # drop the scanned pages from the resident memory of this worker
+                if hasattr(mmap, "MADV_DONTNEED"):
+                    page_start = start - start % mmap.PAGESIZE
+                    mm.madvise(mmap.MADV_DONTNEED, page_start, end - page_start)
+                start = end
         return self.dict_list
\ No newline at end of file
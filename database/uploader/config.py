@@ -4,7 +4,29 @@ MASTODON_SCHEMA_PATH = "../schema/mastodon_schema.json"
 
 
 INCOME_DATA_PATH = "../sudo-download/SA4-P02_Selected_Medians_and_Averages/abs_2021census_p02_aust_sa4-6670122534648419484.csv"
+# the sa4 code is a keyword, not a number
+INCOME_DTYPE = {"sa4_code_2021": str, " med_tot_psnl_incom_weekly": float}
 TWITTER_DATA_PATH = "../twitter-download/results/twitter-100gb/twitter-small.jsonl"
+# shard directory written by the MPI extractor, uploaded in place of the jsonl file with twitter.py --shards
+TWITTER_SHARD_PATH = "../twitter-download/results/twitter-100gb/twitter"
 
+# fission functions imported by the uploader in bulk mode
+FUNCTIONS_DIR = "../../backend/fission/functions"
+
+# a batch is flushed at whichever limit it hits first: documents, serialized bytes or
+# seconds since its first document. every batch becomes one kafka message, and the
+# processed batch is a few times larger, so stay well under the 1 MB message limit
+BATCH_DOCS = 10000
+BATCH_BYTES = 256 * 1024
+BATCH_LATENCY = 5.0
+# number of batches the uploader sends at the same time
+MAX_IN_FLIGHT = 8
+# number of actions per request and requests sent at the same time in bulk mode
+BULK_CHUNK_SIZE = 500
+BULK_THREAD_COUNT = 4
+# index settings while bulk loading: no replica writes and no refresh every second
+BULK_LOAD_SETTINGS = {"number_of_replicas": 0, "refresh_interval": "-1"}
+# seconds to wait for the force merge after a bulk load
+FORCEMERGE_TIMEOUT = 3600
 ES_USERNAME = "elastic"
 ES_PASSWORD = "elastic"
\ No newline at end of file
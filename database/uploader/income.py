@@ -5,15 +5,36 @@ Authors:
     Jiajun Li (1132688)
     Qingze Wang (1528654)
     Ze Pang (955698) 
+Usage:
+    python3 income.py
+    python3 income.py --bulk
 """
 
+import argparse
+
 from config import *
 from uploader import Uploader
 
 
 
 if __name__=="__main__":
-    uploader = Uploader("income-test3", buffer_size=100)
-    uploader.create_index(INCOME_SCHEMA_PATH)
-    uploader.upload_csv(INCOME_DATA_PATH, "topic-income")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bulk", action="store_true",
+                        help="run incomeprocessor locally and bulk index with the bulk-load index profile, instead of going through the enqueue route")
+    args = parser.parse_args()
 
+    if args.bulk:
+        uploader = Uploader("income-test3", buffer_size=BULK_CHUNK_SIZE * BULK_THREAD_COUNT, processor="incomeprocessor",
+                            chunk_size=BULK_CHUNK_SIZE, thread_count=BULK_THREAD_COUNT)
+    else:
+        uploader = Uploader("income-test3", buffer_size=BATCH_DOCS, max_in_flight=MAX_IN_FLIGHT,
+                            batch_bytes=BATCH_BYTES, max_latency=BATCH_LATENCY)
+    # the bulk-load profile is restored when the upload finishes or fails,
+    # the index is only merged after a complete upload
+    uploader.create_index(INCOME_SCHEMA_PATH, bulk_load=args.bulk)
+    try:
+        uploader.upload_csv(INCOME_DATA_PATH, "topic-income", dtype=INCOME_DTYPE)
+    except BaseException:
+        uploader.finish_bulk_load(merge=False)
+        raise
+    uploader.finish_bulk_load()
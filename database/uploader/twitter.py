@@ -5,15 +5,57 @@ Authors:
     Luxi Bai(1527822)
     Jiajun Li (1132688)
     Ze Pang (955698) 
+Usage:
+    python3 twitter.py
+    python3 twitter.py --bulk
+    python3 twitter.py --workers 8
+    python3 twitter.py --shards --workers 8
+    python3 twitter.py --format parquet
+    python3 twitter.py --shards --lang all
 """
 
+import argparse
+
 from config import *
 from uploader import Uploader
 
 
 
 if __name__=="__main__":
-    uploader = Uploader("twitter-test3", buffer_size=100)
-    uploader.create_index(TWITTER_SCHEMA_PATH)
-    uploader.upload_jsonl(TWITTER_DATA_PATH, "topic-twitter")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bulk", action="store_true",
+                        help="run twitterprocessor locally and bulk index with the bulk-load index profile, instead of going through the enqueue route")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="upload byte ranges of the file with this many processes, one process by default")
+    parser.add_argument("--shards", action="store_true",
+                        help="upload the shard directory written by the extractor (main.py), in the order of its manifest, instead of the jsonl file")
+    parser.add_argument("--format", type=str, choices=["jsonl", "parquet", "arrow"], default="jsonl",
+                        help="format of the shards, parquet and arrow shards (main.py --format) are always read from the shard directory")
+    parser.add_argument("--lang", type=str, default="en",
+                        help="only upload the tweets in this language, \"all\" to upload every language")
+    args = parser.parse_args()
+    lang = None if args.lang == "all" else args.lang
+    if args.format != "jsonl" and args.workers:
+        parser.error("--workers only applies to jsonl data")
+    data_path = TWITTER_SHARD_PATH if args.shards or args.format != "jsonl" else TWITTER_DATA_PATH
 
+    if args.bulk:
+        uploader = Uploader("twitter-test3", buffer_size=BULK_CHUNK_SIZE * BULK_THREAD_COUNT, processor="twitterprocessor",
+                            chunk_size=BULK_CHUNK_SIZE, thread_count=BULK_THREAD_COUNT)
+    else:
+        uploader = Uploader("twitter-test3", buffer_size=BATCH_DOCS, max_in_flight=MAX_IN_FLIGHT,
+                            batch_bytes=BATCH_BYTES, max_latency=BATCH_LATENCY)
+    # the bulk-load profile is restored when the upload finishes or fails,
+    # the index is only merged after a complete upload
+    uploader.create_index(TWITTER_SCHEMA_PATH, bulk_load=args.bulk)
+    try:
+        if args.format != "jsonl":
+            uploader.upload_columnar(data_path, "topic-twitter", lang=lang)
+        elif args.workers:
+            uploader.upload_jsonl_parallel(data_path, "topic-twitter", lang=lang, workers=args.workers)
+        else:
+            uploader.upload_jsonl(data_path, "topic-twitter", lang=lang)
+    except BaseException:
+        uploader.finish_bulk_load(merge=False)
+        raise
+    uploader.finish_bulk_load()
@@ -7,86 +7,823 @@ Authors:
     Ze Pang (955698)  
 """
 
+import os
+import re
+import sys
+import glob
 import json
+import time
+import importlib
 import requests
 
+from requests.adapters import HTTPAdapter
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple, Union
+
 import pandas as pd
-from elasticsearch8 import Elasticsearch
+from elasticsearch8 import Elasticsearch, helpers
+
+# pyarrow is only needed to upload parquet or arrow shards
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.compute
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# orjson is optional, it encodes and decodes json several times faster
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 from config import *
 
 
+# the language of a jsonl line, read from its bytes without decoding the line
+LANG_PATTERN = re.compile(rb'"lang":\s*"([^"\\]*)"')
+
+
+def loads(data: bytes) -> Any:
+    """Decodes json, with orjson when it is installed.
+
+    Args:
+        data (bytes): The json document
+
+    Returns:
+        Any: The decoded document
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(doc: Any) -> bytes:
+    """Encodes json, with orjson when it is installed. Unknown types are turned into strings.
+
+    Args:
+        doc (Any): The document
+
+    Returns:
+        bytes: The json document
+    """
+    if orjson is not None:
+        return orjson.dumps(doc, default=str)
+    return json.dumps(doc, default=str).encode('utf-8')
+
+
 class Uploader:
-    def __init__(self, index_name: str, buffer_size: int):
+    def __init__(self, index_name: str, buffer_size: int, max_in_flight: int = 4,
+                 processor: Optional[str] = None, chunk_size: int = 500, thread_count: int = 4,
+                 batch_bytes: Optional[int] = None, max_latency: Optional[float] = None):
         """Initializes the Uploader class with index name and buffer size.
 
+        Batches are sent by a thread pool over one pooled HTTP session, so up to
+        max_in_flight batches are on the wire while the next ones are being read.
+
+        With a processor, the uploader runs in bulk mode for offline backfills:
+        the transform of the Fission processor runs locally and the actions are
+        written straight to the index with parallel bulk requests, skipping the
+        enqueue route and kafka. The topic given to the upload methods is then unused.
+
+        A batch is flushed at whichever limit it hits first: buffer_size documents,
+        batch_bytes of serialized documents, or max_latency seconds after its first document.
+
         Args:
             index_name (str): The Elasticsearch index name to store data.
             buffer_size (int): Size of buffer
+            max_in_flight (int): Number of batches sent at the same time
+            processor (Optional[str]): Fission processor module for bulk mode, e.g. "twitterprocessor"
+            chunk_size (int): Number of actions of a bulk request in bulk mode
+            thread_count (int): Number of bulk requests sent at the same time in bulk mode
+            batch_bytes (Optional[int]): Target serialized size of a batch, no limit by default
+            max_latency (Optional[float]): Max seconds a document waits in the buffer, no limit by default
         """
+        # settings of the uploader, used to build the same uploader in pool workers
+        self.settings = {
+            "index_name": index_name, "buffer_size": buffer_size, "max_in_flight": max_in_flight,
+            "processor": processor, "chunk_size": chunk_size, "thread_count": thread_count,
+            "batch_bytes": batch_bytes, "max_latency": max_latency,
+        }
         self.index_name = index_name
         self.buffer = []
         self.buffer_size = buffer_size
+        self.buffer_bytes = 0
+        self.buffer_started = 0.0
+        self.batch_bytes = batch_bytes
+        self.max_latency = max_latency
+        self.max_in_flight = max_in_flight
+        self.process_docs = self.load_processor(processor) if processor else None
+        self.chunk_size = chunk_size
+        self.thread_count = thread_count
+        self.es_client = None
+        # settings of the index restored by finish_bulk_load
+        self.production_settings = None
+        # keep one connection per sending thread alive between batches
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+        self.session.mount('http://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        # batches in the order they were flushed, with their size and position in the input
+        self.in_flight: Deque[Tuple[Future, int, Any]] = deque()
+        self.sent_batches = 0
+        self.sent_docs = 0
+        # position (e.g. line or byte offset) up to which every batch has been acknowledged
+        self.acknowledged = None
+        # sidecar file the acknowledged position is saved to, set while uploading jsonl
+        self.checkpoint_path = None
+        self.checkpoint = {}
         
-    def create_index(self, schema_path: str) -> None:
-        """Creates an Elasticsearch index using the provided schema.
+    @staticmethod
+    def load_processor(processor: str) -> Callable[[List[Dict], str], List[Dict]]:
+        """Imports the transform of a Fission processor from the functions directory.
 
         Args:
-            schema_path (str): The relative path of schema json file
+            processor (str): The processor module, e.g. "twitterprocessor"
+
+        Returns:
+            Callable[[List[Dict], str], List[Dict]]: process_docs of the processor
+        """
+        if FUNCTIONS_DIR not in sys.path:
+            sys.path.append(FUNCTIONS_DIR)
+        return importlib.import_module(processor).process_docs
+
+
+    @staticmethod
+    def get_es_client() -> Elasticsearch:
+        """Connects to Elasticsearch.
+
+        Returns:
+            Elasticsearch: The Elasticsearch client
         """
-        self.es_client = Elasticsearch (
+        return Elasticsearch (
             'https://127.0.0.1:9200',
             basic_auth=(ES_USERNAME, ES_PASSWORD),
             verify_certs= False,
             ssl_show_warn=False
         )
+
+
+    def create_index(self, schema_path: str, bulk_load: bool = False) -> None:
+        """Creates an Elasticsearch index using the provided schema.
+
+        For a bulk load, the index is created (or switched) to no replicas and no
+        refresh until finish_bulk_load. The production settings restored then are
+        always taken from the schema, an existing index may still be in bulk-load
+        mode after a load was killed.
+
+        Args:
+            schema_path (str): The relative path of schema json file
+            bulk_load (bool): Use the bulk-load profile until finish_bulk_load is called
+        """
+        self.es_client = self.get_es_client()
         # Load JSON schema from a schema_path
         with open(schema_path, 'r', encoding='utf-8') as schema_file:
             schema = json.load(schema_file)
+        index_settings = schema.setdefault("settings", {}).setdefault("index", {})
+        if bulk_load:
+            self.production_settings = {
+                "number_of_replicas": index_settings.get("number_of_replicas", 1),
+                # None restores the default refresh interval
+                "refresh_interval": index_settings.get("refresh_interval"),
+            }
         if not self.es_client.indices.exists(index=self.index_name):
+            if bulk_load:
+                index_settings.update(BULK_LOAD_SETTINGS)
             self.es_client.indices.create(index=self.index_name, body=schema)
             print(f"Index '{self.index_name}' created.")
         else:
             print(f"Index '{self.index_name}' already exists.")
-        
+            self.update_mapping(schema["mappings"].get("properties", {}))
+            if bulk_load:
+                self.es_client.indices.put_settings(index=self.index_name, settings={"index": BULK_LOAD_SETTINGS})
+        if bulk_load:
+            print(f"Index '{self.index_name}' is in bulk-load mode {BULK_LOAD_SETTINGS}, "
+                  f"{self.production_settings} are restored after the load.")
 
-    def upload_jsonl(self, data_path: str, topic_type: str) -> None:
+
+    def update_mapping(self, properties: Dict[str, Dict]) -> None:
+        """Adds the fields of the schema missing from the mapping of an existing index,
+        a strict index rejects every document with a field added to the schema later.
+
+        Args:
+            properties (Dict[str, Dict]): The properties of the schema mapping
+        """
+        mapping = self.es_client.indices.get_mapping(index=self.index_name)
+        existing = mapping[self.index_name]["mappings"].get("properties", {})
+        missing = {name: field for name, field in properties.items() if name not in existing}
+        if missing:
+            self.es_client.indices.put_mapping(index=self.index_name, properties=missing)
+            print(f"Fields {sorted(missing)} added to the mapping of '{self.index_name}'.")
+
+
+    def finish_bulk_load(self, merge: bool = True) -> None:
+        """Restores the production settings of the index after a bulk load,
+        then force-merges it and refreshes it once.
+
+        Args:
+            merge (bool): Force-merge and refresh the index, False after a failed load
+                since the resumed load keeps writing to the index
+        """
+        if self.production_settings is None:
+            return
+        self.es_client.indices.put_settings(index=self.index_name, settings={"index": self.production_settings})
+        self.production_settings = None
+        if not merge:
+            print(f"Index '{self.index_name}' restored.")
+            return
+        # merging a large index takes much longer than the default timeout
+        self.es_client.options(request_timeout=FORCEMERGE_TIMEOUT).indices.forcemerge(
+            index=self.index_name, max_num_segments=1)
+        self.es_client.indices.refresh(index=self.index_name)
+        print(f"Index '{self.index_name}' restored, force-merged and refreshed.")
+
+
+    @staticmethod
+    def list_shard_files(data_path: str, extension: str = ".jsonl") -> List[str]:
+        """Lists the files to upload from a file or a shard directory.
+
+        A shard directory is written by the twitter extractor, its manifest.json
+        gives the order of the shards. Without a manifest every file with the
+        extension is used.
+
+        Args:
+            data_path (str): The relative path of data file or shard directory
+            extension (str): The extension of the shard files, e.g. ".jsonl" or ".parquet"
+
+        Returns:
+            List[str]: The paths of data files
+        """
+        if not os.path.isdir(data_path):
+            return [data_path]
+        manifest = Uploader.load_manifest(data_path)
+        if manifest is not None:
+            return [os.path.join(data_path, shard["path"]) for shard in manifest["shards"]]
+        return sorted(glob.glob(os.path.join(data_path, f"*{extension}")))
+
+
+    @staticmethod
+    def load_manifest(data_path: str) -> Optional[Dict]:
+        """Loads the manifest.json written by the twitter extractor in a shard directory.
+
+        Args:
+            data_path (str): The relative path of data file or shard directory
+
+        Returns:
+            Optional[Dict]: The manifest, None for a file or a directory without manifest
+        """
+        manifest_path = os.path.join(data_path, "manifest.json")
+        if not os.path.isdir(data_path) or not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, 'r', encoding='utf-8') as manifest_file:
+            return json.load(manifest_file)
+
+
+    @staticmethod
+    def get_lang_filter(data_path: str, lang: Optional[str]) -> Optional[str]:
+        """Finds the language the documents still have to be filtered on.
+
+        The manifest of a shard directory records the filter of the extractor.
+        Shards the extractor kept in this language only are not filtered again,
+        so they can be uploaded without their lang field (main.py --lang en --fields ...).
+
+        Args:
+            data_path (str): The relative path of data file or shard directory
+            lang (Optional[str]): Only upload documents in this language
+
+        Raises:
+            Exception: when the shards have to be filtered but were written without the lang field
+
+        Returns:
+            Optional[str]: The language to filter on, None when there is nothing to filter
+        """
+        manifest = Uploader.load_manifest(data_path)
+        if lang is None or manifest is None:
+            return lang
+        shard_filter = manifest.get("filter", {})
+        if shard_filter.get("langs") == [lang]:
+            return None
+        if "lang" not in shard_filter.get("fields", ["lang"]):
+            raise Exception(f"Error: the shards of {data_path} have no lang field to keep \"{lang}\" documents, "
+                            "upload them without a language filter!")
+        return lang
+
+
+    @staticmethod
+    def get_checkpoint_path(data_path: str, part: Optional[int] = None) -> str:
+        """Gets the path of the checkpoint of a jsonl upload.
+
+        Args:
+            data_path (str): The relative path of jsonl data file or shard directory
+            part (Optional[int]): Index of the byte range of a parallel upload
+
+        Returns:
+            str: The checkpoint path, next to the file or inside the shard directory
+        """
+        name = "upload.json" if part is None else f"upload-{part:05d}.json"
+        if os.path.isdir(data_path):
+            return os.path.join(data_path, name)
+        return f"{data_path}.{name}"
+
+
+    def load_checkpoint(self, checkpoint_path: str, topic_type: str, lang: Optional[str],
+                        **settings: Any) -> Optional[Tuple[str, int]]:
+        """Loads the position of the last acknowledged batch of a previous upload.
+
+        Args:
+            checkpoint_path (str): The checkpoint path
+            topic_type (str): The kafka topic
+            lang (Optional[str]): The language filter of the upload
+            settings (Any): Other settings the previous upload must match, e.g. its byte range
+
+        Raises:
+            Exception: when the previous upload went to another index, topic or language,
+                or its file has been rewritten since
+
+        Returns:
+            Optional[Tuple[str, int]]: The jsonl path and byte offset to continue from, None to start over
+        """
+        self.checkpoint = {"index_name": self.index_name, "topic_type": topic_type, "lang": lang, **settings}
+        if not os.path.exists(checkpoint_path):
+            return None
+        with open(checkpoint_path, 'r', encoding='utf-8') as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        for key, value in self.checkpoint.items():
+            if checkpoint[key] != value:
+                raise Exception(f"Error: {checkpoint_path} was saved with {key}={checkpoint[key]}, "
+                                f"not {value}, delete it to start over!")
+        # the offset of a rewritten file (e.g. deduped or extracted again) may fall in the middle of a line
+        if os.path.exists(checkpoint["path"]) and self.get_file_version(checkpoint["path"]) != checkpoint["version"]:
+            raise Exception(f"Error: {checkpoint['path']} has changed since {checkpoint_path} was saved, "
+                            f"delete it to start over!")
+        return checkpoint["path"], checkpoint["offset"]
+
+
+    @staticmethod
+    def get_file_version(path: str) -> Dict[str, int]:
+        """Gets the size and modification time of a data file.
+
+        Args:
+            path (str): The path of data file
+
+        Returns:
+            Dict[str, int]: The size and modification time in nanoseconds
+        """
+        stat = os.stat(path)
+        return {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+
+    def save_checkpoint(self) -> None:
+        """Saves the acknowledged position, replacing the checkpoint file atomically.
+        """
+        path, offset = self.acknowledged
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as checkpoint_file:
+            json.dump({**self.checkpoint, "path": path, "offset": offset,
+                       "version": self.get_file_version(path)}, checkpoint_file)
+        os.replace(tmp_path, self.checkpoint_path)
+
+
+    def upload_jsonl(self, data_path: str, topic_type: str, lang: Optional[str] = "en", resume: bool = True) -> None:
         """Uploads JSONL data to the specified kafka topic.
 
+        The byte offset after the last acknowledged batch is saved to a checkpoint
+        next to the data, so a failed upload continues from there when run again.
+        The checkpoint is removed once everything has been sent.
+
+        The language is read from the bytes of a line, and the kept lines are
+        spliced into the payload as they are, so a line is only decoded in bulk
+        mode, or when its language cannot be read without decoding it.
+
+        Args:
+            data_path (str): The relative path of jsonl data file or shard directory
+            topic_type (str): The kafka topic
+            lang (Optional[str]): Only upload documents in this language, shards the extractor
+                already kept in this language only (main.py --lang) are not filtered again.
+            resume (bool): Continue from the checkpoint of a failed upload, otherwise start over
+        """
+        jsonl_paths = self.list_shard_files(data_path)
+        lang = self.get_lang_filter(data_path, lang)
+        checkpoint_path = self.get_checkpoint_path(data_path)
+        position = self.load_checkpoint(checkpoint_path, topic_type, lang) if resume else None
+        start_offset = 0
+        if position is not None:
+            if position[0] not in jsonl_paths:
+                raise Exception(f"Error: {position[0]} in {checkpoint_path} is not part of {data_path}!")
+            jsonl_paths = jsonl_paths[jsonl_paths.index(position[0]):]
+            start_offset = position[1]
+            print(f"resuming from byte {start_offset} of {position[0]}.")
+        self.checkpoint_path = checkpoint_path
+
+        for jsonl_path in jsonl_paths:
+            self.read_lines(jsonl_path, start_offset, None, topic_type, lang)
+            start_offset = 0
+        # send what is left in the buffer
+        if self.buffer:
+            self.flush_buffer(topic_type)
+        self.wait_all()
+        self.checkpoint_path = None
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+
+    def read_lines(self, jsonl_path: str, start: int, end: Optional[int], topic_type: str, lang: Optional[str]) -> None:
+        """Buffers the lines of a jsonl file from a byte offset, and flushes the full batches.
+
         Args:
-            data_path (str): The relative path of jsonl data file
+            jsonl_path (str): The relative path of jsonl data file
+            start (int): Byte offset of the first line
+            end (Optional[int]): Byte offset where the lines stop, the end of the file by default
             topic_type (str): The kafka topic
+            lang (Optional[str]): Only upload documents in this language
         """
-        with open(data_path, "r", encoding='utf-8') as data_file:
+        # read bytes, so the offset of every line is known
+        with open(jsonl_path, "rb") as data_file:
+            offset = data_file.seek(start)
             for line in data_file:
-                doc = json.loads(line)
+                if end is not None and offset >= end:
+                    break
+                offset += len(line)
                 
-                if doc["lang"]=="en":
-                    self.buffer.append(doc)
-                if len(self.buffer) >= self.buffer_size:
-                    self.flush_buffer(topic_type)
-    
+                if lang is None or self.sniff_lang(line)==lang:
+                    doc = loads(line) if self.process_docs is not None else line.strip()
+                    self.add_doc(doc, len(line))
+                if self.buffer_full():
+                    self.flush_buffer(topic_type, (jsonl_path, offset))
 
-    def upload_csv(self, data_path: str, topic_type: str) -> None:
-        """Uploads JSONL data to the specified kafka topic.
+
+    @staticmethod
+    def get_ranges(jsonl_paths: List[str], parts: int) -> List[Tuple[str, int, int]]:
+        """Splits jsonl files into record-aligned byte ranges, about parts ranges in total,
+        given to the files in proportion to their sizes.
+
+        Args:
+            jsonl_paths (List[str]): The paths of jsonl data files
+            parts (int): The number of ranges to aim for
+
+        Returns:
+            List[Tuple[str, int, int]]: The path, start and end offset of every range
+        """
+        sizes = [os.path.getsize(jsonl_path) for jsonl_path in jsonl_paths]
+        total_size = max(sum(sizes), 1)
+        ranges = []
+        for jsonl_path, size in zip(jsonl_paths, sizes):
+            file_parts = max(1, round(parts * size / total_size))
+            bounds = [0]
+            with open(jsonl_path, "rb") as data_file:
+                for i in range(1, file_parts):
+                    # move the cut to the start of the next line
+                    data_file.seek(max(size * i // file_parts - 1, bounds[-1]))
+                    data_file.readline()
+                    bounds.append(min(data_file.tell(), size))
+            bounds.append(size)
+            ranges.extend((jsonl_path, start, end) for start, end in zip(bounds, bounds[1:]) if start < end)
+        return ranges
+
+
+    def upload_jsonl_parallel(self, data_path: str, topic_type: str, lang: Optional[str] = "en",
+                              workers: Optional[int] = None, resume: bool = True) -> None:
+        """Uploads JSONL data to the specified kafka topic with a process pool.
+
+        The data is split into record-aligned byte ranges, and a process with its
+        own uploader filters, batches and sends every range, so the upload scales
+        with the cores like the twitter extractor. Each range saves its own
+        checkpoint, a failed range continues from there when run again with the
+        same number of workers, and a finished range is skipped. The other ranges
+        are still uploaded, the failures are reported once all ranges have finished.
+
+        Args:
+            data_path (str): The relative path of jsonl data file or shard directory
+            topic_type (str): The kafka topic
+            lang (Optional[str]): Only upload documents in this language
+            workers (Optional[int]): Number of processes, all cores by default
+            resume (bool): Continue the ranges from their checkpoints, otherwise start over
+
+        Raises:
+            Exception: when some ranges failed
+        """
+        workers = workers or os.cpu_count()
+        ranges = self.get_ranges(self.list_shard_files(data_path), workers)
+        lang = self.get_lang_filter(data_path, lang)
+        print(f"{data_path} is cut into {len(ranges)} ranges for {workers} workers.")
+
+        reports = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(upload_range, self.settings, jsonl_path, start, end, topic_type, lang,
+                                       self.get_checkpoint_path(data_path, part), resume)
+                       for part, (jsonl_path, start, end) in enumerate(ranges)]
+            for future in as_completed(futures):
+                report = future.result()
+                reports.append(report)
+                status = "failed" if report["error"] else "done"
+                print(f"range {len(reports)}/{len(ranges)} {status}: {report['sent_docs']} docs sent "
+                      f"from bytes {report['start']}-{report['end']} of {report['path']}, "
+                      f"{sum(report['sent_docs'] for report in reports)} docs sent in total.")
+
+        self.sent_batches += sum(report["sent_batches"] for report in reports)
+        self.sent_docs += sum(report["sent_docs"] for report in reports)
+        failed = [report for report in reports if report["error"]]
+        for report in failed:
+            print(f"range {report['start']}-{report['end']} of {report['path']} failed after byte "
+                  f"{report['acknowledged']}: {report['error']}")
+        print(f"{self.sent_docs} docs sent in {self.sent_batches} batches, {len(failed)} of {len(ranges)} ranges failed.")
+        if failed:
+            raise Exception(f"Error: {len(failed)} of {len(ranges)} ranges failed, run again to resume them!")
+        for part in range(len(ranges)):
+            os.remove(self.get_checkpoint_path(data_path, part))
+
+
+    @staticmethod
+    def sniff_lang(line: bytes) -> str:
+        """Reads the language of a jsonl line, decoding the line only when the
+        lang field is not found exactly once in its bytes.
+
+        Args:
+            line (bytes): The jsonl line
+
+        Returns:
+            str: The language of the document
+        """
+        matches = LANG_PATTERN.findall(line)
+        if len(matches) == 1:
+            return matches[0].decode('utf-8')
+        return loads(line)["lang"]
+
+
+    @staticmethod
+    def read_columnar_batches(path: str, batch_size: int) -> Iterator["pyarrow.RecordBatch"]:
+        """Reads a parquet or arrow shard in record batches.
+
+        Args:
+            path (str): The relative path of parquet or arrow file
+            batch_size (int): The maximum number of rows of a batch
+
+        Yields:
+            Iterator[pyarrow.RecordBatch]: The record batches of the shard
+        """
+        if path.endswith(".parquet"):
+            yield from pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=batch_size)
+            return
+        with pyarrow.ipc.open_file(pyarrow.memory_map(path)) as reader:
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i)
+
+
+    @staticmethod
+    def batch_to_docs(batch: "pyarrow.RecordBatch") -> List[Dict]:
+        """Converts a record batch back to the documents expected by the processor.
+
+        The id and the time are turned back into strings, the bbox corners stay floats.
+
+        Args:
+            batch (pyarrow.RecordBatch): The typed columns of extracted tweets
+
+        Returns:
+            List[Dict]: The documents of the batch
+        """
+        columns = {}
+        for name, column in zip(batch.schema.names, batch.columns):
+            if name == "id":
+                column = column.cast(pyarrow.string())
+            elif name == "time":
+                column = pyarrow.compute.strftime(column, format="%Y-%m-%dT%H:%M:%SZ")
+            columns[name] = column
+        return pyarrow.RecordBatch.from_pydict(columns).to_pylist()
+
+
+    def upload_columnar(self, data_path: str, topic_type: str, lang: Optional[str] = "en") -> None:
+        """Uploads parquet or arrow data to the specified kafka topic.
+
+        The shards are read in batches of buffer_size rows, and the language
+        is filtered on the column before any document is built. The size of a
+        document is estimated from the size of the columns of its batch.
+
+        Args:
+            data_path (str): The relative path of parquet/arrow data file or shard directory
+            topic_type (str): The kafka topic
+            lang (Optional[str]): Only upload documents in this language, shards the extractor
+                already kept in this language only (main.py --lang) are not filtered again.
+        """
+        if pyarrow is None:
+            raise Exception("Error: pyarrow is required to upload parquet or arrow files!")
+        shard_paths = self.list_shard_files(data_path, ".parquet") or self.list_shard_files(data_path, ".arrow")
+        lang = self.get_lang_filter(data_path, lang)
+        for shard_path in shard_paths:
+            for batch in self.read_columnar_batches(shard_path, self.buffer_size):
+                if lang is not None:
+                    batch = batch.filter(pyarrow.compute.equal(batch.column("lang"), lang))
+                doc_bytes = batch.nbytes // max(batch.num_rows, 1)
+                for doc in self.batch_to_docs(batch):
+                    self.add_doc(doc, doc_bytes)
+                    if self.buffer_full():
+                        self.flush_buffer(topic_type)
+        # send what is left in the buffer
+        if self.buffer:
+            self.flush_buffer(topic_type)
+        self.wait_all()
+
+
+    def upload_csv(self, data_path: str, topic_type: str,
+                   dtype: Optional[Dict[str, Any]] = None, chunksize: Optional[int] = None) -> None:
+        """Uploads CSV data to the specified kafka topic.
+
+        The table is read in chunks with typed columns, so memory stays flat
+        however large it is, and the records are sent in the same batches as
+        the other formats. The size of a record is estimated from its chunk.
 
         Args:
             data_path (str): The relative path of csv data file
             topic_type (str): The kafka topic
+            dtype (Optional[Dict[str, Any]]): Types of the columns, inferred by pandas by default
+            chunksize (Optional[int]): Number of rows read at a time, buffer_size by default
+        """
+        with pd.read_csv(data_path, dtype=dtype, chunksize=chunksize or self.buffer_size) as reader:
+            for chunk in reader:
+                doc_bytes = int(chunk.memory_usage(index=False, deep=True).sum()) // max(len(chunk), 1)
+                for doc in chunk.to_dict(orient='records'):
+                    self.add_doc(doc, doc_bytes)
+                    if self.buffer_full():
+                        self.flush_buffer(topic_type)
+        # send what is left in the buffer
+        if self.buffer:
+            self.flush_buffer(topic_type)
+        self.wait_all()
+
+
+    def add_doc(self, doc: Union[Dict, bytes], size: int) -> None:
+        """Adds a document to the buffer.
+
+        Args:
+            doc (Union[Dict, bytes]): The document, or its raw json
+            size (int): The serialized size of the document, e.g. the length of its jsonl line
         """
-        self.buffer = pd.read_csv(data_path).to_dict(orient='records')
-        self.flush_buffer(topic_type)
+        if not self.buffer:
+            self.buffer_started = time.monotonic()
+        self.buffer.append(doc)
+        self.buffer_bytes += size
 
 
-    def flush_buffer(self, topic_type: str):
+    def buffer_full(self) -> bool:
+        """Checks whether the buffer hits the document count, byte size or latency limit of a batch.
+
+        Returns:
+            bool: True when the buffer should be flushed
+        """
+        if len(self.buffer) >= self.buffer_size:
+            return True
+        if self.batch_bytes is not None and self.buffer_bytes >= self.batch_bytes:
+            return True
+        return (self.max_latency is not None and bool(self.buffer)
+                and time.monotonic() - self.buffer_started >= self.max_latency)
+
+
+    def send_batch(self, topic_type: str, docs: List[Union[Dict, bytes]]) -> None:
+        """Sends one batch of documents to the specified topic, runs in a pool thread.
+
+        Raw json documents are spliced into the payload without decoding them.
+
+        Args:
+            topic_type (str): The kafka topic
+            docs (List[Union[Dict, bytes]]): The documents of the batch, or their raw json
+        """
+        fragments = [doc if isinstance(doc, bytes) else dumps(doc) for doc in docs]
+        payload = b'{"index_name":' + dumps(self.index_name) + b',"docs":[' + b','.join(fragments) + b']}'
+        response = self.session.post(url=f'http://localhost:9090/enqueue/{topic_type}',
+                                     headers={'Content-Type': 'application/json'},
+                                     data=payload,
+                                     timeout=60,
+                                     )
+        response.raise_for_status()
+
+
+    def flush_buffer(self, topic_type: str, position: Any = None):
         """Flushes the buffer by sending data to the specified topic.
 
+        The batch is handed to the thread pool, this only blocks while
+        max_in_flight batches are already being sent.
+
         Args:
             topic_type (str): The kafka topic
+            position (Any): Position in the input right after the batch, recorded once the batch is acknowledged
         """
-        requests.post(url=f'http://localhost:9090/enqueue/{topic_type}',
-                      headers={'Content-Type': 'application/json'},
-                      data=json.dumps({"index_name":self.index_name, "docs":self.buffer}, default=str),
-                      timeout=60,
-                      )
-        self.buffer.clear()
+        docs, self.buffer = self.buffer, []
+        self.buffer_bytes = 0
+        if self.process_docs is not None:
+            self.bulk_index(docs, position)
+            return
+        while len(self.in_flight) >= self.max_in_flight:
+            self.complete_oldest()
+        self.in_flight.append((self.executor.submit(self.send_batch, topic_type, docs), len(docs), position))
+
+
+    def bulk_index(self, docs: List[Dict], position: Any = None) -> None:
+        """Processes one batch locally and writes it to the index with parallel bulk requests.
+
+        Args:
+            docs (List[Dict]): The documents of the batch
+            position (Any): Position in the input right after the batch
+        """
+        if self.es_client is None:
+            raise Exception("Error: create_index must be called before uploading in bulk mode!")
+        actions = self.process_docs(docs, self.index_name)
+        for ok, info in helpers.parallel_bulk(self.es_client, actions,
+                                              thread_count=self.thread_count,
+                                              chunk_size=self.chunk_size):
+            if not ok:
+                raise Exception(f"Error: bulk indexing failed: {info}")
+        self.acknowledge(len(actions), position)
+
+
+    def complete_oldest(self) -> None:
+        """Waits for the oldest batch in flight and accounts for it.
+
+        Batches are accounted in the order they were flushed, so everything
+        before the acknowledged position has been sent, whatever order the
+        requests finish in. A failed batch raises here.
+        """
+        future, size, position = self.in_flight.popleft()
+        future.result()
+        self.acknowledge(size, position)
+
+
+    def acknowledge(self, size: int, position: Any = None) -> None:
+        """Accounts for a batch that has been sent, and saves its position when checkpointing.
+
+        Args:
+            size (int): Number of documents of the batch
+            position (Any): Position in the input right after the batch
+        """
+        self.sent_batches += 1
+        self.sent_docs += size
+        if position is not None:
+            self.acknowledged = position
+            if self.checkpoint_path is not None:
+                self.save_checkpoint()
+
+
+    def wait_all(self) -> None:
+        """Waits until every batch in flight has been sent.
+        """
+        while self.in_flight:
+            self.complete_oldest()
+        print(f"{self.sent_docs} docs sent in {self.sent_batches} batches.")
+
+
+    def close(self) -> None:
+        """Sends what is in flight, then releases the threads and connections.
+        The summary is only reported again when batches were still in flight.
+        """
+        if self.in_flight:
+            self.wait_all()
+        self.executor.shutdown()
+        self.session.close()
+
+
+def upload_range(settings: Dict[str, Any],
+                 jsonl_path: str,
+                 start: int,
+                 end: int,
+                 topic_type: str,
+                 lang: Optional[str],
+                 checkpoint_path: str,
+                 resume: bool) -> Dict[str, Any]:
+    """Uploads one byte range of a jsonl file in a pool worker.
+
+    Args:
+        settings (Dict[str, Any]): Settings of the uploader
+        jsonl_path (str): The relative path of jsonl data file
+        start (int): Byte offset where the range starts
+        end (int): Byte offset where the range ends
+        topic_type (str): The kafka topic
+        lang (Optional[str]): Only upload documents in this language
+        checkpoint_path (str): The checkpoint path of the range
+        resume (bool): Continue from the checkpoint of the range, otherwise start over
+
+    Returns:
+        Dict[str, Any]: Report of the range, with the error message when it failed
+    """
+    uploader = Uploader(**settings)
+    report = {"path": jsonl_path, "start": start, "end": end, "error": None}
+    try:
+        if uploader.process_docs is not None:
+            uploader.es_client = uploader.get_es_client()
+        position = uploader.load_checkpoint(checkpoint_path, topic_type, lang, start=start, end=end) if resume else None
+        offset = position[1] if position is not None else start
+        uploader.checkpoint_path = checkpoint_path
+        uploader.read_lines(jsonl_path, offset, end, topic_type, lang)
+        if uploader.buffer:
+            uploader.flush_buffer(topic_type)
+        uploader.wait_all()
+        # the checkpoint of a finished range is kept until every range has finished
+        uploader.acknowledged = (jsonl_path, end)
+        uploader.save_checkpoint()
+    except Exception as e:
+        report["error"] = str(e)
+    uploader.executor.shutdown()
+    uploader.session.close()
+    report["sent_batches"] = uploader.sent_batches
+    report["sent_docs"] = uploader.sent_docs
+    report["acknowledged"] = uploader.acknowledged[1] if uploader.acknowledged else start
+    return report
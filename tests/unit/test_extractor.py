@@ -0,0 +1,169 @@
+"""
+Script Name: test_extractor.py
+Description: Unit tests of the record alignment, compressed reading, topic tagging and dedupe of the twitter extractor.
+Usage:
+    python3 -m unittest discover tests/unit
+"""
+
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "database", "twitter-download", "code")
+sys.path.insert(0, CODE_DIR)
+# the extractor and the uploader both have a config module
+sys.modules.pop("config", None)
+
+import topic_tagger
+import compressed_reader
+from tweet_process import find_record_start, split_segments
+from compressed_reader import SeekableCompressedReader, compress_file
+from topic_tagger import TopicTagger
+from dedupe import key_records, find_duplicates, split_duplicates
+
+
+def make_records(count):
+    """Builds the lines of a twitter file, of different lengths.
+
+    Args:
+        count (int): The number of records
+
+    Returns:
+        bytes: The content of the file
+    """
+    return b"".join(json.dumps({"id": str(i), "text": "x" * (i % 37)}).encode() + b",\n" for i in range(count))
+
+
+class TestRecordAlignment(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data = make_records(500)
+        self.filepath = os.path.join(self.tmp_dir, "twitter.json")
+        with open(self.filepath, "wb") as file:
+            file.write(self.data)
+        self.starts = [0] + [i + 1 for i, byte in enumerate(self.data) if byte == ord("\n")]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_find_record_start(self):
+        with open(self.filepath, "rb") as file:
+            self.assertEqual(find_record_start(file, 0), 0)
+            for start in self.starts[1:-1]:
+                # a record start is kept, any position inside a record moves to the next one
+                self.assertEqual(find_record_start(file, start), start)
+                self.assertEqual(find_record_start(file, start - 1), start)
+                self.assertEqual(find_record_start(file, start + 1), self.starts[self.starts.index(start) + 1])
+            self.assertEqual(find_record_start(file, len(self.data)), len(self.data))
+
+    def test_split_segments(self):
+        for segment_size in [1, 100, 1000, 4096, len(self.data), 2 * len(self.data)]:
+            segments = split_segments(self.filepath, len(self.data), segment_size)
+            # the segments cover the file, without gap or overlap, and start on records
+            self.assertEqual(segments[0][0], 0)
+            self.assertEqual(segments[-1][1], len(self.data))
+            for (_, end), (start, _) in zip(segments, segments[1:]):
+                self.assertEqual(end, start)
+            for start, end in segments:
+                self.assertLess(start, end)
+                self.assertIn(start, self.starts)
+
+    def test_split_compressed_segments(self):
+        compressed_path = compress_file(self.filepath, "gzip", 1000)
+        self.assertEqual(split_segments(compressed_path, len(self.data), 3000),
+                         split_segments(self.filepath, len(self.data), 3000))
+
+
+class TestSeekableCompressedReader(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data = make_records(2000)
+        self.filepath = os.path.join(self.tmp_dir, "twitter.json")
+        with open(self.filepath, "wb") as file:
+            file.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def check_reader(self, compressed_path):
+        lines = self.data.splitlines(keepends=True)
+        # windows smaller than a line make every line cross a window boundary
+        for window_size in [7, 1000, 2**24]:
+            with patch.object(compressed_reader, "WINDOW_SIZE", window_size), \
+                    patch.object(compressed_reader, "COMPRESSED_CHUNK_SIZE", 64), \
+                    SeekableCompressedReader(compressed_path) as reader:
+                self.assertEqual(reader.size, len(self.data))
+                read_lines = []
+                while reader.tell() < reader.size:
+                    read_lines.append(reader.readline())
+                self.assertEqual(read_lines, lines)
+                for pos in range(0, len(self.data), 997):
+                    reader.seek(pos)
+                    self.assertEqual(reader.readline(), self.data[pos:self.data.index(b"\n", pos) + 1])
+                    reader.seek(pos)
+                    self.assertEqual(reader.read(3000), self.data[pos:pos + 3000])
+
+    def test_gzip_blocks(self):
+        self.check_reader(compress_file(self.filepath, "gzip", 5000))
+
+    def test_gzip_single_member(self):
+        compressed_path = f"{self.filepath}.gz"
+        with open(compressed_path, "wb") as file:
+            file.write(compressed_reader.gzip.compress(self.data))
+        compressed_reader.save_gzip_index(compressed_path, compressed_reader.build_gzip_index(compressed_path))
+        self.check_reader(compressed_path)
+
+    @unittest.skipIf(compressed_reader.zstandard is None, "zstandard is not installed")
+    def test_zstd_frames(self):
+        self.check_reader(compress_file(self.filepath, "zstd", 5000))
+
+
+class TestTopicTagger(unittest.TestCase):
+    def check_tagger(self, make_tagger):
+        tagger = make_tagger(None)
+        self.assertEqual(tagger.tag("AI's future"), ["AI"])
+        self.assertEqual(tagger.tag("he said nothing"), [])
+        self.assertEqual(tagger.tag("OPTUS, telstra and 5G!"), ["Telstra", "Optus", "5G"])
+        self.assertEqual(tagger.tag("Tesla_Model EVs"), [])
+        # overlapping keywords are found as whole words only
+        tagger = make_tagger(["he", "she", "hers"])
+        self.assertEqual(tagger.tag("ushers"), [])
+        self.assertEqual(tagger.tag("She said hers"), ["she", "hers"])
+        self.assertEqual(tagger.tag("he, she"), ["he", "she"])
+
+    def test_python_backend(self):
+        with patch.object(topic_tagger, "ahocorasick", None):
+            self.check_tagger(TopicTagger)
+
+    @unittest.skipIf(topic_tagger.ahocorasick is None, "pyahocorasick is not installed")
+    def test_ahocorasick_backend(self):
+        self.check_tagger(TopicTagger)
+
+
+class TestDedupe(unittest.TestCase):
+    def test_find_duplicates(self):
+        # segment 1 comes before segment 2, whatever the order of the arrays,
+        # so the first record of an id is the lowest position of the lowest segment
+        ids, keys = key_records([2, 1], [np.array([5, 3, 5, 8], dtype=np.int64),
+                                         np.array([3, 7, 5, 7], dtype=np.int64)])
+        duplicates = split_duplicates(find_duplicates(ids, keys))
+        self.assertEqual(sorted(duplicates), [1, 2])
+        self.assertEqual(sorted(duplicates[1].tolist()), [3])
+        self.assertEqual(sorted(duplicates[2].tolist()), [0, 1, 2])
+
+    def test_no_duplicates(self):
+        ids, keys = key_records([0], [np.array([1, 2, 3], dtype=np.int64)])
+        self.assertEqual(find_duplicates(ids, keys).tolist(), [])
+        ids, keys = key_records([], [])
+        self.assertEqual(find_duplicates(ids, keys).tolist(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+"""
+Script Name: test_uploader.py
+Description: Unit tests of the byte ranges and the language sniffing of the uploader.
+Usage:
+    python3 -m unittest discover tests/unit
+"""
+
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+UPLOADER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "database", "uploader")
+sys.path.insert(0, UPLOADER_DIR)
+# the extractor and the uploader both have a config module
+sys.modules.pop("config", None)
+
+from uploader import Uploader
+
+
+class TestGetRanges(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.paths = []
+        for name, count in [("part-00000.jsonl", 300), ("part-00001.jsonl", 40), ("part-00002.jsonl", 0)]:
+            path = os.path.join(self.tmp_dir, name)
+            with open(path, "wb") as file:
+                file.write(b"".join(json.dumps({"id": str(i), "text": "y" * (i % 53)}).encode() + b"\n"
+                                    for i in range(count)))
+            self.paths.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_ranges_cover_the_lines(self):
+        for parts in [1, 2, 3, 7, 100, 10000]:
+            ranges = Uploader.get_ranges(self.paths, parts)
+            for path in self.paths:
+                with open(path, "rb") as file:
+                    data = file.read()
+                file_ranges = [(start, end) for range_path, start, end in ranges if range_path == path]
+                if not data:
+                    self.assertEqual(file_ranges, [])
+                    continue
+                # the ranges of a file follow each other, and every range holds whole lines
+                self.assertEqual(file_ranges[0][0], 0)
+                self.assertEqual(file_ranges[-1][1], len(data))
+                for (_, end), (start, _) in zip(file_ranges, file_ranges[1:]):
+                    self.assertEqual(end, start)
+                for start, end in file_ranges:
+                    self.assertLess(start, end)
+                    self.assertTrue(start == 0 or data[start - 1:start] == b"\n")
+                    self.assertEqual(data[end - 1:end], b"\n")
+
+    def test_ranges_follow_the_sizes(self):
+        ranges = Uploader.get_ranges(self.paths, 10)
+        self.assertGreater(len([r for r in ranges if r[0] == self.paths[0]]),
+                           len([r for r in ranges if r[0] == self.paths[1]]))
+
+
+class TestSniffLang(unittest.TestCase):
+    def test_lang_field(self):
+        self.assertEqual(Uploader.sniff_lang(b'{"id": "1", "text": "hi", "lang": "en"}\n'), "en")
+        self.assertEqual(Uploader.sniff_lang(b'{"id":"1","lang":"fr","text":"salut"}'), "fr")
+
+    def test_lang_in_text(self):
+        # the lang field of the document is found when the text looks like one
+        line = json.dumps({"text": 'say "lang": "de" please', "lang": "en"}).encode()
+        self.assertEqual(Uploader.sniff_lang(line), "en")
+        line = json.dumps({"text": 'x "lang":"de"', "lang": "en"}, separators=(",", ":")).encode()
+        self.assertEqual(Uploader.sniff_lang(line), "en")
+
+    def test_escaped_lang(self):
+        self.assertEqual(Uploader.sniff_lang(b'{"lang": "e\\u006e"}'), "en")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+Script Name: test_validators.py
+Description: Unit tests of the document validators generated from the index schemas.
+Usage:
+    python3 -m unittest discover tests/unit
+"""
+
+
+import os
+import re
+import sys
+import unittest
+
+SCHEMA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "database", "schema")
+sys.path.insert(0, SCHEMA_DIR)
+
+from generate_validators import generate_validator
+
+
+def load_validator(schema_file):
+    """Generates the validator of a schema and runs its code, as the processors do.
+
+    Args:
+        schema_file (str): The schema file name in the schema directory
+
+    Returns:
+        Callable: The validate_source function
+    """
+    namespace = {"re": re}
+    exec("from typing import Any, Callable, Dict, List, Optional\n" + generate_validator(schema_file), namespace)
+    return namespace["validate_source"]
+
+
+class TestTwitterValidator(unittest.TestCase):
+    def setUp(self):
+        self.validate_source = load_validator("twitter_schema.json")
+
+    def test_valid_source(self):
+        source = {
+            "content": "hello",
+            "created_at": "2021-06-26T23:59:45.000Z",
+            "location": {"bbox": "BBOX (144.5, 145.5, -37.5, -38.5)"},
+            "sentiment": {"neg": 0.0, "neu": 1, "pos": "0.5", "compound": 0.1},
+            "sentence_info": {"words": "12", "characters": 40.0},
+        }
+        dropped = []
+        self.assertIsNone(self.validate_source(source, dropped))
+        self.assertEqual(dropped, [])
+        # values Elasticsearch would coerce are repaired
+        self.assertEqual(source["sentiment"]["pos"], 0.5)
+        self.assertEqual(source["sentence_info"]["words"], 12)
+        self.assertEqual(source["sentence_info"]["characters"], 40)
+
+    def test_dropped_fields(self):
+        source = {"content": "hello", "lang": "en", "sentiment": {"neg": 0.0, "mood": "happy"}}
+        dropped = []
+        self.assertIsNone(self.validate_source(source, dropped))
+        self.assertEqual(sorted(dropped), ["lang", "sentiment.mood"])
+        self.assertEqual(source, {"content": "hello", "sentiment": {"neg": 0.0}})
+
+    def test_date_format(self):
+        for created_at in ["2021-06-26", "2021-06-26T23:59", "2021-06-26T23:59:45+10:00"]:
+            self.assertIsNone(self.validate_source({"created_at": created_at}, []), created_at)
+        for created_at in ["2021-6-26", "26/06/2021", "2021-06-26 23:59:45", "2021-13-01", 1624751985000, True]:
+            self.assertIsNotNone(self.validate_source({"created_at": created_at}, []), created_at)
+
+    def test_rejected_values(self):
+        self.assertIsNotNone(self.validate_source({"sentiment": {"neg": "negative"}}, []))
+        self.assertIsNotNone(self.validate_source({"sentiment": {"neg": float("nan")}}, []))
+        self.assertIsNotNone(self.validate_source({"sentiment": 0.5}, []))
+        self.assertIsNotNone(self.validate_source({"sentence_info": {"words": "twelve"}}, []))
+
+
+class TestMastodonValidator(unittest.TestCase):
+    def test_date_format(self):
+        validate_source = load_validator("mastodon_schema.json")
+        for created_at in ["2024-05-01 10:00:00+00:00", "2024-05-01 10:00:00Z", 1714557600000, "1714557600000"]:
+            self.assertIsNone(validate_source({"created_at": created_at}, []), created_at)
+        for created_at in ["2024-05-01T10:00:00Z", "2024-05-01 10:00:00", "2024-05-01"]:
+            self.assertIsNotNone(validate_source({"created_at": created_at}, []), created_at)
+
+
+if __name__ == "__main__":
+    unittest.main()